@@ -0,0 +1,194 @@
+"""
+In-process account repository with LRU eviction and optional write-back.
+
+The repository keeps recently used UserActions objects in memory so repeated
+lookups (logins, transfer recipients, admin operations) skip the disk. With
+``write_back`` enabled, cached accounts run with autosave turned off: their
+changes are coalesced in memory and written by flush(), when
+``flush_interval`` seconds have passed since the last flush, on eviction, and
+at interpreter exit. A ``flush_many`` callable, when given, receives all dirty
+accounts at once so the storage backend can commit them together.
+
+Given ``locks`` (an AccountLocks), a write-back repository also keeps each
+account locked from its first change until it is flushed (see hold()), so
+other processes cannot change it in between. Such a repository must be used
+and flushed from a single thread.
+
+A cached account can lag behind changes other processes made to it, so what
+it shows may be stale. Writes go through UserActions.refresh() under the
+account lock: the stored snapshot is re-read and only the account's own
+unsaved changes (balance change, transactions, fields it set) are re-applied
+on top, both before each change and when a write-back flush saves it.
+"""
+
+import atexit
+import collections
+import threading
+import time
+
+
+class AccountRepository:
+    def __init__(
+        self,
+        loader,
+        capacity=1024,
+        write_back=False,
+        flush_interval=None,
+        flush_many=None,
+        locks=None,
+        max_held=512,
+    ):
+        self.loader = loader
+        self.flush_many = flush_many
+        self.locks = locks if write_back else None
+        # Flushes early rather than hold more locks (open files) than this.
+        self.max_held = max_held
+        self._held = set()
+        self.capacity = capacity
+        self.write_back = write_back
+        self.flush_interval = flush_interval
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._accounts = collections.OrderedDict()
+        self._lock = threading.RLock()
+        self._last_flush = time.monotonic()
+        if write_back:
+            atexit.register(self.flush)
+
+    def get(self, account_number):
+        """
+        Return the cached account, loading it on a miss. Raises
+        FileNotFoundError when the account does not exist.
+        """
+        with self._lock:
+            account = self._accounts.get(account_number)
+            if account is not None:
+                self.hits += 1
+                self._accounts.move_to_end(account_number)
+        if account is None:
+            # Loaded without the lock, so a miss does not hold up other threads.
+            loaded = self.loader(account_number)
+            with self._lock:
+                self.misses += 1
+                account = self._accounts.get(account_number)
+                if account is None:
+                    account = loaded
+                    self._insert(account)
+                else:
+                    # Another thread loaded it first; keep that copy.
+                    self._accounts.move_to_end(account_number)
+        self._maybe_flush()
+        return account
+
+    def put(self, account):
+        with self._lock:
+            self._accounts.pop(account.account_number, None)
+            self._insert(account)
+        self._maybe_flush()
+
+    def discard(self, account_number):
+        with self._lock:
+            account = self._accounts.pop(account_number, None)
+            if account is not None:
+                self._detach(account)
+
+    def hold(self, *accounts):
+        """
+        Lock write-back accounts about to change until the next flush, and
+        refresh each one as it is first locked. Returns False when this
+        repository does not hold locks.
+
+        A lock that is not free is only waited for after a flush has
+        released every held lock, so holders never wait on each other.
+        """
+        if self.locks is None:
+            return False
+        with self._lock:
+            wanted = sorted({account.account_number for account in accounts})
+            new = [n for n in wanted if n not in self._held]
+            if not new:
+                return True
+            if len(self._held) + len(new) > self.max_held:
+                self.flush()
+                new = wanted
+            for account_number in new:
+                if not self.locks.hold(account_number, blocking=False):
+                    break
+                self._held.add(account_number)
+            else:
+                self._refresh(accounts, new)
+                return True
+            self.flush()
+            for account_number in wanted:
+                self.locks.hold(account_number)
+                self._held.add(account_number)
+            self._refresh(accounts, wanted)
+            return True
+
+    @staticmethod
+    def _refresh(accounts, account_numbers):
+        for account in accounts:
+            if account.account_number in account_numbers:
+                account.refresh()
+
+    def _release(self, account_number):
+        if account_number in self._held:
+            self._held.discard(account_number)
+            self.locks.release(account_number)
+
+    def flush(self):
+        with self._lock:
+            dirty = [account for account in self._accounts.values() if account.dirty]
+            try:
+                if self.flush_many is not None and dirty:
+                    self.flush_many(dirty)
+                else:
+                    for account in dirty:
+                        account.flush()
+            finally:
+                for account_number in list(self._held):
+                    self._release(account_number)
+            self._last_flush = time.monotonic()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": len(self._accounts),
+                "capacity": self.capacity,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "dirty": sum(1 for a in self._accounts.values() if a.dirty),
+            }
+
+    def __contains__(self, account_number):
+        return account_number in self._accounts
+
+    def __len__(self):
+        return len(self._accounts)
+
+    def _insert(self, account):
+        if self.write_back:
+            account.autosave = False
+            account.repository = self
+        self._accounts[account.account_number] = account
+        while len(self._accounts) > self.capacity:
+            _, evicted = self._accounts.popitem(last=False)
+            if evicted.dirty:
+                evicted.flush()
+            self._detach(evicted)
+            self.evictions += 1
+
+    def _detach(self, account):
+        # Callers may still hold the object; make it write-through again.
+        account.autosave = True
+        account.repository = None
+        if self.locks is not None:
+            self._release(account.account_number)
+
+    def _maybe_flush(self):
+        if not self.write_back or self.flush_interval is None:
+            return
+        if time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
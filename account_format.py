@@ -0,0 +1,226 @@
+"""
+On-disk format for account files.
+
+An account is stored as two files:
+
+- ``account_<number>.txt``: a small header of ``key: value`` lines that starts
+  with ``format_version``.
+- ``journal_<number>.txt``: the transaction journal, one JSON object per line.
+
+Both live in the account's shard directory (see paths.py). Files written
+before format version 2 kept the whole history inside the header as a Python
+repr on a ``transaction_history`` line. Those are still readable (through
+``ast.literal_eval``, never ``eval``) and can be converted in place with
+``python account_format.py migrate``.
+"""
+
+import ast
+import json
+import os
+import sys
+
+from paths import resolver
+
+FORMAT_VERSION = 2
+HEADER_FIELDS = [
+    "owner_id",
+    "name",
+    "age",
+    "salary",
+    "account_number",
+    "pin",
+    "balance",
+    "transaction_limit",
+    "daily_limit",
+    "hourly_limit",
+    "velocity",
+    "transaction_count",
+    "last_transaction",
+    "last_month_end",
+    "journal_offset",
+    "wal_lsn",
+]
+NUMERIC_FIELDS = [
+    "age",
+    "salary",
+    "balance",
+    "transaction_limit",
+    "daily_limit",
+    "hourly_limit",
+    "transaction_count",
+    "journal_offset",
+    "wal_lsn",
+]
+# Text fields that may hold no value.
+NULLABLE_FIELDS = ["velocity", "last_transaction", "last_month_end"]
+# How each transaction type moves the balance, for replaying journal records.
+BALANCE_EFFECTS = {
+    "Deposit": 1,
+    "Withdrawal": -1,
+    "Transfer": -1,
+    "Transfer Received": 1,
+    "Interest": 1,
+    "Fee": -1,
+}
+
+
+def header_filename(account_number):
+    return resolver.account_file(account_number)
+
+
+def journal_filename(account_number):
+    return resolver.journal_file(account_number)
+
+
+def parse_number(value):
+    if value == "None":
+        return None
+    return float(value) if "." in value or "e" in value else int(value)
+
+
+def format_header(account_details):
+    lines = [f"format_version: {FORMAT_VERSION}\n"]
+    for k, val in account_details.items():
+        lines.append(f"{k}: {val}\n")
+    return "".join(lines)
+
+
+def encode_transaction(value):
+    """json ``default`` hook for in-memory Transaction records."""
+    return value.to_dict()
+
+
+def format_record(transaction):
+    return (
+        json.dumps(transaction, separators=(",", ":"), default=encode_transaction)
+        + "\n"
+    )
+
+
+def write_header(account_number, account_details):
+    # Write to a temporary file first so a crash never leaves a torn header.
+    filename = header_filename(account_number)
+    with open(f"{filename}.tmp", "w") as f:
+        f.write(format_header(account_details))
+    os.replace(f"{filename}.tmp", filename)
+
+
+def parse_header_lines(lines):
+    account_data = {"format_version": 1}
+    for line in lines:
+        line = line.rstrip("\n")
+        if not line:
+            continue
+        key, value = line.split(": ", 1)
+        value = value.strip()
+        if key == "transaction_history":
+            account_data[key] = ast.literal_eval(value)
+        elif key == "format_version":
+            account_data[key] = int(value)
+            if account_data[key] > FORMAT_VERSION:
+                raise ValueError(
+                    f"Unsupported account format version {account_data[key]}."
+                )
+        elif key in NUMERIC_FIELDS:
+            account_data[key] = parse_number(value)
+        elif key in NULLABLE_FIELDS and value == "None":
+            account_data[key] = None
+        else:
+            account_data[key] = value
+    return account_data
+
+
+def read_header(account_number):
+    with open(header_filename(account_number), "r") as f:
+        return parse_header_lines(f)
+
+
+def parse_journal(data):
+    if not data.strip():
+        return []
+    lines = data.splitlines()
+    try:
+        return json.loads("[" + ",".join(line for line in lines if line) + "]")
+    except ValueError:
+        # A crash can leave a partial last line; keep every complete record.
+        transactions = []
+        for line in lines:
+            try:
+                transactions.append(json.loads(line))
+            except ValueError:
+                continue
+        return transactions
+
+
+def read_journal(account_number):
+    try:
+        with open(journal_filename(account_number), "r") as f:
+            return parse_journal(f.read())
+    except FileNotFoundError:
+        return None
+
+
+def read_journal_tail(account_number, offset):
+    """Return the complete journal records written after byte ``offset``."""
+    try:
+        with open(journal_filename(account_number), "rb") as f:
+            f.seek(offset)
+            data = f.read()
+    except FileNotFoundError:
+        return []
+    if not data:
+        return []
+    return parse_journal(data[: data.rfind(b"\n") + 1].decode())
+
+
+def load_account(account_number):
+    """
+    Return the header fields plus ``transaction_history`` for an account.
+    Raises FileNotFoundError when the account does not exist.
+    """
+    account_data = read_header(account_number)
+    transactions = read_journal(account_number)
+    if transactions is not None:
+        account_data["transaction_history"] = transactions
+    else:
+        account_data.setdefault("transaction_history", [])
+    return account_data
+
+
+def migrate_account(account_number):
+    account_data = read_header(account_number)
+    if account_data["format_version"] >= FORMAT_VERSION:
+        return False
+    transactions = read_journal(account_number)
+    if transactions is None:
+        transactions = account_data.get("transaction_history", [])
+        temp_filename = f"{journal_filename(account_number)}.tmp"
+        with open(temp_filename, "w") as f:
+            for transaction in transactions:
+                f.write(format_record(transaction))
+        os.replace(temp_filename, journal_filename(account_number))
+    write_header(
+        account_number, {k: account_data[k] for k in HEADER_FIELDS if k in account_data}
+    )
+    return True
+
+
+def migrate_all():
+    migrated = 0
+    failed = 0
+    for account_number in resolver.iter_account_numbers():
+        try:
+            if migrate_account(account_number):
+                migrated += 1
+        except Exception as e:
+            failed += 1
+            print(f"Could not migrate account {account_number}: {e}")
+    print(f"Migrated {migrated} account file(s), {failed} failure(s).")
+    return migrated, failed
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] != "migrate":
+        print("Usage: python account_format.py migrate")
+        sys.exit(1)
+    migrate_all()
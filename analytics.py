@@ -0,0 +1,470 @@
+"""
+Columnar export of every account's history, and vectorized admin reports.
+
+refresh() copies transactions into one flat file per column under
+``<data root>/analytics/``, appending only what was saved since the last
+refresh: an account is read only when its snapshot's transaction count has
+moved past the rows already exported for it. Each transaction is one row:
+
+- ``account.bin`` (int32): the account's id, its position in ``meta.json``'s
+  ``accounts`` list;
+- ``timestamp.bin`` (int64): the date as in transaction.py, in seconds;
+- ``type.bin`` (uint8): an index into ``meta.json``'s ``types`` list;
+- ``cents.bin`` (int64): the amount in cents;
+- ``counterparty.bin`` (int32): the account id of a transfer's recipient (or a
+  received transfer's sender), -1 otherwise.
+
+Balances and salaries are rewritten on every refresh as ``.npy`` files indexed
+by account id. ``meta.json`` is replaced last and records how many rows are
+complete, so a refresh that died half way is cut back on the next one.
+Accounts that were deleted, or whose history got shorter (rewritten), have
+their rows dropped and, if they still exist, exported again.
+
+Reports memory-map the columns and aggregate them with NumPy: volumes per day
+and per type, top senders and receivers, the balance distribution and
+balance-to-salary ratios. NumPy is only needed here (``pip install numpy``).
+
+Usage: python analytics.py refresh [--rebuild]
+       python analytics.py daily [--from DATE] [--to DATE]
+       python analytics.py types
+       python analytics.py top [--receivers] [--limit N]
+       python analytics.py balances
+       python analytics.py salary [--limit N]
+"""
+
+import argparse
+import contextlib
+import functools
+import json
+import os
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not on POSIX
+    fcntl = None
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from paths import resolver
+from statements import _bound
+from storage import get_storage
+from transaction import format_date, to_cents, to_timestamp
+
+COLUMNS = {
+    "account": "int32",
+    "timestamp": "int64",
+    "type": "uint8",
+    "cents": "int64",
+    "counterparty": "int32",
+}
+# Rows buffered in memory before they are appended to the column files.
+CHUNK_ROWS = 2**20
+DAY = 86400
+PERCENTILES = [0, 25, 50, 75, 90, 99, 100]
+BALANCE_EDGES = [float("-inf"), 0, 100, 1000, 10000, 100000, 1000000, float("inf")]
+
+
+def analytics_dir():
+    return resolver.analytics_dir()
+
+
+def _require_numpy():
+    if np is None:
+        raise RuntimeError("Analytics need NumPy; install it with 'pip install numpy'.")
+
+
+@functools.lru_cache(maxsize=4096)
+def _day_start(day):
+    return to_timestamp(f"{day} 00:00:00")
+
+
+def _timestamp(date):
+    # Same result as to_timestamp(), parsing each day once.
+    return (
+        _day_start(date[:10])
+        + int(date[11:13]) * 3600
+        + int(date[14:16]) * 60
+        + int(date[17:19])
+    )
+
+
+class Snapshot:
+    """The exported columns (memory-mapped) and account tables."""
+
+    def __init__(self, directory, meta):
+        self.types = meta["types"]
+        self.accounts = np.array(meta["accounts"], dtype=str)
+        self.rows = meta["rows"]
+        for name, dtype in COLUMNS.items():
+            if self.rows:
+                column = np.memmap(
+                    os.path.join(directory, f"{name}.bin"),
+                    dtype=dtype,
+                    mode="r",
+                    shape=(self.rows,),
+                )
+            else:
+                column = np.empty(0, dtype=dtype)
+            setattr(self, name, column)
+        size = len(self.accounts)
+        self.balance_cents = np.zeros(size, dtype="int64")
+        self.salary = np.full(size, np.nan)
+        self.exists = np.zeros(size, dtype=bool)
+        for name in ["balance_cents", "salary", "exists"]:
+            path = os.path.join(directory, f"{name}.npy")
+            if os.path.exists(path):
+                table = np.load(path, mmap_mode="r")
+                getattr(self, name)[: len(table)] = table
+
+    def type_code(self, name):
+        return self.types.index(name) if name in self.types else None
+
+
+class ColumnStore:
+    def __init__(self, directory=None):
+        _require_numpy()
+        self._directory = directory
+
+    @property
+    def directory(self):
+        return self._directory or analytics_dir()
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    @contextlib.contextmanager
+    def _locked(self):
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self._path("refresh.lock"), "a") as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            yield
+
+    def read_meta(self):
+        try:
+            with open(self._path("meta.json"), "r") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {"rows": 0, "types": [], "accounts": [], "exported": []}
+
+    def _write_meta(self, meta):
+        with open(self._path("meta.json.tmp"), "w") as f:
+            json.dump(meta, f)
+        os.replace(self._path("meta.json.tmp"), self._path("meta.json"))
+
+    def snapshot(self):
+        return Snapshot(self.directory, self.read_meta())
+
+    def _truncate(self, rows):
+        """Cut every column back to ``rows`` complete rows."""
+        for name, dtype in COLUMNS.items():
+            with open(self._path(f"{name}.bin"), "ab") as f:
+                f.truncate(rows * np.dtype(dtype).itemsize)
+
+    def _drop(self, meta, ids):
+        """Rewrite the columns without the rows of accounts in ``ids``."""
+        rows = meta["rows"]
+        account = np.fromfile(self._path("account.bin"), dtype="int32", count=rows)
+        keep = ~np.isin(account, np.fromiter(ids, dtype="int32"))
+        for name, dtype in COLUMNS.items():
+            path = self._path(f"{name}.bin")
+            column = np.fromfile(path, dtype=dtype, count=rows)
+            column[keep].tofile(f"{path}.tmp")
+            os.replace(f"{path}.tmp", path)
+        meta["rows"] = int(keep.sum())
+        for i in ids:
+            meta["exported"][i] = 0
+
+    def _append(self, buffers):
+        for name, dtype in COLUMNS.items():
+            with open(self._path(f"{name}.bin"), "ab") as f:
+                np.array(buffers[name], dtype=dtype).tofile(f)
+            buffers[name].clear()
+
+    def refresh(self, rebuild=False):
+        """Export transactions saved since the last refresh; returns the rows added."""
+        storage = get_storage()
+        with self._locked():
+            meta = self.read_meta()
+            if rebuild:
+                meta = {"rows": 0, "types": [], "accounts": [], "exported": []}
+            self._truncate(meta["rows"])
+            ids = {number: i for i, number in enumerate(meta["accounts"])}
+            types = {name: i for i, name in enumerate(meta["types"])}
+
+            def account_id(account_number):
+                if account_number not in ids:
+                    ids[account_number] = len(meta["accounts"])
+                    meta["accounts"].append(account_number)
+                    meta["exported"].append(0)
+                return ids[account_number]
+
+            tables = {}
+            behind = []
+            stale = set()
+            for account_number in storage.list_account_numbers():
+                try:
+                    details = storage.load_account(account_number)
+                except FileNotFoundError:
+                    continue
+                i = account_id(account_number)
+                tables[i] = (to_cents(details["balance"]), details.get("salary") or 0)
+                count = details.get("transaction_count")
+                if count is None:
+                    # Saved before snapshots carried a summary.
+                    count = len(storage.history(account_number))
+                if count < meta["exported"][i]:
+                    stale.add(i)
+                if count != meta["exported"][i]:
+                    behind.append((account_number, i))
+            # Deleted since the last refresh.
+            stale.update(
+                i
+                for i, exported in enumerate(meta["exported"])
+                if exported and i not in tables
+            )
+            if stale:
+                self._drop(meta, stale)
+
+            buffers = {name: [] for name in COLUMNS}
+            added = 0
+            for account_number, i in behind:
+                history = storage.history(account_number)
+                exported = meta["exported"][i]
+                records = history[exported:] if exported else history
+                for record in records:
+                    kind = record["type"]
+                    if kind not in types:
+                        types[kind] = len(meta["types"])
+                        meta["types"].append(kind)
+                    counterparty = record.get("recipient") or record.get("sender")
+                    buffers["account"].append(i)
+                    buffers["timestamp"].append(_timestamp(record["date"]))
+                    buffers["type"].append(types[kind])
+                    buffers["cents"].append(to_cents(record["amount"]))
+                    buffers["counterparty"].append(
+                        account_id(counterparty) if counterparty else -1
+                    )
+                    exported += 1
+                added += exported - meta["exported"][i]
+                meta["exported"][i] = exported
+                if len(buffers["account"]) >= CHUNK_ROWS:
+                    self._append(buffers)
+            self._append(buffers)
+            meta["rows"] += added
+
+            size = len(meta["accounts"])
+            balance_cents = np.zeros(size, dtype="int64")
+            salary = np.full(size, np.nan)
+            exists = np.zeros(size, dtype=bool)
+            for i, (cents, amount) in tables.items():
+                balance_cents[i] = cents
+                salary[i] = amount
+                exists[i] = True
+            np.save(self._path("balance_cents.npy"), balance_cents)
+            np.save(self._path("salary.npy"), salary)
+            np.save(self._path("exists.npy"), exists)
+            self._write_meta(meta)
+        return added
+
+
+def _range_mask(snapshot, start=None, end=None):
+    mask = np.ones(snapshot.rows, dtype=bool)
+    start, end = _bound(start, False), _bound(end, True)
+    if start is not None:
+        mask &= snapshot.timestamp >= to_timestamp(start)
+    if end is not None:
+        mask &= snapshot.timestamp <= to_timestamp(end)
+    return mask
+
+
+def daily_volume(snapshot, start=None, end=None):
+    """(day, type, count, amount) for every day and type with transactions."""
+    mask = _range_mask(snapshot, start, end)
+    if not mask.any():
+        return []
+    days = snapshot.timestamp[mask] // DAY
+    first = int(days.min())
+    width = len(snapshot.types)
+    keys = (days - first) * width + snapshot.type[mask]
+    counts = np.bincount(keys)
+    amounts = np.bincount(keys, weights=snapshot.cents[mask])
+    return [
+        (
+            format_date((first + int(key) // width) * DAY)[:10],
+            snapshot.types[int(key) % width],
+            int(counts[key]),
+            amounts[key] / 100,
+        )
+        for key in np.flatnonzero(counts)
+    ]
+
+
+def type_volume(snapshot, start=None, end=None):
+    """(type, count, amount) per transaction type."""
+    mask = _range_mask(snapshot, start, end)
+    width = len(snapshot.types)
+    codes = snapshot.type[mask]
+    counts = np.bincount(codes, minlength=width)
+    amounts = np.bincount(codes, weights=snapshot.cents[mask], minlength=width)
+    return [
+        (name, int(counts[code]), amounts[code] / 100)
+        for code, name in enumerate(snapshot.types)
+        if counts[code]
+    ]
+
+
+def top_accounts(snapshot, limit=10, receivers=False):
+    """
+    (account number, transfers, amount) for the accounts that sent (or, with
+    ``receivers``, received) the most money through transfers.
+    """
+    code = snapshot.type_code("Transfer")
+    if code is None:
+        return []
+    transfers = snapshot.type == code
+    if receivers:
+        # The sender's side names the recipient, also for transfers made
+        # before recipients got a Transfer Received entry of their own.
+        keys = snapshot.counterparty[transfers]
+        cents = snapshot.cents[transfers][keys >= 0]
+        keys = keys[keys >= 0]
+    else:
+        keys = snapshot.account[transfers]
+        cents = snapshot.cents[transfers]
+    size = len(snapshot.accounts)
+    totals = np.bincount(keys, weights=cents, minlength=size)
+    counts = np.bincount(keys, minlength=size)
+    limit = min(limit, np.count_nonzero(counts))
+    if limit <= 0:
+        return []
+    top = np.argpartition(-totals, limit - 1)[:limit]
+    top = top[np.argsort(-totals[top], kind="stable")]
+    return [(str(snapshot.accounts[i]), int(counts[i]), totals[i] / 100) for i in top]
+
+
+def balance_distribution(snapshot, edges=BALANCE_EDGES):
+    balances = snapshot.balance_cents[snapshot.exists] / 100
+    if not len(balances):
+        return None
+    histogram, _ = np.histogram(balances, bins=edges)
+    return {
+        "accounts": len(balances),
+        "total": float(balances.sum()),
+        "mean": float(balances.mean()),
+        "percentiles": dict(
+            zip(PERCENTILES, np.percentile(balances, PERCENTILES).tolist())
+        ),
+        "histogram": list(zip(edges, edges[1:], histogram.tolist())),
+    }
+
+
+def salary_ratios(snapshot, limit=10):
+    """
+    Balance-to-salary ratios of the accounts with a positive salary: their
+    percentiles, and the accounts with the highest and lowest ratio.
+    """
+    eligible = np.flatnonzero(snapshot.exists & (snapshot.salary > 0))
+    if not len(eligible):
+        return None
+    ratios = snapshot.balance_cents[eligible] / 100 / snapshot.salary[eligible]
+    order = np.argsort(ratios, kind="stable")
+
+    def rows(indexes):
+        return [
+            (
+                str(snapshot.accounts[eligible[k]]),
+                snapshot.balance_cents[eligible[k]] / 100,
+                float(snapshot.salary[eligible[k]]),
+                float(ratios[k]),
+            )
+            for k in indexes
+        ]
+
+    return {
+        "accounts": len(eligible),
+        "without_salary": int(np.count_nonzero(snapshot.exists)) - len(eligible),
+        "percentiles": dict(
+            zip(PERCENTILES, np.percentile(ratios, PERCENTILES).tolist())
+        ),
+        "highest": rows(order[::-1][:limit]),
+        "lowest": rows(order[:limit]),
+    }
+
+
+def _print_percentiles(percentiles, unit=""):
+    print("  ".join(f"p{p}: {unit}{value:,.2f}" for p, value in percentiles.items()))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Reports over every transaction.")
+    parser.add_argument(
+        "--no-refresh", action="store_true", help="report on the last export"
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    refresh = subparsers.add_parser("refresh", help="Export new transactions.")
+    refresh.add_argument("--rebuild", action="store_true", help="export everything")
+    for name in ["daily", "types"]:
+        report = subparsers.add_parser(name, help=f"Volumes per {name[:-1]}.")
+        report.add_argument("--from", dest="start", help="YYYY-MM-DD[ HH:MM:SS]")
+        report.add_argument("--to", dest="end", help="YYYY-MM-DD[ HH:MM:SS]")
+    top = subparsers.add_parser("top", help="Top senders or receivers.")
+    top.add_argument("--receivers", action="store_true")
+    top.add_argument("--limit", type=int, default=10)
+    subparsers.add_parser("balances", help="Balance distribution.")
+    salary = subparsers.add_parser("salary", help="Balance-to-salary ratios.")
+    salary.add_argument("--limit", type=int, default=10)
+    args = parser.parse_args()
+
+    store = ColumnStore()
+    if args.command == "refresh":
+        print(f"Exported {store.refresh(args.rebuild)} transaction(s).")
+    else:
+        if not args.no_refresh:
+            store.refresh()
+        snapshot = store.snapshot()
+        if args.command == "daily":
+            for day, kind, count, amount in daily_volume(
+                snapshot, args.start, args.end
+            ):
+                print(f"{day}\t{kind}\t{count}\t${amount:,.2f}")
+        elif args.command == "types":
+            for kind, count, amount in type_volume(snapshot, args.start, args.end):
+                print(f"{kind}\t{count}\t${amount:,.2f}")
+        elif args.command == "top":
+            for account_number, count, amount in top_accounts(
+                snapshot, args.limit, args.receivers
+            ):
+                print(f"{account_number}\t{count}\t${amount:,.2f}")
+        elif args.command == "balances":
+            report = balance_distribution(snapshot)
+            if report is None:
+                print("No accounts.")
+            else:
+                print(
+                    f"{report['accounts']} accounts, total ${report['total']:,.2f}, "
+                    f"mean ${report['mean']:,.2f}"
+                )
+                _print_percentiles(report["percentiles"], "$")
+                for low, high, count in report["histogram"]:
+                    print(f"  [{low:,.0f}, {high:,.0f})\t{count}")
+        else:
+            report = salary_ratios(snapshot, args.limit)
+            if report is None:
+                print("No accounts with a salary.")
+            else:
+                print(
+                    f"{report['accounts']} accounts "
+                    f"({report['without_salary']} without a salary)"
+                )
+                _print_percentiles(report["percentiles"])
+                for title in ["highest", "lowest"]:
+                    print(f"{title.capitalize()}:")
+                    for account_number, balance, amount, ratio in report[title]:
+                        print(
+                            f"  {account_number}\t${balance:,.2f} / ${amount:,.2f}"
+                            f"\t{ratio:,.2f}"
+                        )
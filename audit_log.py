@@ -0,0 +1,448 @@
+"""
+Background audit logger shared by UserActions.log_action and
+AdminActions.log_action.
+
+Callers only enqueue an entry; a writer thread groups queued lines by target
+file, keeps recently used files open in a bounded handle cache and writes a
+batch when enough lines are queued or the flush interval passes. Pending
+entries are drained at interpreter exit.
+
+Log files are rotated when they would grow past ``BANK_LOG_MAX_BYTES``
+(default 16 MiB, 0 disables) or, with ``BANK_LOG_ROTATE=daily``, when the day
+changes. A rotated file is gzip-compressed into the log's archive directory
+(``log_<number>.archive/``, ``admin_log.archive/``) as ``<n>.log.gz``, and a
+line is added to the directory's ``index.tsv``: first and last timestamp, line
+count, the action types in the segment and the segment name. Searches use the
+index to skip segments outside the time window or without the wanted actions.
+Processes sharing a log rotate it under a lock on its archive directory, and
+a rotation waits for writes in progress (each holds a shared lock on the log),
+so every line is archived once. Lines that cannot be written stay queued and
+are retried with the next batch.
+
+Usage: python audit_log.py query [--account N ...] [--admin]
+       [--action ACTION ...] [--from DATE] [--to DATE]
+"""
+
+import argparse
+import atexit
+import collections
+import contextlib
+import gzip
+import os
+import queue
+import sys
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not on POSIX
+    fcntl = None
+
+INDEX = "index.tsv"
+LOCK = "rotate.lock"
+
+_STOP = object()
+
+
+class AuditLogger:
+    def __init__(
+        self,
+        flush_lines=1000,
+        flush_interval=0.5,
+        max_open_files=64,
+        max_bytes=0,
+        rotate_daily=False,
+    ):
+        self.flush_lines = flush_lines
+        self.flush_interval = flush_interval
+        self.max_open_files = max_open_files
+        self.max_bytes = max_bytes
+        self.rotate_daily = rotate_daily
+        self._handles = collections.OrderedDict()
+        self._days = {}
+        self._lock = threading.Lock()
+        self._queue = None
+        self._thread = None
+        self._pid = None
+        self._last_second = None
+        self._last_stamp = None
+
+    def _ensure_started(self):
+        # Also restarts the writer in a forked child, which inherits no threads.
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._handles = collections.OrderedDict()
+            self._queue = queue.Queue()
+            self._pid = os.getpid()
+            self._thread = threading.Thread(
+                target=self._run, name="audit-log-writer", daemon=True
+            )
+            self._thread.start()
+
+    def log(self, filename, action, details):
+        self._ensure_started()
+        self._queue.put((filename, time.time(), action, details))
+
+    def flush(self):
+        """Block until every entry queued so far has been written."""
+        if self._thread is None or self._pid != os.getpid():
+            return
+        done = threading.Event()
+        self._queue.put(done)
+        done.wait()
+
+    def close(self):
+        if self._thread is None or self._pid != os.getpid():
+            return
+        self._queue.put(_STOP)
+        self._thread.join()
+        self._thread = None
+
+    def _timestamp(self, created):
+        second = int(created)
+        if second != self._last_second:
+            self._last_second = second
+            self._last_stamp = time.strftime(
+                "%Y-%m-%d %H:%M:%S", time.localtime(second)
+            )
+        return self._last_stamp
+
+    def _handle(self, filename):
+        f = self._handles.get(filename)
+        if f is not None and self._rotated_elsewhere(filename, f):
+            del self._handles[filename]
+            self._days.pop(filename, None)
+            f.close()
+            f = None
+        if f is not None:
+            self._handles.move_to_end(filename)
+            return f
+        if len(self._handles) >= self.max_open_files:
+            _, oldest = self._handles.popitem(last=False)
+            oldest.close()
+        f = open(filename, "a")
+        self._handles[filename] = f
+        return f
+
+    def _rotated_elsewhere(self, filename, f):
+        # Another process may have rotated the file out from under this handle.
+        if not (self.max_bytes or self.rotate_daily):
+            return False
+        try:
+            return os.stat(filename).st_ino != os.fstat(f.fileno()).st_ino
+        except FileNotFoundError:
+            return True
+
+    def _needs_rotation(self, filename, f, lines):
+        size = f.tell()
+        if not size:
+            return False
+        if self.max_bytes and size + sum(len(line) for line in lines) > self.max_bytes:
+            return True
+        if self.rotate_daily:
+            if filename not in self._days:
+                with open(filename, "r") as first:
+                    self._days[filename] = first.read(10)
+            return lines[0][:10] != self._days[filename]
+        return False
+
+    def _rotate(self, filename, f):
+        inode = os.fstat(f.fileno()).st_ino
+        self._drop(filename)
+        try:
+            rotate(filename, inode)
+        except OSError as e:
+            # The batch still goes to the live file; the next one retries.
+            print(f"Could not rotate audit log {filename}: {e}")
+
+    @contextlib.contextmanager
+    def _shared(self, f):
+        # Held while writing so a rotation elsewhere waits for the write, and
+        # a write after the rotation sees the file moved.
+        if fcntl is None or not (self.max_bytes or self.rotate_daily):
+            yield
+            return
+        fcntl.flock(f, fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _write_lines(self, filename, lines):
+        rotated = False
+        while True:
+            f = self._handle(filename)
+            with self._shared(f):
+                if self._rotated_elsewhere(filename, f):
+                    continue
+                if rotated or not self._needs_rotation(filename, f, lines):
+                    f.write("".join(lines))
+                    f.flush()
+                    return
+            self._rotate(filename, f)
+            rotated = True
+
+    def _drop(self, filename):
+        f = self._handles.pop(filename, None)
+        self._days.pop(filename, None)
+        if f is not None:
+            with contextlib.suppress(OSError):
+                f.close()
+
+    def _write(self, pending):
+        """Write the pending lines; those that failed stay pending."""
+        for filename in list(pending):
+            lines = pending[filename]
+            try:
+                self._write_lines(filename, lines)
+            except OSError as e:
+                print(f"Could not write audit log {filename}, will retry: {e}")
+                self._drop(filename)
+                continue
+            del pending[filename]
+
+    def _close_handles(self):
+        for f in self._handles.values():
+            f.close()
+        self._handles.clear()
+
+    def _run(self):
+        pending = collections.defaultdict(list)
+        count = 0
+        deadline = None
+        while True:
+            timeout = None
+            if deadline is not None:
+                timeout = max(deadline - time.monotonic(), 0)
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+
+            if item is _STOP:
+                self._write(pending)
+                self._close_handles()
+                for filename, lines in pending.items():
+                    print(f"Lost {len(lines)} audit line(s) for {filename}.")
+                return
+            if isinstance(item, threading.Event):
+                self._write(pending)
+                count, deadline = 0, self._retry_deadline(pending)
+                item.set()
+                continue
+            if item is not None:
+                filename, created, action, details = item
+                pending[filename].append(
+                    f"{self._timestamp(created)} - {action}: {details}\n"
+                )
+                count += 1
+                if deadline is None:
+                    deadline = time.monotonic() + self.flush_interval
+            if count >= self.flush_lines or (
+                deadline is not None and time.monotonic() >= deadline
+            ):
+                self._write(pending)
+                count, deadline = 0, self._retry_deadline(pending)
+
+    def _retry_deadline(self, pending):
+        if pending:
+            return time.monotonic() + self.flush_interval
+        return None
+
+
+def archive_dir(filename):
+    return f"{os.path.splitext(filename)[0]}.archive"
+
+
+def read_index(directory):
+    """Return (first, last, count, actions, name) per archived segment."""
+    segments = []
+    try:
+        with open(os.path.join(directory, INDEX), "r") as f:
+            for line in f:
+                first, last, count, actions, name = line.rstrip("\n").split("\t")
+                segments.append(
+                    (first, last, int(count), set(actions.split("|")) - {""}, name)
+                )
+    except FileNotFoundError:
+        pass
+    return segments
+
+
+def parse_line(line):
+    """Split an audit line into (timestamp, action)."""
+    stamp, _, rest = line.partition(" - ")
+    return stamp, rest.split(": ", 1)[0]
+
+
+def _archive(directory, raw):
+    """Compress a rotated file into its segment and index it."""
+    name = os.path.basename(raw)
+    if name + ".gz" in [segment[-1] for segment in read_index(directory)]:
+        os.remove(raw)
+        return
+    first = last = None
+    count = 0
+    actions = set()
+    with open(raw, "rb") as source, gzip.open(f"{raw}.gz.tmp", "wb") as target:
+        for line in source:
+            stamp, action = parse_line(line.decode(errors="replace"))
+            first = first or stamp
+            last = stamp
+            count += 1
+            actions.add(action)
+            target.write(line)
+    os.replace(f"{raw}.gz.tmp", f"{raw}.gz")
+    with open(os.path.join(directory, INDEX), "a") as f:
+        f.write(f"{first}\t{last}\t{count}\t{'|'.join(sorted(actions))}\t{name}.gz\n")
+    os.remove(raw)
+
+
+@contextlib.contextmanager
+def _locked(directory):
+    # Rotations of the same log by other processes wait for this one.
+    with open(os.path.join(directory, LOCK), "a") as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        yield
+
+
+def rotate(filename, inode=None):
+    """
+    Move a log file into its archive directory as a new compressed segment.
+    With ``inode``, nothing is done (and None returned) unless the log is
+    still that file, i.e. another process has not rotated it already.
+    """
+    directory = archive_dir(filename)
+    os.makedirs(directory, exist_ok=True)
+    with _locked(directory):
+        names = os.listdir(directory)
+        # Finish rotations a crash interrupted before starting a new one.
+        for name in sorted(n for n in names if n.endswith(".log")):
+            _archive(directory, os.path.join(directory, name))
+        numbers = [
+            int(n.split(".")[0]) for n in names if n.endswith((".log", ".log.gz"))
+        ]
+        raw = os.path.join(directory, f"{max(numbers, default=0) + 1:06d}.log")
+        try:
+            live = open(filename, "rb")
+        except FileNotFoundError:
+            return None
+        with live:
+            if fcntl is not None:
+                # Waits for writes in progress; later ones see the file moved.
+                fcntl.flock(live, fcntl.LOCK_EX)
+            if inode is not None and os.fstat(live.fileno()).st_ino != inode:
+                return None
+            os.replace(filename, raw)
+        _archive(directory, raw)
+        return raw
+
+
+def _bound(value, end_of_day):
+    if value and len(value) == 10:
+        return f"{value} 23:59:59" if end_of_day else f"{value} 00:00:00"
+    return value or None
+
+
+def search(filename, actions=None, start=None, end=None, stats=None):
+    """
+    Yield the lines of a log (archived segments, then the live file) within
+    ``start``..``end`` whose action is in ``actions``. Segments the index
+    rules out are not opened; ``stats`` counts segments read and skipped.
+    """
+    start = _bound(start, False)
+    end = _bound(end, True)
+    actions = set(actions) if actions else None
+    stats = stats if stats is not None else {}
+    directory = archive_dir(filename)
+    sources = []
+    for first, last, _, segment_actions, name in read_index(directory):
+        if (
+            (start is not None and last < start)
+            or (end is not None and first > end)
+            or (actions is not None and not actions & segment_actions)
+        ):
+            stats["skipped"] = stats.get("skipped", 0) + 1
+            continue
+        sources.append(os.path.join(directory, name))
+    if os.path.isdir(directory):
+        # Left behind by an interrupted rotation, so not indexed yet.
+        sources += sorted(
+            os.path.join(directory, n)
+            for n in os.listdir(directory)
+            if n.endswith(".log")
+        )
+    sources.append(filename)
+    for source in sources:
+        opener = gzip.open if source.endswith(".gz") else open
+        try:
+            f = opener(source, "rt")
+        except FileNotFoundError:
+            continue
+        if source != filename:
+            stats["read"] = stats.get("read", 0) + 1
+        with f:
+            for line in f:
+                stamp, action = parse_line(line)
+                if start is not None and stamp < start:
+                    continue
+                if end is not None and stamp > end:
+                    continue
+                if actions is not None and action not in actions:
+                    continue
+                yield line.rstrip("\n")
+
+
+def iter_log_files(account_numbers=(), admin=False):
+    """The logs to search: the given accounts and/or the admin log, else all."""
+    from paths import resolver
+
+    if account_numbers or admin:
+        for account_number in account_numbers:
+            yield resolver.log_file(account_number)
+        if admin:
+            yield resolver.admin_log_file()
+        return
+    yield resolver.admin_log_file()
+    for directory, dirnames, filenames in os.walk(resolver.path("logs")):
+        archives = [d for d in dirnames if d.endswith(".archive")]
+        dirnames[:] = sorted(set(dirnames) - set(archives))
+        names = {n for n in filenames if n.startswith("log_") and n.endswith(".txt")}
+        # Include logs that were rotated away and not written to since.
+        names.update(f"{d[: -len('.archive')]}.txt" for d in archives)
+        for name in sorted(names):
+            yield os.path.join(directory, name)
+
+
+audit_logger = AuditLogger(
+    max_bytes=int(os.environ.get("BANK_LOG_MAX_BYTES", 16 * 1024 * 1024)),
+    rotate_daily=os.environ.get("BANK_LOG_ROTATE") == "daily",
+)
+atexit.register(audit_logger.close)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Search the audit logs.")
+    parser.add_argument("command", choices=["query"])
+    parser.add_argument("--account", dest="accounts", action="append", default=[])
+    parser.add_argument("--admin", action="store_true", help="search admin_log.txt")
+    parser.add_argument("--action", dest="actions", action="append")
+    parser.add_argument("--from", dest="start", help="YYYY-MM-DD[ HH:MM:SS]")
+    parser.add_argument("--to", dest="end", help="YYYY-MM-DD[ HH:MM:SS]")
+    args = parser.parse_args()
+    stats = {}
+    matches = 0
+    for filename in iter_log_files(args.accounts, args.admin):
+        for line in search(filename, args.actions, args.start, args.end, stats):
+            print(line)
+            matches += 1
+    print(
+        f"{matches} line(s); read {stats.get('read', 0)} archived segment(s), "
+        f"skipped {stats.get('skipped', 0)}.",
+        file=sys.stderr,
+    )
@@ -0,0 +1,171 @@
+"""
+Headless batch mode: apply a file of deposits, withdrawals and transfers.
+
+The operations file is CSV (header: account_number,operation,amount,recipient)
+or JSON lines with the same keys; ``operation`` is one of deposit, withdraw or
+transfer. Rows are applied in file order through the normal UserActions
+methods. Every account touched by a batch is loaded once and flushed once when
+the batch ends (accounts stay cached in a bounded write-back
+AccountRepository across batches), and a per-row report is written as CSV.
+Accounts stay locked from their first change until they are flushed, so other
+processes wait rather than having their changes overwritten; transfers are
+committed atomically when they run.
+
+Usage: python batch.py OPERATIONS_FILE [--report REPORT_FILE] [--batch-size N]
+"""
+
+import argparse
+import contextlib
+import csv
+import io
+import json
+import time
+
+from account_cache import AccountRepository
+from project import UserActions, transfer_engine
+
+REPORT_FIELDS = [
+    "row",
+    "account_number",
+    "operation",
+    "amount",
+    "recipient",
+    "status",
+    "message",
+]
+
+
+def read_operations(filename):
+    with open(filename, "r", newline="") as f:
+        if filename.endswith((".jsonl", ".json")):
+            for row_number, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    yield row_number, json.loads(line)
+                except ValueError as e:
+                    yield row_number, {"error": f"Malformed JSON: {e}"}
+        else:
+            for row_number, row in enumerate(csv.DictReader(f), 1):
+                yield row_number, row
+
+
+class BatchProcessor:
+    def __init__(self, batch_size=10000, cache_size=100000):
+        self.batch_size = batch_size
+        self.accounts = AccountRepository(
+            UserActions.load,
+            capacity=cache_size,
+            write_back=True,
+            flush_many=UserActions.flush_many,
+            locks=transfer_engine.locks,
+        )
+        self.missing = set()
+        self.output = io.StringIO()
+        self.succeeded = 0
+        self.failed = 0
+
+    def get_account(self, account_number):
+        if account_number in self.missing:
+            print(f"Account with number {account_number} does not exist.")
+            return None
+        try:
+            return self.accounts.get(account_number)
+        except FileNotFoundError:
+            self.missing.add(account_number)
+            print(f"Account with number {account_number} does not exist.")
+        except Exception as e:
+            self.missing.add(account_number)
+            print(f"Error loading account data: {e}")
+        return None
+
+    def apply(self, row):
+        if "error" in row:
+            raise ValueError(row["error"])
+        operation = str(row.get("operation", "")).strip().lower()
+        account_number = str(row.get("account_number", "")).strip()
+        amount = float(row.get("amount"))
+        account = self.get_account(account_number)
+        if account is None:
+            return False
+        if operation == "deposit":
+            return account.deposit_amount(amount)
+        if operation == "withdraw":
+            return account.withdraw(amount)
+        if operation == "transfer":
+            recipient = self.get_account(str(row.get("recipient", "")).strip())
+            if recipient is None:
+                return False
+            return account.transfer_amount(recipient, amount)
+        raise ValueError(f"Unknown operation '{operation}'.")
+
+    def apply_row(self, row):
+        self.output.seek(0)
+        self.output.truncate()
+        try:
+            with contextlib.redirect_stdout(self.output):
+                ok = self.apply(row)
+        except (TypeError, ValueError) as e:
+            ok = False
+            self.output.write(f"Invalid row: {e}\n")
+        lines = self.output.getvalue().strip().splitlines()
+        if ok:
+            self.succeeded += 1
+        else:
+            self.failed += 1
+        return ok, lines[-1] if lines else ""
+
+    def flush(self):
+        self.accounts.flush()
+        self.missing.clear()
+
+    def run(self, operations, report_writer):
+        pending = 0
+        for row_number, row in operations:
+            ok, message = self.apply_row(row)
+            report_writer.writerow(
+                {
+                    "row": row_number,
+                    "account_number": row.get("account_number", ""),
+                    "operation": row.get("operation", ""),
+                    "amount": row.get("amount", ""),
+                    "recipient": row.get("recipient", "") or "",
+                    "status": "ok" if ok else "failed",
+                    "message": message,
+                }
+            )
+            pending += 1
+            if pending >= self.batch_size:
+                self.flush()
+                pending = 0
+        self.flush()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("operations_file")
+    parser.add_argument("--report", help="where to write the per-row CSV report")
+    parser.add_argument("--batch-size", type=int, default=10000)
+    parser.add_argument("--cache-size", type=int, default=100000)
+    args = parser.parse_args(argv)
+
+    transfer_engine.recover()
+    report_file = args.report or f"{args.operations_file}.report.csv"
+    processor = BatchProcessor(batch_size=args.batch_size, cache_size=args.cache_size)
+    start = time.perf_counter()
+    with open(report_file, "w", newline="") as f:
+        report_writer = csv.DictWriter(f, fieldnames=REPORT_FIELDS)
+        report_writer.writeheader()
+        processor.run(read_operations(args.operations_file), report_writer)
+    elapsed = time.perf_counter() - start
+    total = processor.succeeded + processor.failed
+    print(
+        f"Processed {total} operation(s): {processor.succeeded} succeeded, "
+        f"{processor.failed} failed in {elapsed:.2f}s "
+        f"({total / elapsed * 60 if elapsed else 0:.0f} ops/min)."
+    )
+    print(f"Report written to {report_file}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+Compare parsing an account with the pre-version-2 format (history as a Python
+repr parsed with eval) against the header + JSON-lines journal format.
+
+Usage: python benchmarks/bench_account_format.py [sizes...]
+"""
+
+import datetime
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from account_format import (  # noqa: E402
+    format_header,
+    format_record,
+    header_filename,
+    journal_filename,
+    load_account,
+)
+
+DEFAULT_SIZES = [10_000, 100_000, 1_000_000]
+
+
+def make_history(count):
+    start = datetime.datetime(2020, 1, 1)
+    history = []
+    for i in range(count):
+        history.append(
+            {
+                "date": (start + datetime.timedelta(minutes=i)).strftime(
+                    "%Y-%m-%d %H:%M:%S"
+                ),
+                "type": "Transfer" if i % 3 == 0 else "Deposit",
+                "amount": float(i % 500) + 0.25,
+                "recipient": "1002" if i % 3 == 0 else None,
+            }
+        )
+    return history
+
+
+def profile(account_number):
+    return {
+        "owner_id": "bench",
+        "name": "bench",
+        "age": 30,
+        "salary": 1000.0,
+        "account_number": account_number,
+        "pin": "4321",
+        "balance": 0,
+    }
+
+
+def write_legacy(account_number, history):
+    with open(header_filename(account_number), "w") as f:
+        for k, val in profile(account_number).items():
+            f.write(f"{k}: {val}\n")
+        f.write(f"transaction_history: {history}\n")
+
+
+def write_current(account_number, history):
+    with open(header_filename(account_number), "w") as f:
+        f.write(format_header(profile(account_number)))
+    with open(journal_filename(account_number), "w") as f:
+        for transaction in history:
+            f.write(format_record(transaction))
+
+
+def parse_legacy(account_number):
+    # The parser used by read_from_file before format version 2.
+    account_data = {}
+    with open(header_filename(account_number), "r") as f:
+        for line in f:
+            key, value = line.strip().split(": ", 1)
+            if key == "transaction_history":
+                account_data[key] = eval(value)
+            elif key in ["age", "balance"]:
+                account_data[key] = float(value) if "." in value else int(value)
+            else:
+                account_data[key] = value
+    return account_data
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+
+def main(sizes):
+    print(f"{'transactions':>12} {'eval (s)':>10} {'v2 (s)':>10} {'speedup':>8}")
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        for size in sizes:
+            history = make_history(size)
+            write_legacy("legacy", history)
+            legacy_time, legacy = timed(parse_legacy, "legacy")
+            write_current("current", history)
+            current_time, current = timed(load_account, "current")
+            assert legacy["transaction_history"] == current["transaction_history"]
+            print(
+                f"{size:>12} {legacy_time:>10.3f} {current_time:>10.3f} "
+                f"{legacy_time / current_time:>7.1f}x"
+            )
+
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or DEFAULT_SIZES)
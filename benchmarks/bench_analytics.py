@@ -0,0 +1,133 @@
+"""
+Speed of the columnar analytics (analytics.py). Writes a synthetic export of
+``--rows`` transactions over ``--accounts`` accounts straight into the column
+files, then times each report over it, and a plain loop over dicts for the
+per-type volumes on the first million rows, for comparison. Also times the
+export itself (refresh()) of one account with ``--export`` transactions.
+
+Usage: python benchmarks/bench_analytics.py [--rows N] [--accounts N]
+       [--export N]
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_transaction_memory import write_account
+
+TYPES = ["Deposit", "Withdrawal", "Transfer", "Transfer Received"]
+
+
+def write_synthetic(store, rows, accounts, seed=1):
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    os.makedirs(store.directory, exist_ok=True)
+    columns = {
+        "account": rng.integers(0, accounts, rows, dtype="int32"),
+        "timestamp": np.sort(
+            rng.integers(1_600_000_000, 1_700_000_000, rows, dtype="int64")
+        ),
+        "type": rng.integers(0, len(TYPES), rows, dtype="uint8"),
+        "cents": rng.integers(100, 1_000_000, rows, dtype="int64"),
+    }
+    columns["counterparty"] = np.where(
+        columns["type"] >= 2, rng.integers(0, accounts, rows, dtype="int32"), -1
+    ).astype("int32")
+    for name, column in columns.items():
+        column.tofile(os.path.join(store.directory, f"{name}.bin"))
+    np.save(
+        os.path.join(store.directory, "balance_cents.npy"),
+        rng.integers(0, 10_000_000, accounts, dtype="int64"),
+    )
+    np.save(
+        os.path.join(store.directory, "salary.npy"),
+        rng.integers(0, 200_000, accounts).astype(float),
+    )
+    np.save(os.path.join(store.directory, "exists.npy"), np.ones(accounts, bool))
+    meta = {
+        "rows": rows,
+        "types": TYPES,
+        "accounts": [str(100000 + i) for i in range(accounts)],
+        "exported": [0] * accounts,
+    }
+    with open(os.path.join(store.directory, "meta.json"), "w") as f:
+        json.dump(meta, f)
+
+
+def timed(action):
+    begin = time.perf_counter()
+    action()
+    return time.perf_counter() - begin
+
+
+def loop_type_volume(snapshot, rows):
+    counts = {}
+    amounts = {}
+    for record in (
+        {"type": snapshot.types[t], "amount": c / 100}
+        for t, c in zip(snapshot.type[:rows].tolist(), snapshot.cents[:rows].tolist())
+    ):
+        counts[record["type"]] = counts.get(record["type"], 0) + 1
+        amounts[record["type"]] = amounts.get(record["type"], 0) + record["amount"]
+    return counts, amounts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the analytics reports.")
+    parser.add_argument("--rows", type=int, default=20_000_000)
+    parser.add_argument("--accounts", type=int, default=100_000)
+    parser.add_argument("--export", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    import analytics
+    from audit_log import audit_logger
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        try:
+            store = analytics.ColumnStore(os.path.join(directory, "synthetic"))
+            write_synthetic(store, args.rows, args.accounts)
+            snapshot = store.snapshot()
+            print(f"{args.rows} transactions over {args.accounts} accounts")
+            for name, report in [
+                ("daily volume", lambda: analytics.daily_volume(snapshot)),
+                ("type volume", lambda: analytics.type_volume(snapshot)),
+                ("top senders", lambda: analytics.top_accounts(snapshot)),
+                (
+                    "top receivers",
+                    lambda: analytics.top_accounts(snapshot, receivers=True),
+                ),
+                ("balances", lambda: analytics.balance_distribution(snapshot)),
+                ("salary ratios", lambda: analytics.salary_ratios(snapshot)),
+            ]:
+                print(f"{name:<14} {timed(report):>8.2f} s")
+            sample = min(args.rows, 1_000_000)
+            looped = timed(lambda: loop_type_volume(snapshot, sample))
+            print(
+                f"dict loop      {looped:>8.2f} s for {sample} rows "
+                f"(~{looped * args.rows / sample:.3g} s for all)"
+            )
+
+            write_account(args.export)
+            store = analytics.ColumnStore()
+            exported = timed(store.refresh)
+            print(
+                f"export         {exported:>8.2f} s for {args.export} transactions "
+                f"({args.export / exported:,.0f}/s)"
+            )
+            print(f"refresh, no change {timed(store.refresh):>6.3f} s")
+            # Written before the directory goes away.
+            audit_logger.flush()
+        finally:
+            os.chdir(cwd)
+
+
+if __name__ == "__main__":
+    main()
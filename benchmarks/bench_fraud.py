@@ -0,0 +1,84 @@
+"""
+Throughput and memory of the fraud detector pipeline (fraud.py) with every
+rule on, over a synthetic stream of withdrawals and transfers spread across
+many accounts. Alerts are counted instead of freezing anything.
+
+Usage: python benchmarks/bench_fraud.py [--transactions N] [--accounts N]
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def synthetic_stream(count, accounts, seed=1):
+    from transaction import Transaction
+
+    rng = random.Random(seed)
+    start = 1_700_000_000
+    stream = []
+    for i in range(count):
+        account_number = str(100000 + rng.randrange(accounts))
+        if rng.random() < 0.5:
+            transaction = Transaction(
+                start + i // 20, "Withdrawal", rng.randrange(1000, 20000)
+            )
+        else:
+            transaction = Transaction(
+                start + i // 20,
+                "Transfer",
+                rng.randrange(1000, 20000),
+                str(100000 + rng.randrange(accounts)),
+            )
+        stream.append((account_number, transaction))
+    return stream
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the fraud detectors.")
+    parser.add_argument("--transactions", type=int, default=1_000_000)
+    parser.add_argument("--accounts", type=int, default=50_000)
+    args = parser.parse_args()
+
+    from fraud import RULES, DetectorPipeline
+
+    stream = synthetic_stream(args.transactions, args.accounts)
+    alerts = []
+    pipeline = DetectorPipeline(
+        [rule() for rule in RULES.values()],
+        max_accounts=args.accounts,
+        on_alert=lambda number, transaction, reasons: alerts.append(number),
+    )
+    tracemalloc.start()
+    begin = time.perf_counter()
+    for account_number, transaction in stream:
+        pipeline.observe(account_number, transaction)
+    elapsed = time.perf_counter() - begin
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    # tracemalloc slows the loop down; time it again without.
+    pipeline.reset()
+    alerts.clear()
+    begin = time.perf_counter()
+    for account_number, transaction in stream:
+        pipeline.observe(account_number, transaction)
+    untraced = time.perf_counter() - begin
+
+    print(f"{args.transactions} transactions over {args.accounts} accounts")
+    print(f"throughput: {args.transactions / untraced:,.0f} transactions/s")
+    print(f"  (traced:  {args.transactions / elapsed:,.0f} transactions/s)")
+    print(
+        f"profiles: {size / 2**20:.1f} MiB "
+        f"({size / min(args.accounts, len(pipeline._profiles)):.0f} bytes/account)"
+    )
+    print(f"alerts: {len(alerts)} ({len(set(alerts))} accounts)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Latency of logging in (UserActions.load plus the balance) and of a transfer
+into an account, against the length of that account's history. Both read only
+the header snapshot, so they should stay flat; reading the last transaction
+through the memory-mapped history view (history.py) should too. Decoding the
+whole history is shown for contrast.
+
+Usage: python benchmarks/bench_history.py [--sizes 1000,100000,1000000]
+       [--repeat N]
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_transaction_memory import ACCOUNT_NUMBER, write_account
+
+SENDER = "500002"
+
+
+def median_ms(action, repeat):
+    timings = []
+    for _ in range(repeat):
+        begin = time.perf_counter()
+        action()
+        timings.append(time.perf_counter() - begin)
+    return statistics.median(timings) * 1000
+
+
+def create_sender():
+    from project import UserActions
+
+    sender = UserActions()
+    sender.owner_id = "bench"
+    sender.name = "sender"
+    sender.age = 30
+    sender.salary = 1000.0
+    sender.account_number = SENDER
+    sender.pin = "4321"
+    sender.balance = 1_000_000
+    sender.save_to_file(rewrite_journal=True)
+
+
+def measure(count, repeat):
+    from project import UserActions
+    from transfers import TransferEngine
+
+    write_account(count)
+    create_sender()
+    engine = TransferEngine()
+
+    def transfer():
+        engine.transfer(UserActions.load(SENDER), UserActions.load(ACCOUNT_NUMBER), 1)
+
+    def last():
+        return UserActions.load(ACCOUNT_NUMBER).transaction_history[-1]
+
+    def decode_all():
+        for _ in UserActions.load(ACCOUNT_NUMBER).transaction_history:
+            pass
+
+    return (
+        median_ms(lambda: UserActions.load(ACCOUNT_NUMBER).balance, repeat),
+        median_ms(transfer, repeat),
+        median_ms(last, repeat),
+        median_ms(decode_all, 1),
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark history-independent paths.")
+    parser.add_argument("--sizes", default="1000,100000,1000000")
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    print(
+        f"{'history':>9} {'login ms':>9} {'transfer ms':>12} {'last ms':>8} "
+        f"{'decode all ms':>14}"
+    )
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        for count in [int(size) for size in args.sizes.split(",")]:
+            # Each size rewrites the same account.
+            login, transfer, last, decode_all = measure(count, args.repeat)
+            print(
+                f"{count:>9} {login:>9.3f} {transfer:>12.3f} {last:>8.3f} "
+                f"{decode_all:>14.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
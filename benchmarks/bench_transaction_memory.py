@@ -0,0 +1,116 @@
+"""
+Memory held by one account's full in-memory history: the dicts the storage
+backend reads from the journal against the Transaction records its history
+view decodes them into (see transaction.py and history.py). Also reports the drift of a float balance against
+the integer-cent balance after the same deposits.
+
+Usage: python benchmarks/bench_transaction_memory.py [count]
+"""
+
+import datetime
+import gc
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+DEFAULT_COUNT = 1_000_000
+ACCOUNT_NUMBER = "500001"
+
+
+def write_account(count):
+    from account_format import format_record
+    from storage import get_storage
+
+    start = datetime.datetime(2020, 1, 1)
+    details = {
+        "owner_id": "bench",
+        "name": "bench",
+        "age": 30,
+        "salary": 1000.0,
+        "account_number": ACCOUNT_NUMBER,
+        "pin": "4321",
+        "balance": 0,
+        "transaction_count": count,
+    }
+    get_storage().replace_account(details, [])
+    with open(os.path.join(os.getcwd(), "journal.tmp"), "w") as f:
+        for i in range(count):
+            transfer = i % 3 == 0
+            f.write(
+                format_record(
+                    {
+                        "date": (start + datetime.timedelta(seconds=i)).strftime(
+                            "%Y-%m-%d %H:%M:%S"
+                        ),
+                        "type": "Transfer" if transfer else "Deposit",
+                        "amount": (i % 500) + 0.25,
+                        "recipient": "1002" if transfer else None,
+                    }
+                )
+            )
+    from account_format import journal_filename
+
+    os.replace("journal.tmp", journal_filename(ACCOUNT_NUMBER))
+    # Make the snapshot cover the new journal, so loads do not replay it.
+    get_storage().save_account(details)
+
+
+def measure(build):
+    gc.collect()
+    tracemalloc.start()
+    begin = time.perf_counter()
+    result = build()
+    elapsed = time.perf_counter() - begin
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, size, elapsed
+
+
+def balance_drift(count):
+    from transaction import to_cents
+
+    balance = 0.0
+    cents = 0
+    for _ in range(count):
+        balance += 0.1
+        cents += to_cents(0.1)
+    return balance - cents / 100
+
+
+def main(count):
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        from project import UserActions
+        from storage import get_storage
+
+        write_account(count)
+        records, dict_size, dict_time = measure(
+            lambda: get_storage().load_transactions(ACCOUNT_NUMBER)
+        )
+        del records
+        account = UserActions.load(ACCOUNT_NUMBER)
+        history, slot_size, slot_time = measure(
+            lambda: list(account.transaction_history)
+        )
+        assert len(history) == count
+
+    print(f"{count} transactions")
+    print(f"{'representation':<14} {'MiB':>9} {'bytes/txn':>10} {'load (s)':>9}")
+    for name, size, elapsed in [
+        ("dict", dict_size, dict_time),
+        ("Transaction", slot_size, slot_time),
+    ]:
+        print(f"{name:<14} {size / 2**20:>9.1f} {size / count:>10.0f} {elapsed:>9.2f}")
+    print(f"saving: {dict_size / slot_size:.1f}x")
+    print(
+        f"float balance drift after {count} deposits of $0.10: {balance_drift(count):.2e}"
+    )
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_COUNT)
@@ -0,0 +1,112 @@
+"""
+Deposit throughput and latency of the file backend under each durability
+mode (see wal.py), for several numbers of concurrent threads. With ``sync``
+every deposit waits for an fsync; group commit lets concurrent deposits share
+one, so its throughput should grow with the thread count.
+
+Usage: python benchmarks/bench_wal.py [--threads 1,4,16] [--ops N]
+       [--modes off,sync,interval]
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def run(threads, ops):
+    """Runs in a child process with BANK_DURABILITY and the data root set."""
+    from project import UserActions, transfer_engine
+    from storage import get_storage
+
+    account_numbers = [str(900000 + i) for i in range(threads)]
+    for account_number in account_numbers:
+        account = UserActions()
+        account.owner_id = "bench"
+        account.name = account_number
+        account.age = 30
+        account.salary = 1000.0
+        account.account_number = account_number
+        account.pin = "4321"
+        account.balance = 0
+        account.save_to_file()
+
+    latencies = []
+
+    def work(account_number):
+        account = UserActions.load(account_number)
+        for _ in range(ops // threads):
+            begin = time.perf_counter()
+            with transfer_engine.locked(account_number):
+                account.balance += 1
+                account.record_transaction(account.new_transaction("Deposit", 1))
+                account.persist()
+            latencies.append(time.perf_counter() - begin)
+
+    workers = [threading.Thread(target=work, args=(n,)) for n in account_numbers]
+    begin = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - begin
+    storage = get_storage()
+    fsyncs = storage.wal.fsyncs if storage.wal is not None else 0
+    storage.close()
+    latencies.sort()
+    print(
+        f"{len(latencies) / max(fsyncs, 1):.1f} "
+        f"{len(latencies) / elapsed:.0f} "
+        f"{latencies[len(latencies) // 2] * 1000:.3f} "
+        f"{latencies[int(len(latencies) * 0.99)] * 1000:.3f}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark durability modes.")
+    parser.add_argument("--threads", default="1,4,16")
+    parser.add_argument("--ops", type=int, default=4000)
+    parser.add_argument("--modes", default="off,sync,interval")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        run(int(args.threads), args.ops)
+        return
+
+    print(
+        f"{'mode':<9} {'threads':>7} {'ops/s':>8} {'p50 ms':>8} {'p99 ms':>8} "
+        f"{'ops/fsync':>9}"
+    )
+    for mode in args.modes.split(","):
+        for threads in [int(t) for t in args.threads.split(",")]:
+            with tempfile.TemporaryDirectory() as directory:
+                env = dict(os.environ, BANK_DURABILITY=mode, BANK_DATA_ROOT=directory)
+                output = subprocess.run(
+                    [
+                        sys.executable,
+                        os.path.abspath(__file__),
+                        "--child",
+                        "--threads",
+                        str(threads),
+                        "--ops",
+                        str(args.ops),
+                    ],
+                    env=env,
+                    cwd=directory,
+                    capture_output=True,
+                    text=True,
+                    check=True,
+                ).stdout.split()
+            per_fsync, rate, p50, p99 = output[-4:]
+            if mode == "off":
+                per_fsync = "-"
+            print(f"{mode:<9} {threads:>7} {rate:>8} {p50:>8} {p99:>8} {per_fsync:>9}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+"""
+Load generator for server.py.
+
+Opens many concurrent sessions against a running server, each sending a
+weighted mix of user requests over its own connection, and reports requests
+per second, p50/p95/p99 latency and error counts. With ``--spawn`` a server
+is started in a temporary data root and the test accounts are created through
+admin requests first.
+
+Usage:
+    python benchmarks/load_client.py --spawn [--sessions N] [--requests N]
+        [--accounts N] [--mix deposit=40,balance=30,...] [--seed N]
+    python benchmarks/load_client.py --host HOST --port PORT --token TOKEN
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import secrets
+import subprocess
+import sys
+import tempfile
+import time
+
+try:
+    import resource
+except ImportError:  # pragma: no cover - not available on Windows
+    resource = None
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PIN = "1234"
+DEFAULT_MIX = {
+    "deposit": 30,
+    "withdraw": 20,
+    "transfer": 20,
+    "balance": 20,
+    "statement": 10,
+}
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(int(round(fraction * (len(sorted_values) - 1))), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        name, weight = part.split("=")
+        if name not in DEFAULT_MIX:
+            raise ValueError(f"Unknown operation '{name}'.")
+        mix[name] = float(weight)
+    return mix
+
+
+def raise_file_limit(sessions):
+    if resource is None:
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    wanted = sessions + 256
+    if soft != resource.RLIM_INFINITY and soft < wanted:
+        limit = wanted if hard == resource.RLIM_INFINITY else min(wanted, hard)
+        resource.setrlimit(resource.RLIMIT_NOFILE, (limit, hard))
+
+
+class Session:
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.next_id = 0
+
+    async def __aenter__(self):
+        self.reader, self.writer = await asyncio.open_connection(
+            self.host, self.port, limit=1024 * 1024
+        )
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.writer.close()
+
+    async def request(self, **request):
+        self.next_id += 1
+        request["id"] = self.next_id
+        self.writer.write(json.dumps(request).encode() + b"\n")
+        await self.writer.drain()
+        line = await self.reader.readline()
+        if not line:
+            raise ConnectionError("Server closed the connection.")
+        return json.loads(line)
+
+
+def build_request(op, rng, account_numbers):
+    account_number = rng.choice(account_numbers)
+    request = {"op": op, "account_number": account_number, "pin": PIN}
+    if op in ("deposit", "withdraw"):
+        request["amount"] = rng.choice([5, 20, 100])
+    elif op == "transfer":
+        request["recipient"] = rng.choice(account_numbers)
+        request["amount"] = rng.choice([1, 10])
+    elif op == "statement":
+        request["page_size"] = 20
+    return request
+
+
+async def setup_accounts(host, port, token, accounts):
+    account_numbers = [str(200000 + i) for i in range(accounts)]
+    async with Session(host, port) as session:
+        for account_number in account_numbers:
+            await session.request(
+                op="create_account",
+                token=token,
+                owner_id=f"load-{account_number}",
+                name="load",
+                age=30,
+                salary=5000.0,
+                account_number=account_number,
+                pin=PIN,
+            )
+            await session.request(
+                op="deposit", account_number=account_number, pin=PIN, amount=1000
+            )
+    return account_numbers
+
+
+async def run_session(host, port, plan, latencies, errors):
+    try:
+        async with Session(host, port) as session:
+            for op, request in plan:
+                begin = time.perf_counter()
+                response = await session.request(**request)
+                latencies[op].append(time.perf_counter() - begin)
+                if not response.get("ok") and "error" in response:
+                    errors[response["error"]] = errors.get(response["error"], 0) + 1
+    except (ConnectionError, OSError) as e:
+        errors[str(e)] = errors.get(str(e), 0) + 1
+
+
+async def run(host, port, account_numbers, sessions, requests, mix, seed):
+    rng = random.Random(seed)
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    latencies = {name: [] for name in names}
+    errors = {}
+    plans = [
+        [
+            (op, build_request(op, rng, account_numbers))
+            for op in rng.choices(names, weights, k=requests)
+        ]
+        for _ in range(sessions)
+    ]
+    start = time.perf_counter()
+    await asyncio.gather(
+        *(run_session(host, port, plan, latencies, errors) for plan in plans)
+    )
+    return time.perf_counter() - start, latencies, errors
+
+
+def report(elapsed, latencies, errors):
+    total = sum(len(values) for values in latencies.values())
+    print(f"{total} request(s) in {elapsed:.2f}s ({total / elapsed:.0f} req/s)")
+    print(f"{'operation':<12} {'count':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for name, values in latencies.items():
+        values.sort()
+        print(
+            f"{name:<12} {len(values):>7} {percentile(values, 0.50) * 1000:>9.2f} "
+            f"{percentile(values, 0.95) * 1000:>9.2f} "
+            f"{percentile(values, 0.99) * 1000:>9.2f}"
+        )
+    for error, count in sorted(errors.items(), key=lambda item: -item[1]):
+        print(f"error x{count}: {error}")
+
+
+def spawn_server(directory, token, args):
+    env = dict(os.environ, BANK_DATA_ROOT=directory, BANK_ADMIN_TOKEN=token)
+    command = [sys.executable, os.path.join(ROOT, "server.py"), "--port", "0"]
+    command += ["--max-inflight", str(args.max_inflight)]
+    process = subprocess.Popen(
+        command, cwd=directory, env=env, stdout=subprocess.PIPE, text=True
+    )
+    line = process.stdout.readline()
+    if not line.startswith("Listening on"):
+        process.kill()
+        raise RuntimeError("Server did not start.")
+    return process, int(line.rsplit(":", 1)[1])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test server.py.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--token", default=os.environ.get("BANK_ADMIN_TOKEN"))
+    parser.add_argument("--spawn", action="store_true", help="start a test server")
+    parser.add_argument("--max-inflight", type=int, default=256)
+    parser.add_argument("--sessions", type=int, default=1000)
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--accounts", type=int, default=100)
+    parser.add_argument("--mix", type=parse_mix, default=DEFAULT_MIX)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args(argv)
+    raise_file_limit(args.sessions)
+
+    process = None
+    with tempfile.TemporaryDirectory() as directory:
+        try:
+            if args.spawn:
+                args.token = secrets.token_hex(16)
+                process, args.port = spawn_server(directory, args.token, args)
+            if not args.token:
+                parser.error("--token (or BANK_ADMIN_TOKEN) is needed to set up")
+            account_numbers = asyncio.run(
+                setup_accounts(args.host, args.port, args.token, args.accounts)
+            )
+            elapsed, latencies, errors = asyncio.run(
+                run(
+                    args.host,
+                    args.port,
+                    account_numbers,
+                    args.sessions,
+                    args.requests,
+                    args.mix,
+                    args.seed,
+                )
+            )
+        finally:
+            if process is not None:
+                process.terminate()
+                process.wait()
+    report(elapsed, latencies, errors)
+
+
+if __name__ == "__main__":
+    main()
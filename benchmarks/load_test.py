@@ -0,0 +1,282 @@
+"""
+Load test for the account engine.
+
+Builds a synthetic population of accounts in a temporary data root, then
+drives a weighted mix of user and admin operations through UserActions and
+AdminActions (stdin mocked, stdout discarded) and reports ops/sec and
+p50/p95/p99 latency per operation. The storage hot spots save_to_file,
+read_from_file (uncached load) and is_account_frozen are also timed on their
+own. Results can be written as JSON and compared against an earlier run.
+
+Usage:
+    python benchmarks/load_test.py [--accounts N] [--history N] [--ops N]
+        [--mix deposit=30,withdraw=20,...] [--seed N] [--storage file|sqlite]
+        [--output results.json] [--compare baseline.json]
+"""
+
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+DEFAULT_MIX = {
+    "deposit": 30,
+    "withdraw": 20,
+    "transfer": 20,
+    "check_balance": 15,
+    "change_pin": 5,
+    "freeze": 5,
+    "unfreeze": 5,
+}
+MICRO_OPERATIONS = ["save_to_file", "read_from_file", "is_account_frozen"]
+
+
+class NullWriter(io.TextIOBase):
+    def write(self, text):
+        return len(text)
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(int(round(fraction * (len(sorted_values) - 1))), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        name, weight = part.split("=")
+        if name not in DEFAULT_MIX:
+            raise ValueError(f"Unknown operation '{name}'.")
+        mix[name] = float(weight)
+    return mix
+
+
+def build_population(accounts, history):
+    from storage import get_storage
+
+    start = datetime.datetime(2020, 1, 1)
+    account_numbers = [str(100000 + i) for i in range(accounts)]
+    for account_number in account_numbers:
+        transactions = [
+            {
+                "date": (start + datetime.timedelta(minutes=i)).strftime(
+                    "%Y-%m-%d %H:%M:%S"
+                ),
+                "type": "Deposit",
+                "amount": 10.0,
+                "recipient": None,
+            }
+            for i in range(history)
+        ]
+        get_storage().replace_account(
+            {
+                "owner_id": account_number,
+                "name": "load",
+                "age": 30,
+                "salary": 5000.0,
+                "account_number": account_number,
+                "pin": "4321",
+                "balance": 10.0 * history + 1000.0,
+                "transaction_limit": None,
+                "transaction_count": history,
+            },
+            transactions,
+        )
+    return account_numbers
+
+
+class LoadTest:
+    def __init__(self, account_numbers, rng):
+        import project
+
+        self.project = project
+        self.admin = project.AdminActions()
+        self.account_numbers = account_numbers
+        self.rng = rng
+
+    def account(self):
+        return self.project.account_repository.get(
+            self.rng.choice(self.account_numbers)
+        )
+
+    def deposit(self):
+        self.account().deposit_amount(self.rng.choice([5, 20, 100]))
+
+    def withdraw(self):
+        self.account().withdraw(self.rng.choice([5, 20, 100]))
+
+    def transfer(self):
+        sender, recipient = self.rng.sample(self.account_numbers, 2)
+        self.project.account_repository.get(sender).transfer_amount(
+            self.project.account_repository.get(recipient), self.rng.choice([1, 10])
+        )
+
+    def check_balance(self):
+        self.account().check_amount()
+
+    def change_pin(self):
+        with mock.patch("builtins.input", side_effect=["1234", "1234"]):
+            self.account().change_pin()
+
+    def freeze(self):
+        self.admin.freeze_account(self.rng.choice(self.account_numbers))
+
+    def unfreeze(self):
+        self.admin.unfreeze_account(self.rng.choice(self.account_numbers))
+
+    def save_to_file(self):
+        self.account().save_to_file()
+
+    def read_from_file(self):
+        self.project.UserActions.load(self.rng.choice(self.account_numbers))
+
+    def is_account_frozen(self):
+        self.account().is_account_frozen()
+
+
+def timed_run(operation, count):
+    latencies = []
+    start = time.perf_counter()
+    for _ in range(count):
+        begin = time.perf_counter()
+        operation()
+        latencies.append(time.perf_counter() - begin)
+    return time.perf_counter() - start, latencies
+
+
+def summarize(latencies, elapsed):
+    latencies.sort()
+    return {
+        "count": len(latencies),
+        "ops_per_sec": len(latencies) / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+    }
+
+
+def run(accounts, history, ops, mix, seed, micro_ops, storage="file"):
+    from storage import set_storage
+
+    rng = random.Random(seed)
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        try:
+            set_storage(storage)
+            account_numbers = build_population(accounts, history)
+            test = LoadTest(account_numbers, rng)
+            names = list(mix)
+            weights = [mix[name] for name in names]
+            latencies = {name: [] for name in names}
+            with contextlib.redirect_stdout(NullWriter()):
+                start = time.perf_counter()
+                for name in rng.choices(names, weights, k=ops):
+                    begin = time.perf_counter()
+                    getattr(test, name)()
+                    latencies[name].append(time.perf_counter() - begin)
+                mixed_elapsed = time.perf_counter() - start
+
+                micro = {}
+                for name in MICRO_OPERATIONS:
+                    elapsed, values = timed_run(getattr(test, name), micro_ops)
+                    micro[name] = summarize(values, elapsed)
+            from audit_log import audit_logger
+
+            audit_logger.flush()
+            set_storage("file")
+        finally:
+            os.chdir(cwd)
+
+    operations = {}
+    for name, values in latencies.items():
+        total = sum(values)
+        if values:
+            operations[name] = summarize(values, total)
+    return {
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "parameters": {
+            "accounts": accounts,
+            "history": history,
+            "ops": ops,
+            "mix": mix,
+            "seed": seed,
+            "storage": storage,
+        },
+        "overall_ops_per_sec": ops / mixed_elapsed if mixed_elapsed else 0.0,
+        "operations": operations,
+        "micro": micro,
+    }
+
+
+def print_table(title, rows, baseline=None):
+    print(f"\n{title}")
+    print(
+        f"{'operation':<18} {'count':>7} {'ops/s':>10} {'p50 ms':>9} "
+        f"{'p95 ms':>9} {'p99 ms':>9}" + (f" {'vs base':>8}" if baseline else "")
+    )
+    for name, row in rows.items():
+        line = (
+            f"{name:<18} {row['count']:>7} {row['ops_per_sec']:>10.0f} "
+            f"{row['p50_ms']:>9.3f} {row['p95_ms']:>9.3f} {row['p99_ms']:>9.3f}"
+        )
+        if baseline:
+            base = baseline.get(name)
+            if base and base["ops_per_sec"]:
+                line += f" {row['ops_per_sec'] / base['ops_per_sec']:>7.2f}x"
+        print(line)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test the account engine.")
+    parser.add_argument("--accounts", type=int, default=200)
+    parser.add_argument("--history", type=int, default=1000)
+    parser.add_argument("--ops", type=int, default=20000)
+    parser.add_argument("--micro-ops", type=int, default=2000)
+    parser.add_argument("--mix", type=parse_mix, default=DEFAULT_MIX)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--storage", choices=["file", "sqlite"], default="file")
+    parser.add_argument("--output", help="write results as JSON to this file")
+    parser.add_argument("--compare", help="JSON results of an earlier run")
+    args = parser.parse_args(argv)
+
+    results = run(
+        args.accounts,
+        args.history,
+        args.ops,
+        args.mix,
+        args.seed,
+        args.micro_ops,
+        args.storage,
+    )
+    baseline = None
+    if args.compare:
+        with open(args.compare, "r") as f:
+            baseline = json.load(f)
+
+    print(f"Overall: {results['overall_ops_per_sec']:.0f} ops/s")
+    print_table(
+        "Operation mix", results["operations"], baseline and baseline["operations"]
+    )
+    print_table("Storage hot spots", results["micro"], baseline and baseline["micro"])
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,443 @@
+"""
+Ordered change feed of committed transactions and admin actions.
+
+Every transaction saved by UserActions (deposits, withdrawals, both sides of a
+transfer, month-end postings, batch rows) and every AdminActions mutation
+(create, freeze, unfreeze, limit change, delete, and their bulk forms) is
+appended to the feed as one JSON event with a sequence number (``seq``) that
+increases by one across all processes::
+
+    {"seq": 41, "time": "2026-10-18 12:00:00", "kind": "transaction",
+     "account_number": "1001", "transaction": {"date": ..., "type": ...}}
+    {"seq": 42, "time": "...", "kind": "admin", "action": "freeze",
+     "account_number": "1001"}
+
+The feed lives in ``<data root>/changefeed/`` as segments named after their
+first sequence number (``00000000000000000001.jsonl``); writers take an flock
+on ``feed.lock`` so sequence numbers follow the order of the appends. Once a
+segment passes ``BANK_FEED_SEGMENT_BYTES`` (default 16 MiB) the next append
+starts a new one, and the old one ends with a ``{"next": <name>}`` line that
+readers follow.
+
+Consumers read batches of events after an offset (the last ``seq`` they
+processed) with FeedReader, or through a named Consumer, which saves its
+offset, plus where it stopped reading, in ``changefeed/consumers/<name>.json``.
+A later poll then reads from that position instead of scanning. prune() drops
+segments every consumer is past.
+
+Transaction events are published by the storage backend, which records that
+they are due in the same durable step as the transactions themselves (the
+write-ahead log record, an intent file in ``pending_transfers/`` or the SQLite
+transaction, together with the feed position at the time). If a crash comes
+between the commit and the publish, recover() publishes whatever is missing
+from the feed after that position, so no committed transaction is left out;
+such events may come later than events committed after them. Admin events are
+published after the change they describe. ``BANK_CHANGE_FEED=off`` turns the
+feed off.
+
+Usage: python changefeed.py tail [--from SEQ | --consumer NAME] [--batch N]
+       [--follow]
+       python changefeed.py consumers
+       python changefeed.py prune
+"""
+
+import argparse
+import bisect
+import collections
+import datetime
+import json
+import os
+import sys
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not on POSIX
+    fcntl = None
+
+from account_format import encode_transaction
+from paths import resolver
+from transaction import DATE_FORMAT
+
+SEGMENT_SUFFIX = ".jsonl"
+
+
+def feed_dir():
+    return resolver.change_feed_dir()
+
+
+def segment_name(first_seq):
+    return f"{first_seq:020d}{SEGMENT_SUFFIX}"
+
+
+def list_segments(directory=None):
+    """Segment names, oldest first."""
+    try:
+        names = os.listdir(directory or feed_dir())
+    except FileNotFoundError:
+        return []
+    return sorted(n for n in names if n.endswith(SEGMENT_SUFFIX))
+
+
+def encode_event(event):
+    return json.dumps(event, separators=(",", ":"), default=encode_transaction) + "\n"
+
+
+def event_key(event):
+    """An event's content without its seq and time, for matching events."""
+    return json.dumps(
+        {k: v for k, v in event.items() if k not in ("seq", "time")},
+        sort_keys=True,
+        default=encode_transaction,
+    )
+
+
+def transaction_event(account_number, transaction):
+    return {
+        "kind": "transaction",
+        "account_number": account_number,
+        "transaction": transaction,
+    }
+
+
+def admin_event(action, account_number, **details):
+    return {
+        "kind": "admin",
+        "action": action,
+        "account_number": account_number,
+        **details,
+    }
+
+
+class ChangeFeed:
+    """Appends events; safe across threads and processes."""
+
+    enabled = True
+
+    def __init__(self, directory=None, segment_bytes=16 * 2**20):
+        self._directory = directory
+        self.segment_bytes = segment_bytes
+        self._lock = threading.Lock()
+        self._pid = None
+
+    @property
+    def directory(self):
+        return self._directory or feed_dir()
+
+    def _open(self):
+        # Each process (a forked child too) opens its own files.
+        self._pid = os.getpid()
+        os.makedirs(self.directory, exist_ok=True)
+        self._lock_fd = os.open(
+            os.path.join(self.directory, "feed.lock"), os.O_RDWR | os.O_CREAT, 0o644
+        )
+        self._segment = None
+        self._fd = None
+        self._position = 0
+        self._last_seq = 0
+
+    def _switch(self, name, position, last_seq):
+        if self._fd is not None:
+            os.close(self._fd)
+        self._segment = name
+        self._fd = os.open(
+            os.path.join(self.directory, name),
+            os.O_WRONLY | os.O_CREAT | os.O_APPEND,
+            0o644,
+        )
+        self._position = position
+        self._last_seq = last_seq
+
+    def _catch_up(self):
+        """Find the newest segment and its last seq; called under the flock."""
+        if self._segment is None:
+            segments = list_segments(self.directory)
+            name = segments[-1] if segments else segment_name(1)
+            # Read from the start of the segment below to learn its last seq.
+            self._switch(name, 0, int(name[: -len(SEGMENT_SUFFIX)]) - 1)
+        while True:
+            size = os.fstat(self._fd).st_size
+            if size == self._position:
+                return
+            # Other processes appended since our last write.
+            path = os.path.join(self.directory, self._segment)
+            with open(path, "rb") as f:
+                f.seek(self._position)
+                data = f.read(size - self._position)
+            if not data.endswith(b"\n"):
+                # A writer died mid-append; drop the torn event.
+                os.truncate(path, self._position + data.rfind(b"\n") + 1)
+                continue
+            last = json.loads(data[data.rfind(b"\n", 0, -1) + 1 :])
+            if "next" in last:
+                name = last["next"]
+                self._switch(name, 0, int(name[: -len(SEGMENT_SUFFIX)]) - 1)
+            else:
+                self._position = size
+                self._last_seq = last["seq"]
+
+    def position(self):
+        """A seq the feed has reached: the last one this process saw."""
+        return self._last_seq if self._pid == os.getpid() else 0
+
+    def publish_missing(self, events, after):
+        """
+        Publish those of ``events`` that are not in the feed after seq
+        ``after``; recovery cannot tell whether a commit's events made it.
+        """
+        missing = collections.Counter(event_key(event) for event in events)
+        reader = FeedReader(self._directory)
+        while +missing:
+            batch = reader.read(after)
+            if not batch:
+                break
+            for event in batch:
+                key = event_key(event)
+                if missing[key] > 0:
+                    missing[key] -= 1
+            after = batch[-1]["seq"]
+        unpublished = []
+        for event in events:
+            key = event_key(event)
+            if missing[key] > 0:
+                missing[key] -= 1
+                unpublished.append(event)
+        return self.publish(unpublished)
+
+    def publish(self, events):
+        """Append events in order; returns the seq of the last one."""
+        if not events:
+            return None
+        stamp = datetime.datetime.now().strftime(DATE_FORMAT)
+        with self._lock:
+            if self._pid != os.getpid():
+                self._open()
+            if fcntl is not None:
+                fcntl.flock(self._lock_fd, fcntl.LOCK_EX)
+            try:
+                self._catch_up()
+                if self._position >= self.segment_bytes:
+                    name = segment_name(self._last_seq + 1)
+                    os.write(self._fd, encode_event({"next": name}).encode())
+                    self._switch(name, 0, self._last_seq)
+                lines = []
+                for event in events:
+                    self._last_seq += 1
+                    lines.append(
+                        encode_event({"seq": self._last_seq, "time": stamp, **event})
+                    )
+                data = "".join(lines).encode()
+                os.write(self._fd, data)
+                self._position += len(data)
+                return self._last_seq
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+
+
+class FeedReader:
+    """Reads batches of events after a given seq."""
+
+    def __init__(self, directory=None):
+        self._directory = directory
+        # (seq, segment, byte position) just after the last event read.
+        self.position = None
+
+    @property
+    def directory(self):
+        return self._directory or feed_dir()
+
+    def _locate(self, after):
+        if self.position is not None and self.position[0] == after:
+            return self.position[1], self.position[2]
+        segments = list_segments(self.directory)
+        if not segments:
+            return None, 0
+        firsts = [int(n[: -len(SEGMENT_SUFFIX)]) for n in segments]
+        # The segment holding after + 1 (or the oldest one left).
+        index = max(bisect.bisect_right(firsts, after + 1) - 1, 0)
+        return segments[index], 0
+
+    def read(self, after=0, limit=1000):
+        """Up to ``limit`` events with seq > ``after``, in order."""
+        segment, position = self._locate(after)
+        events = []
+        while segment is not None and len(events) < limit:
+            try:
+                f = open(os.path.join(self.directory, segment), "rb")
+            except FileNotFoundError:
+                if self.position is None:
+                    break
+                # Pruned since the saved position; look it up again.
+                self.position = None
+                segment, position = self._locate(after)
+                continue
+            following = None
+            with f:
+                f.seek(position)
+                while len(events) < limit:
+                    line = f.readline()
+                    if not line.endswith(b"\n"):
+                        # The end, or an event still being written.
+                        break
+                    position += len(line)
+                    event = json.loads(line)
+                    if "next" in event:
+                        following = event["next"]
+                        break
+                    if event["seq"] > after:
+                        events.append(event)
+                        after = event["seq"]
+            self.position = (after, segment, position)
+            if following is None:
+                break
+            segment, position = following, 0
+        return events
+
+
+class Consumer:
+    """A named reader whose offset is saved between runs."""
+
+    def __init__(self, name, directory=None):
+        self.name = name
+        self.reader = FeedReader(directory)
+        self.offset = 0
+        state = self._read_state()
+        if state is not None:
+            self.offset = state["offset"]
+            if state.get("segment") is not None:
+                self.reader.position = (
+                    state["offset"],
+                    state["segment"],
+                    state["position"],
+                )
+
+    def _state_file(self):
+        return os.path.join(self.reader.directory, "consumers", f"{self.name}.json")
+
+    def _read_state(self):
+        try:
+            with open(self._state_file(), "r") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def poll(self, limit=1000):
+        """The next batch after the consumer's offset (not committed yet)."""
+        return self.reader.read(self.offset, limit)
+
+    def commit(self, seq):
+        """Save ``seq`` as processed."""
+        self.offset = seq
+        state = {"offset": seq, "segment": None, "position": None}
+        if self.reader.position is not None and self.reader.position[0] == seq:
+            _, state["segment"], state["position"] = self.reader.position
+        path = self._state_file()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(f"{path}.tmp", "w") as f:
+            json.dump(state, f)
+        os.replace(f"{path}.tmp", path)
+
+    def tail(self, limit=1000, interval=0.5):
+        """Yield batches forever, waiting ``interval`` seconds when caught up."""
+        while True:
+            events = self.poll(limit)
+            if events:
+                yield events
+            else:
+                time.sleep(interval)
+
+
+def consumer_offsets(directory=None):
+    directory = os.path.join(directory or feed_dir(), "consumers")
+    offsets = {}
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return offsets
+    for name in names:
+        if name.endswith(".json"):
+            with open(os.path.join(directory, name), "r") as f:
+                offsets[name[: -len(".json")]] = json.load(f)["offset"]
+    return offsets
+
+
+def prune(directory=None):
+    """Remove segments every consumer has read; returns how many."""
+    offsets = consumer_offsets(directory)
+    if not offsets:
+        return 0
+    low = min(offsets.values())
+    segments = list_segments(directory)
+    removed = 0
+    # A segment is done when the next one starts at or before low + 1.
+    for name, following in zip(segments, segments[1:]):
+        if int(following[: -len(SEGMENT_SUFFIX)]) > low + 1:
+            break
+        os.remove(os.path.join(directory or feed_dir(), name))
+        removed += 1
+    return removed
+
+
+class _DisabledFeed:
+    enabled = False
+
+    def position(self):
+        return 0
+
+    def publish(self, events):
+        return None
+
+    def publish_missing(self, events, after):
+        return None
+
+
+def from_env():
+    if os.environ.get("BANK_CHANGE_FEED", "on") == "off":
+        return _DisabledFeed()
+    return ChangeFeed(
+        segment_bytes=int(os.environ.get("BANK_FEED_SEGMENT_BYTES", 16 * 2**20))
+    )
+
+
+change_feed = from_env()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Read the change feed.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    tail = subparsers.add_parser("tail", help="Print events as JSON lines.")
+    tail.add_argument("--from", dest="after", type=int, default=0, help="after seq")
+    tail.add_argument("--consumer", help="read and commit as this consumer")
+    tail.add_argument("--batch", type=int, default=1000)
+    tail.add_argument("--follow", action="store_true")
+    subparsers.add_parser("consumers", help="List consumer offsets.")
+    subparsers.add_parser("prune", help="Drop segments every consumer has read.")
+    args = parser.parse_args()
+
+    if args.command == "consumers":
+        for name, offset in sorted(consumer_offsets().items()):
+            print(f"{name}\t{offset}")
+    elif args.command == "prune":
+        print(f"Removed {prune()} segment(s).")
+    else:
+        consumer = Consumer(args.consumer) if args.consumer else None
+        reader = consumer.reader if consumer else FeedReader()
+        after = consumer.offset if consumer else args.after
+        try:
+            while True:
+                events = reader.read(after, args.batch)
+                for event in events:
+                    sys.stdout.write(encode_event(event))
+                sys.stdout.flush()
+                if events:
+                    after = events[-1]["seq"]
+                    if consumer:
+                        consumer.commit(after)
+                elif not args.follow:
+                    break
+                else:
+                    time.sleep(0.5)
+        except KeyboardInterrupt:
+            pass
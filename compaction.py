@@ -0,0 +1,237 @@
+"""
+Compaction of account journals into cold, compressed segments.
+
+Old journal records are moved into gzip-compressed JSON-lines segments in a
+``segments_<number>`` directory next to the account's journal, so the journal
+only holds recent activity. ``manifest.txt`` in that directory lists the
+segments in order (first date, last date, record count, file name); full
+history is the segments followed by the journal.
+
+Each compaction writes an fsynced intent (in ``pending_compactions`` under the
+data root) before it changes the manifest or the journal; recover_all() runs
+at startup with the transfer recovery and finishes any compaction a crash
+interrupted.
+
+Usage: python compaction.py [--older-than DAYS] [--min-records N] [ACCOUNT ...]
+"""
+
+import argparse
+import contextlib
+import datetime
+import gzip
+import json
+import os
+
+from account_format import (
+    format_record,
+    journal_filename,
+    parse_journal,
+    read_header,
+    write_header,
+)
+from paths import resolver
+
+MANIFEST = "manifest.txt"
+
+
+def segment_dir(account_number):
+    return os.path.join(
+        os.path.dirname(journal_filename(account_number)),
+        f"segments_{account_number}",
+    )
+
+
+def read_manifest(account_number):
+    """Return (first_date, last_date, count, filename) per segment, oldest first."""
+    segments = []
+    try:
+        with open(os.path.join(segment_dir(account_number), MANIFEST), "r") as f:
+            for line in f:
+                first, last, count, name = line.rstrip("\n").split("\t")
+                segments.append((first, last, int(count), name))
+    except FileNotFoundError:
+        pass
+    return segments
+
+
+def iter_segments(account_number, start=None):
+    """Yield archived transactions, skipping segments that end before ``start``."""
+    directory = segment_dir(account_number)
+    for _, last, _, name in read_manifest(account_number):
+        if start is not None and last < start:
+            continue
+        with gzip.open(os.path.join(directory, name), "rt") as f:
+            for line in f:
+                yield json.loads(line)
+
+
+def remove_segments(account_number):
+    directory = segment_dir(account_number)
+    if not os.path.isdir(directory):
+        return
+    for name in os.listdir(directory):
+        os.remove(os.path.join(directory, name))
+    os.rmdir(directory)
+
+
+def intent_file(account_number):
+    return os.path.join(resolver.pending_compactions_dir(), f"{account_number}.json")
+
+
+def _fsync_write(path, data, mode="w"):
+    with open(path, mode) as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def _apply(account_number, intent):
+    directory = segment_dir(account_number)
+    manifest = read_manifest(account_number)
+    if intent["segment"] not in [name for *_, name in manifest]:
+        _fsync_write(
+            os.path.join(directory, MANIFEST),
+            f"{intent['first']}\t{intent['last']}\t{intent['count']}\t"
+            f"{intent['segment']}\n",
+            "a",
+        )
+    journal = journal_filename(account_number)
+    if os.path.getsize(journal) == intent["journal_size"]:
+        with open(journal, "rb") as f:
+            f.seek(intent["cut"])
+            tail = f.read()
+        _fsync_write(f"{journal}.tmp", tail, "wb")
+        os.replace(f"{journal}.tmp", journal)
+    index_file = resolver.index_file(account_number)
+    if os.path.exists(index_file):
+        os.remove(index_file)
+    header = read_header(account_number)
+    header.pop("format_version", None)
+    header["journal_offset"] = intent["journal_offset"]
+    write_header(account_number, header)
+    os.remove(intent_file(account_number))
+
+
+def recover_account(account_number):
+    """Finish an interrupted compaction; returns True if there was one."""
+    try:
+        with open(intent_file(account_number), "r") as f:
+            intent = json.load(f)
+    except FileNotFoundError:
+        return False
+    _apply(account_number, intent)
+    return True
+
+
+def recover_all(locked=None):
+    """Finish every interrupted compaction; returns the account numbers."""
+    pending_dir = resolver.pending_compactions_dir()
+    if not os.path.isdir(pending_dir):
+        return []
+    recovered = []
+    for filename in sorted(os.listdir(pending_dir)):
+        if filename.endswith(".json"):
+            account_number = filename[: -len(".json")]
+            with locked(account_number) if locked else contextlib.nullcontext():
+                recover_account(account_number)
+            recovered.append(account_number)
+    return recovered
+
+
+def compact_account(account_number, before, min_records=1000):
+    """
+    Move journal records dated before ``before`` (a "YYYY-MM-DD HH:MM:SS"
+    string) into a new segment, if there are at least ``min_records`` of
+    them. The caller must hold the account's lock. Returns the number of
+    records archived.
+    """
+    recover_account(account_number)
+    journal = journal_filename(account_number)
+    if not os.path.exists(journal):
+        return 0
+    with open(journal, "rb") as f:
+        data = f.read()
+    # Records past the header's offset are not in its balance yet; they stay
+    # in the journal so loading can still replay them.
+    offset = read_header(account_number).get("journal_offset", len(data))
+    cut = 0
+    archived = []
+    for line in data[:offset].splitlines(keepends=True):
+        if not line.endswith(b"\n"):
+            break
+        transaction = json.loads(line)
+        if transaction["date"] >= before:
+            break
+        archived.append(transaction)
+        cut += len(line)
+    if not archived or len(archived) < min_records:
+        return 0
+
+    directory = segment_dir(account_number)
+    os.makedirs(directory, exist_ok=True)
+    segment = f"{len(read_manifest(account_number)) + 1:06d}.jsonl.gz"
+    with gzip.open(os.path.join(directory, f"{segment}.tmp"), "wt") as f:
+        f.write("".join(format_record(t) for t in archived))
+    with open(os.path.join(directory, f"{segment}.tmp"), "rb") as f:
+        os.fsync(f.fileno())
+    os.replace(
+        os.path.join(directory, f"{segment}.tmp"), os.path.join(directory, segment)
+    )
+    intent = {
+        "segment": segment,
+        "first": archived[0]["date"],
+        "last": archived[-1]["date"],
+        "count": len(archived),
+        "cut": cut,
+        "journal_size": len(data),
+        "journal_offset": offset - cut,
+    }
+    os.makedirs(resolver.pending_compactions_dir(), exist_ok=True)
+    path = intent_file(account_number)
+    _fsync_write(f"{path}.tmp", json.dumps(intent))
+    os.replace(f"{path}.tmp", path)
+    _apply(account_number, intent)
+    return len(archived)
+
+
+def compact_all(older_than_days=90, min_records=1000, account_numbers=None):
+    from transfers import AccountLocks
+
+    locks = AccountLocks()
+    before = (
+        datetime.datetime.now() - datetime.timedelta(days=older_than_days)
+    ).strftime("%Y-%m-%d %H:%M:%S")
+    accounts = 0
+    records = 0
+    for account_number in account_numbers or list(resolver.iter_account_numbers()):
+        try:
+            with locks.locked(account_number):
+                archived = compact_account(account_number, before, min_records)
+        except (OSError, ValueError) as e:
+            print(f"Could not compact account {account_number}: {e}")
+            continue
+        if archived:
+            accounts += 1
+            records += archived
+    print(f"Archived {records} transaction(s) from {accounts} account(s).")
+    return accounts, records
+
+
+def load_transactions(account_number):
+    """Full history: every archived segment followed by the journal."""
+    transactions = list(iter_segments(account_number))
+    try:
+        with open(journal_filename(account_number), "r") as f:
+            transactions.extend(parse_journal(f.read()))
+    except FileNotFoundError:
+        pass
+    return transactions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Archive old journal records.")
+    parser.add_argument("account_numbers", nargs="*")
+    parser.add_argument("--older-than", type=int, default=90, help="days")
+    parser.add_argument("--min-records", type=int, default=1000)
+    args = parser.parse_args()
+    compact_all(args.older_than, args.min_records, args.account_numbers)
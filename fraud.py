@@ -0,0 +1,240 @@
+"""
+Streaming fraud and velocity detection over the transaction stream.
+
+UserActions.record_transaction() hands every new transaction to the
+``detectors`` pipeline. Outgoing transactions (withdrawals and transfers)
+update a small per-account profile in constant time, without reading any
+history:
+
+- their count and total over a rolling window (limits.RollingWindow);
+- the most recent recipients (at most MAX_RECIPIENTS) and when each was paid;
+- an exponentially weighted mean and variance of their amounts.
+
+Each rule looks at the profile as it was before the transaction. When any
+rule fires, the pipeline calls its alert handler; the default one,
+freeze_on_alert(), freezes the account through the storage backend, as
+AdminActions.freeze_account does, and logs the reasons.
+
+Profiles are kept in memory only, in an LRU of at most ``max_accounts``; an
+evicted profile (or one lost to a restart) just starts learning again. Every
+process keeps its own.
+
+``BANK_FRAUD`` turns the pipeline on: ``all`` or a comma-separated list of rule
+names (velocity, amount_velocity, fan_out, deviation); the default is ``off``.
+``BANK_FRAUD_WINDOW`` sets the rolling window in seconds (default 600).
+"""
+
+import collections
+import math
+import os
+import threading
+
+from audit_log import audit_logger
+from changefeed import admin_event, change_feed
+from limits import RollingWindow
+from paths import resolver
+from storage import get_storage
+
+OUTGOING_TYPES = {"Withdrawal", "Transfer"}
+WINDOW_BUCKETS = 10
+MAX_RECIPIENTS = 32
+# Weight of the newest amount in the running mean and variance.
+ALPHA = 0.1
+
+
+class AccountProfile:
+    __slots__ = ("count", "total", "recipients", "samples", "mean", "variance")
+
+    def __init__(self, window):
+        # One bucket more than the window needs, as in limits.Velocity.
+        self.count = RollingWindow(window / WINDOW_BUCKETS, WINDOW_BUCKETS + 1)
+        self.total = RollingWindow(window / WINDOW_BUCKETS, WINDOW_BUCKETS + 1)
+        # recipient -> last time paid, least recently paid first.
+        self.recipients = {}
+        self.samples = 0
+        self.mean = 0.0
+        self.variance = 0.0
+
+    def recent_recipients(self, since):
+        recent = 0
+        for paid in reversed(self.recipients.values()):
+            if paid < since:
+                break
+            recent += 1
+        return recent
+
+    def deviation(self, amount):
+        """Standard deviations between ``amount`` and the usual amount."""
+        # Floored at a dollar, so a run of identical amounts is not infinitely
+        # sure of itself.
+        return (amount - self.mean) / max(math.sqrt(self.variance), 1.0)
+
+    def add(self, amount, recipient, now):
+        self.count.add(1, now)
+        self.total.add(amount, now)
+        if recipient is not None:
+            self.recipients.pop(recipient, None)
+            self.recipients[recipient] = now
+            if len(self.recipients) > MAX_RECIPIENTS:
+                del self.recipients[next(iter(self.recipients))]
+        if self.samples == 0:
+            self.mean = amount
+        else:
+            difference = amount - self.mean
+            increment = ALPHA * difference
+            self.mean += increment
+            self.variance = (1 - ALPHA) * (self.variance + difference * increment)
+        self.samples += 1
+
+
+class VelocityRule:
+    """Too many outgoing transactions within the window."""
+
+    name = "velocity"
+
+    def __init__(self, max_count=20):
+        self.max_count = max_count
+
+    def check(self, profile, amount, recipient, now, window):
+        count = profile.count.sum(now) + 1
+        if count > self.max_count:
+            return f"{count:.0f} outgoing transactions in {window}s"
+
+
+class AmountVelocityRule:
+    """Too much money out within the window."""
+
+    name = "amount_velocity"
+
+    def __init__(self, max_amount=10000):
+        self.max_amount = max_amount
+
+    def check(self, profile, amount, recipient, now, window):
+        total = profile.total.sum(now) + amount
+        if total > self.max_amount:
+            return f"${total:.2f} sent out in {window}s"
+
+
+class FanOutRule:
+    """Transfers to too many different recipients within the window."""
+
+    name = "fan_out"
+
+    def __init__(self, max_recipients=8):
+        self.max_recipients = max_recipients
+
+    def check(self, profile, amount, recipient, now, window):
+        if recipient is None or len(profile.recipients) < self.max_recipients:
+            return None
+        since = now - window
+        recent = profile.recent_recipients(since)
+        if profile.recipients.get(recipient, since - 1) < since:
+            recent += 1
+        if recent > self.max_recipients:
+            return f"{recent} different recipients in {window}s"
+
+
+class DeviationRule:
+    """An amount far above what the account usually moves."""
+
+    name = "deviation"
+
+    def __init__(self, threshold=6.0, min_samples=10, min_amount=100):
+        self.threshold = threshold
+        self.min_samples = min_samples
+        self.min_amount = min_amount
+
+    def check(self, profile, amount, recipient, now, window):
+        if profile.samples < self.min_samples or amount < self.min_amount:
+            return None
+        deviation = profile.deviation(amount)
+        if deviation > self.threshold:
+            return (
+                f"${amount:.2f} is {deviation:.1f} deviations above the usual "
+                f"${profile.mean:.2f}"
+            )
+
+
+RULES = {
+    rule.name: rule
+    for rule in [VelocityRule, AmountVelocityRule, FanOutRule, DeviationRule]
+}
+
+
+def freeze_on_alert(account_number, transaction, reasons):
+    if get_storage().freeze(account_number):
+        details = f"Account Number: {account_number}, Reasons: {'; '.join(reasons)}"
+        audit_logger.log(resolver.admin_log_file(), "Auto Freeze Account", details)
+        audit_logger.log(resolver.log_file(account_number), "Account Frozen", details)
+        change_feed.publish(
+            [admin_event("freeze", account_number, source="fraud", reasons=reasons)]
+        )
+
+
+class DetectorPipeline:
+    def __init__(self, rules=(), window=600, max_accounts=50000, on_alert=None):
+        self.rules = list(rules)
+        self.window = window
+        self.max_accounts = max_accounts
+        self.on_alert = on_alert or freeze_on_alert
+        self.alerts = 0
+        self._profiles = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def add_rule(self, rule):
+        self.rules.append(rule)
+
+    def profile(self, account_number):
+        return self._profiles.get(account_number)
+
+    def observe(self, account_number, transaction):
+        """Check and record one transaction; returns the reasons rules fired."""
+        if not self.rules or transaction.type not in OUTGOING_TYPES:
+            return []
+        amount = transaction.amount
+        recipient = transaction.recipient
+        now = transaction.timestamp
+        with self._lock:
+            profile = self._profiles.get(account_number)
+            if profile is None:
+                profile = self._profiles[account_number] = AccountProfile(self.window)
+                if len(self._profiles) > self.max_accounts:
+                    self._profiles.popitem(last=False)
+            else:
+                self._profiles.move_to_end(account_number)
+            reasons = []
+            for rule in self.rules:
+                reason = rule.check(profile, amount, recipient, now, self.window)
+                if reason:
+                    reasons.append(f"{rule.name}: {reason}")
+            profile.add(amount, recipient, now)
+            if reasons:
+                self.alerts += 1
+        if reasons:
+            self.on_alert(account_number, transaction, reasons)
+        return reasons
+
+    def reset(self):
+        with self._lock:
+            self._profiles.clear()
+            self.alerts = 0
+
+
+def from_env():
+    names = os.environ.get("BANK_FRAUD", "off")
+    if names == "off":
+        names = []
+    elif names == "all":
+        names = list(RULES)
+    else:
+        names = [name.strip() for name in names.split(",") if name.strip()]
+    for name in names:
+        if name not in RULES:
+            raise ValueError(f"Unknown fraud rule '{name}'.")
+    return DetectorPipeline(
+        [RULES[name]() for name in names],
+        window=int(os.environ.get("BANK_FRAUD_WINDOW", 600)),
+    )
+
+
+detectors = from_env()
@@ -0,0 +1,188 @@
+"""
+Lazily decoded views of an account's stored transaction history.
+
+Logging in, or loading a transfer's recipient, only reads the header snapshot.
+The history is read only when something iterates over or indexes
+UserActions.transaction_history, and even then only through a view:
+
+- JournalView maps the account's journal into memory (``mmap``) when it is
+  created and decodes a record only when it is read. Archived segments
+  (compaction.py) come first; each is decompressed only when reached.
+- TransactionHistory puts a view of the stored records, decoded into
+  Transaction objects on access, in front of the transactions recorded in
+  memory since the account was loaded.
+
+The view sees the history as it was when it was created. Records appended
+later by this account go through TransactionHistory.append(); a compaction
+or rewrite replaces the journal file, and the view keeps the old mapping.
+"""
+
+import collections.abc
+import gzip
+import itertools
+import json
+import mmap
+import os
+from array import array
+
+from account_format import journal_filename, parse_journal
+from compaction import read_manifest, segment_dir
+from transaction import Transaction
+
+# Bytes counted per slice when counting journal lines.
+COUNT_CHUNK = 2**20
+# Bytes of whole lines decoded at once when iterating over the journal.
+ITER_CHUNK = 2**20
+# Negative indexes down to this are found by scanning back from the end of
+# the journal instead of counting and indexing its lines.
+TAIL_SCAN = 64
+
+
+def _index(sequence, index):
+    if index < 0:
+        index += len(sequence)
+    if not 0 <= index < len(sequence):
+        raise IndexError("transaction index out of range")
+    return index
+
+
+class JournalView(collections.abc.Sequence):
+    """An account's stored records, as dicts, decoded on access."""
+
+    def __init__(self, account_number):
+        self.account_number = account_number
+        self._segments = [
+            (count, name) for _, _, count, name in read_manifest(account_number)
+        ]
+        self._archived = sum(count for count, _ in self._segments)
+        # The segment decoded last: (its first index, its records).
+        self._segment = None
+        self._map = b""
+        try:
+            with open(journal_filename(account_number), "rb") as f:
+                if os.fstat(f.fileno()).st_size:
+                    self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except FileNotFoundError:
+            pass
+        # Only complete lines count; a crash can leave a partial last one.
+        self._end = self._map.rfind(b"\n") + 1
+        self._count = None
+        # Start offset of every journal line, built on first random access.
+        self._offsets = None
+
+    def _journal_count(self):
+        if self._count is None:
+            self._count = sum(
+                self._map[i : i + COUNT_CHUNK].count(b"\n")
+                for i in range(0, self._end, COUNT_CHUNK)
+            )
+        return self._count
+
+    def __len__(self):
+        return self._archived + self._journal_count()
+
+    def _read_segment(self, index):
+        first = 0
+        for count, name in self._segments:
+            if index < first + count:
+                break
+            first += count
+        if self._segment is None or self._segment[0] != first:
+            with gzip.open(
+                os.path.join(segment_dir(self.account_number), name), "rb"
+            ) as f:
+                self._segment = (first, [json.loads(line) for line in f])
+        return self._segment[1][index - first]
+
+    def _line_from_end(self, back):
+        """Byte range of the journal line ``back`` lines from the end, if any."""
+        end = self._end
+        for _ in range(back):
+            if end == 0:
+                return None
+            start = self._map.rfind(b"\n", 0, end - 1) + 1
+            end, last = start, end
+        return start, last
+
+    def _line(self, index):
+        """Byte range of journal line ``index``."""
+        if self._offsets is None:
+            offsets = array("q", [0])
+            position = self._map.find(b"\n")
+            while 0 <= position < self._end:
+                offsets.append(position + 1)
+                position = self._map.find(b"\n", position + 1)
+            self._offsets = offsets
+        return self._offsets[index], self._offsets[index + 1]
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if -TAIL_SCAN <= index < 0:
+            # The latest records need neither the line count nor the index.
+            line = self._line_from_end(-index)
+            if line is not None:
+                return json.loads(self._map[line[0] : line[1]])
+        index = _index(self, index)
+        if index < self._archived:
+            return self._read_segment(index)
+        start, end = self._line(index - self._archived)
+        return json.loads(self._map[start:end])
+
+    def _iter_segments(self):
+        directory = segment_dir(self.account_number)
+        for _, name in self._segments:
+            with gzip.open(os.path.join(directory, name), "rb") as f:
+                for line in f:
+                    yield json.loads(line)
+
+    def _iter_journal(self):
+        # Decoded a block of whole lines at a time, like a full journal read.
+        position = 0
+        while position < self._end:
+            end = self._map.rfind(b"\n", position, position + ITER_CHUNK) + 1
+            if end <= position:
+                end = self._map.find(b"\n", position) + 1
+            yield from parse_journal(self._map[position:end].decode())
+            position = end
+
+    def __iter__(self):
+        return itertools.chain(self._iter_segments(), self._iter_journal())
+
+
+class TransactionHistory(collections.abc.Sequence):
+    """
+    Stored records (any sequence of dicts) decoded into Transaction objects on
+    access, followed by transactions appended in memory.
+    """
+
+    def __init__(self, stored, appended=()):
+        self.stored = stored
+        self.appended = list(appended)
+
+    def __len__(self):
+        return len(self.stored) + len(self.appended)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            # Counted from the end, so the stored part need not be counted.
+            if -index <= len(self.appended):
+                return self.appended[index]
+            return Transaction.from_dict(self.stored[index + len(self.appended)])
+        if index < len(self.stored):
+            return Transaction.from_dict(self.stored[index])
+        return self.appended[_index(self, index) - len(self.stored)]
+
+    def __iter__(self):
+        for record in self.stored:
+            yield Transaction.from_dict(record)
+        yield from self.appended
+
+    def append(self, transaction):
+        self.appended.append(transaction)
+
+    def remove(self, transaction):
+        """Remove a transaction appended in memory; stored ones are read-only."""
+        self.appended.remove(transaction)
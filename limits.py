@@ -0,0 +1,99 @@
+"""
+Transaction limits with rolling-window velocity counters.
+
+Each account keeps the amount it sent out (withdrawals and transfers) over the
+last hour and the last 24 hours in two small rings of time buckets, one-minute
+buckets for the hour and one-hour buckets for the day. Each ring has one bucket
+more than its period needs, so a window never covers less than a full hour or
+day (it may reach up to one bucket further back). Every ring also keeps its running
+total, so checking a limit or recording an amount touches a fixed number of
+buckets regardless of how much history the account has. The counters are
+saved with the account (the ``velocity`` header field), so limits still hold
+after a restart.
+"""
+
+import json
+import time
+
+
+class RollingWindow:
+    def __init__(self, width, buckets):
+        self.width = width
+        self.buckets = [0.0] * buckets
+        self.total = 0.0
+        self.current = 0
+
+    def _advance(self, now):
+        index = int(now // self.width)
+        if index <= self.current:
+            return
+        if index - self.current >= len(self.buckets):
+            self.buckets = [0.0] * len(self.buckets)
+            self.total = 0.0
+        else:
+            for expired in range(self.current + 1, index + 1):
+                slot = expired % len(self.buckets)
+                self.total -= self.buckets[slot]
+                self.buckets[slot] = 0.0
+        self.current = index
+
+    def sum(self, now):
+        self._advance(now)
+        return self.total
+
+    def add(self, amount, now):
+        self._advance(now)
+        self.buckets[self.current % len(self.buckets)] += amount
+        self.total += amount
+
+    def state(self):
+        # Only non-empty buckets are kept, so idle accounts store almost nothing.
+        return [
+            self.current,
+            [[slot, amount] for slot, amount in enumerate(self.buckets) if amount],
+        ]
+
+    def restore(self, state):
+        self.current, buckets = state
+        for slot, amount in buckets:
+            self.buckets[slot] = amount
+        self.total = sum(self.buckets)
+
+
+class Velocity:
+    """Outgoing amounts over the last hour and the last day."""
+
+    def __init__(self):
+        self.hourly = RollingWindow(60, 61)
+        self.daily = RollingWindow(3600, 25)
+
+    def check(self, amount, limit=None, hourly_limit=None, daily_limit=None, now=None):
+        """Raise ValueError when ``amount`` would break one of the limits."""
+        now = time.time() if now is None else now
+        if limit is not None and amount > limit:
+            raise ValueError(f"Amount exceeds the transaction limit of ${limit:.2f}.")
+        if hourly_limit is not None and self.hourly.sum(now) + amount > hourly_limit:
+            raise ValueError(f"Hourly limit of ${hourly_limit:.2f} would be exceeded.")
+        if daily_limit is not None and self.daily.sum(now) + amount > daily_limit:
+            raise ValueError(f"Daily limit of ${daily_limit:.2f} would be exceeded.")
+
+    def record(self, amount, now=None):
+        now = time.time() if now is None else now
+        self.hourly.add(amount, now)
+        self.daily.add(amount, now)
+        return now
+
+    def dumps(self):
+        return json.dumps(
+            {"hourly": self.hourly.state(), "daily": self.daily.state()},
+            separators=(",", ":"),
+        )
+
+    @classmethod
+    def loads(cls, text):
+        velocity = cls()
+        if text:
+            state = json.loads(text)
+            velocity.hourly.restore(state["hourly"])
+            velocity.daily.restore(state["daily"])
+        return velocity
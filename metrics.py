@@ -0,0 +1,259 @@
+"""
+Per-operation metrics for UserActions and AdminActions.
+
+instrument() wraps the operations of a class (deposits, transfers, admin
+actions, ...) and its internal hot spots (save_to_file, read_from_file,
+is_account_frozen, log_action). Every wrapped call counts towards
+``bank_calls_total`` and a latency histogram, ``bank_duration_seconds``.
+
+Operations also count failures in ``bank_errors_total`` by kind: frozen,
+validation, not_found, io or other. An operation that handles its own error
+reports the kind through ``log_action(..., error=...)``, which calls
+note_error(). One that raises is classified by its exception. One that just
+returns False counts as other.
+
+The numbers are kept in process and exported in the Prometheus text format:
+
+- ``BANK_METRICS_FILE=/path/bank.prom`` writes them to that file at exit
+  (node_exporter's textfile collector reads such files); write_textfile() does
+  the same on demand.
+- start_http_server(port) serves them at ``http://host:port/metrics``
+  (``python server.py --metrics-port N``).
+
+``BANK_PROFILE=deposit_amount,transfer_amount`` (or ``all``) also runs those
+operations under cProfile; the merged stats are written to
+``<BANK_PROFILE_DIR>/<Class>.<operation>.prof`` (default: ``profiles`` under
+the data root) at exit, for ``python -m pstats``.
+"""
+
+import atexit
+import bisect
+import cProfile
+import functools
+import http.server
+import os
+import pstats
+import threading
+import time
+
+from storage import AccountNotFoundError
+
+BUCKETS = [0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5]
+ERROR_KINDS = ["frozen", "validation", "not_found", "io", "other"]
+
+
+def error_kind(error):
+    """Classify an exception as one of ERROR_KINDS."""
+    if isinstance(error, AccountNotFoundError):
+        return "not_found"
+    if isinstance(error, OSError):
+        return "io"
+    if isinstance(error, ValueError):
+        return "validation"
+    return "other"
+
+
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._errors = {}
+        # (class, operation) -> [bucket counts..., count, sum]
+        self._latency = {}
+        self._local = threading.local()
+        self._profiled = set()
+        self._profiles = {}
+
+    def observe(self, key, elapsed, error=None):
+        with self._lock:
+            self._calls[key] = self._calls.get(key, 0) + 1
+            if error is not None:
+                self._errors[key + (error,)] = self._errors.get(key + (error,), 0) + 1
+            histogram = self._latency.get(key)
+            if histogram is None:
+                histogram = self._latency[key] = [0] * (len(BUCKETS) + 2)
+            histogram[bisect.bisect_left(BUCKETS, elapsed)] += 1
+            histogram[-1] += elapsed
+
+    def note_error(self, kind):
+        """Record why the operation running on this thread failed."""
+        frames = getattr(self._local, "frames", None)
+        if frames:
+            frames[-1][0] = kind
+
+    def profile(self, operations):
+        """Run these operation names (or "all") under cProfile."""
+        self._profiled = set(operations)
+
+    def _run(self, key, method, args, kwargs, operation):
+        if not operation:
+            begin = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                self.observe(key, time.perf_counter() - begin)
+
+        frames = getattr(self._local, "frames", None)
+        if frames is None:
+            frames = self._local.frames = []
+        frame = [None]
+        frames.append(frame)
+        profiler = None
+        if "all" in self._profiled or key[1] in self._profiled:
+            profiler = cProfile.Profile()
+        begin = time.perf_counter()
+        try:
+            if profiler is not None:
+                result = profiler.runcall(method, *args, **kwargs)
+            else:
+                result = method(*args, **kwargs)
+        except Exception as e:
+            frame[0] = frame[0] or error_kind(e)
+            raise
+        finally:
+            elapsed = time.perf_counter() - begin
+            frames.pop()
+            if profiler is not None:
+                self._merge_profile(key, profiler)
+        if result is False and frame[0] is None:
+            frame[0] = "other"
+        self.observe(key, elapsed, frame[0])
+        return result
+
+    def _merge_profile(self, key, profiler):
+        with self._lock:
+            stats = self._profiles.get(key)
+            if stats is None:
+                self._profiles[key] = pstats.Stats(profiler)
+            else:
+                stats.add(profiler)
+
+    def dump_profiles(self, directory):
+        with self._lock:
+            profiles = list(self._profiles.items())
+        if not profiles:
+            return []
+        os.makedirs(directory, exist_ok=True)
+        written = []
+        for (cls_name, operation), stats in profiles:
+            path = os.path.join(directory, f"{cls_name}.{operation}.prof")
+            stats.dump_stats(path)
+            written.append(path)
+        return written
+
+    def render(self):
+        """Return every metric in the Prometheus text exposition format."""
+        with self._lock:
+            calls = dict(self._calls)
+            errors = dict(self._errors)
+            latency = {key: list(h) for key, h in self._latency.items()}
+        lines = [
+            "# HELP bank_calls_total Calls per operation.",
+            "# TYPE bank_calls_total counter",
+        ]
+        for (cls_name, operation), count in sorted(calls.items()):
+            lines.append(
+                f'bank_calls_total{{class="{cls_name}",operation="{operation}"}} '
+                f"{count}"
+            )
+        lines += [
+            "# HELP bank_errors_total Failed operations by kind of failure.",
+            "# TYPE bank_errors_total counter",
+        ]
+        for (cls_name, operation, kind), count in sorted(errors.items()):
+            lines.append(
+                f'bank_errors_total{{class="{cls_name}",operation="{operation}",'
+                f'kind="{kind}"}} {count}'
+            )
+        lines += [
+            "# HELP bank_duration_seconds Latency per operation.",
+            "# TYPE bank_duration_seconds histogram",
+        ]
+        for (cls_name, operation), histogram in sorted(latency.items()):
+            labels = f'class="{cls_name}",operation="{operation}"'
+            cumulative = 0
+            for bound, count in zip(BUCKETS + ["+Inf"], histogram):
+                cumulative += count
+                lines.append(
+                    f'bank_duration_seconds_bucket{{{labels},le="{bound}"}} '
+                    f"{cumulative}"
+                )
+            lines.append(f"bank_duration_seconds_sum{{{labels}}} {histogram[-1]}")
+            lines.append(f"bank_duration_seconds_count{{{labels}}} {cumulative}")
+        return "\n".join(lines) + "\n"
+
+    def write_textfile(self, path):
+        # Written to a temporary file first so a scraper never reads half a file.
+        with open(f"{path}.tmp", "w") as f:
+            f.write(self.render())
+        os.replace(f"{path}.tmp", path)
+
+    def reset(self):
+        with self._lock:
+            self._calls.clear()
+            self._errors.clear()
+            self._latency.clear()
+            self._profiles.clear()
+
+
+metrics = Metrics()
+
+
+def instrument(cls, operations, hot_spots=()):
+    """Wrap ``cls``'s methods in place: operations and timed-only hot spots."""
+    for name in [*operations, *hot_spots]:
+        attribute = cls.__dict__[name]
+        wrapper_type = None
+        if isinstance(attribute, (classmethod, staticmethod)):
+            wrapper_type = type(attribute)
+            attribute = attribute.__func__
+        method = _wrap(attribute, (cls.__name__, name), name in operations)
+        setattr(cls, name, wrapper_type(method) if wrapper_type else method)
+
+
+def _wrap(method, key, operation):
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        return metrics._run(key, method, args, kwargs, operation)
+
+    return wrapper
+
+
+class _MetricsHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = metrics.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_http_server(port, host="127.0.0.1"):
+    """Serve /metrics on a daemon thread; returns the HTTP server."""
+    server = http.server.ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(
+        target=server.serve_forever, name="metrics-http", daemon=True
+    ).start()
+    return server
+
+
+def _at_exit():
+    from paths import resolver
+
+    if os.environ.get("BANK_METRICS_FILE"):
+        metrics.write_textfile(os.environ["BANK_METRICS_FILE"])
+    metrics.dump_profiles(
+        os.environ.get("BANK_PROFILE_DIR") or resolver.path("profiles")
+    )
+
+
+if os.environ.get("BANK_PROFILE"):
+    metrics.profile(os.environ["BANK_PROFILE"].split(","))
+atexit.register(_at_exit)
@@ -0,0 +1,201 @@
+"""
+Month-end batch job: interest accrual and maintenance fees for every account.
+
+For the given period each account gets, through the same path
+UserActions.add_transaction uses:
+
+- an "Interest" transaction of balance * rate / 12, when the balance is
+  positive;
+- a "Fee" transaction when the balance is below a minimum (never more than
+  the balance).
+
+Frozen accounts are skipped. Each account remembers the last period it was
+processed for (``last_month_end``), so it is never charged twice.
+
+The accounts are split into 256 partitions by a hash of the account number,
+and the partitions run on a ProcessPoolExecutor. A checkpoint file
+(``month_end_<period>.json`` in the data root) lists the finished partitions,
+so an interrupted run started again with the same period resumes where it
+stopped.
+
+Usage: python month_end.py PERIOD [--interest-rate R] [--fee F]
+       [--fee-below B] [--workers N] [--restart]
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from paths import resolver
+
+PARTITIONS = 256
+
+
+def partition_of(account_number):
+    return int(hashlib.md5(str(account_number).encode()).hexdigest()[:2], 16)
+
+
+def checkpoint_file(period):
+    return resolver.path(f"month_end_{period}.json")
+
+
+def read_checkpoint(period):
+    try:
+        with open(checkpoint_file(period), "r") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def write_checkpoint(period, checkpoint):
+    path = checkpoint_file(period)
+    with open(f"{path}.tmp", "w") as f:
+        json.dump(checkpoint, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(f"{path}.tmp", path)
+
+
+def apply_rules(account, period, rules):
+    """
+    Post this period's interest and fee to one account. Returns the
+    (interest, fee) amounts posted.
+    """
+    interest = 0.0
+    fee = 0.0
+    if account.balance > 0 and rules["interest_rate"]:
+        interest = round(account.balance * rules["interest_rate"] / 12, 2)
+    if interest > 0:
+        account.balance += interest
+        transaction = account.new_transaction("Interest", interest, period=period)
+        account.record_transaction(transaction)
+    if account.balance < rules["fee_below"] and rules["fee"]:
+        fee = round(min(rules["fee"], max(account.balance, 0)), 2)
+    if fee > 0:
+        account.balance -= fee
+        transaction = account.new_transaction("Fee", fee, period=period)
+        account.record_transaction(transaction)
+    account.last_month_end = period
+    account.persist()
+    return interest, fee
+
+
+def run_partition(partition, account_numbers, period, rules):
+    """Worker: process one partition; returns its totals."""
+    from audit_log import audit_logger
+    from project import UserActions
+    from storage import get_storage
+    from transfers import AccountLocks
+
+    locks = AccountLocks()
+    totals = {
+        "partition": partition,
+        "processed": 0,
+        "already_done": 0,
+        "frozen": 0,
+        "failed": 0,
+        "interest": 0.0,
+        "fees": 0.0,
+    }
+    for account_number in account_numbers:
+        try:
+            with locks.locked(account_number):
+                account = UserActions.load(account_number)
+                if account.last_month_end == period:
+                    totals["already_done"] += 1
+                    continue
+                if account.is_account_frozen():
+                    totals["frozen"] += 1
+                    continue
+                interest, fee = apply_rules(account, period, rules)
+        except (OSError, ValueError) as e:
+            totals["failed"] += 1
+            print(f"Could not process account {account_number}: {e}")
+            continue
+        totals["processed"] += 1
+        totals["interest"] += interest
+        totals["fees"] += fee
+    # Pool workers exit without running atexit handlers.
+    audit_logger.flush()
+    get_storage().close()
+    return totals
+
+
+def run(period, rules, workers=None, restart=False):
+    from storage import get_storage
+    from transfers import TransferEngine
+
+    TransferEngine().recover()
+    checkpoint = None if restart else read_checkpoint(period)
+    if checkpoint is not None and checkpoint["rules"] != rules:
+        raise ValueError(
+            f"A run for {period} used different rules; pass --restart to ignore it."
+        )
+    if checkpoint is None:
+        checkpoint = {"period": period, "rules": rules, "done": [], "totals": {}}
+    done = set(checkpoint["done"])
+    if done:
+        print(f"Resuming {period}: {len(done)} of {PARTITIONS} partition(s) done.")
+
+    partitions = [[] for _ in range(PARTITIONS)]
+    for account_number in get_storage().list_account_numbers():
+        partitions[partition_of(account_number)].append(account_number)
+    pending = [i for i in range(PARTITIONS) if i not in done]
+
+    start = time.perf_counter()
+    processed = 0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            pool.submit(run_partition, i, partitions[i], period, rules) for i in pending
+        ]
+        for future in as_completed(futures):
+            totals = future.result()
+            for key, value in totals.items():
+                if key != "partition":
+                    checkpoint["totals"][key] = checkpoint["totals"].get(key, 0) + value
+            checkpoint["done"].append(totals["partition"])
+            write_checkpoint(period, checkpoint)
+            processed += sum(
+                totals[k] for k in ["processed", "already_done", "frozen", "failed"]
+            )
+    elapsed = time.perf_counter() - start
+
+    totals = checkpoint["totals"]
+    print(
+        f"{period}: {totals.get('processed', 0)} account(s) processed, "
+        f"{totals.get('already_done', 0)} already done, "
+        f"{totals.get('frozen', 0)} frozen, {totals.get('failed', 0)} failed."
+    )
+    print(
+        f"Interest posted: ${totals.get('interest', 0):.2f}, "
+        f"fees charged: ${totals.get('fees', 0):.2f}."
+    )
+    print(
+        f"{processed} account(s) in {elapsed:.2f}s "
+        f"({processed / elapsed if elapsed else 0:.0f} accounts/s)."
+    )
+    return checkpoint
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Post month-end interest and fees.")
+    parser.add_argument("period", help="YYYY-MM")
+    parser.add_argument("--interest-rate", type=float, default=0.02, help="annual")
+    parser.add_argument("--fee", type=float, default=0.0)
+    parser.add_argument("--fee-below", type=float, default=0.0)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--restart", action="store_true")
+    args = parser.parse_args()
+    rules = {
+        "interest_rate": args.interest_rate,
+        "fee": args.fee,
+        "fee_below": args.fee_below,
+    }
+    try:
+        run(args.period, rules, args.workers, args.restart)
+    except ValueError as e:
+        print(e)
+        raise SystemExit(1)
@@ -0,0 +1,192 @@
+"""
+Path resolver for the on-disk data layout.
+
+All data lives under a data root (``BANK_DATA_ROOT``, default: the current
+directory). Per-account files are spread over hash-based shard directories so
+no single directory holds millions of entries::
+
+    <root>/accounts/3f/a2/account_1001.txt
+    <root>/accounts/3f/a2/journal_1001.txt
+    <root>/accounts/3f/a2/segments_1001/
+    <root>/logs/3f/a2/log_1001.txt
+    <root>/logs/3f/a2/log_1001.archive/
+    <root>/admin_log.txt
+    <root>/admin_log.archive/
+    <root>/frozen_accounts.txt
+
+The number of two-hex-digit shard levels comes from ``BANK_SHARD_LEVELS``
+(default 2; 0 disables sharding). Files from the old flat layout are
+moved into place with ``python paths.py migrate [source directory]``.
+"""
+
+import functools
+import hashlib
+import os
+import re
+import shutil
+import sys
+
+ACCOUNT_FILE_PATTERN = re.compile(r"^account_(.+)\.txt$")
+SEGMENTS_PATTERN = re.compile(r"^segments_(.+)$")
+LOG_ARCHIVE_PATTERN = re.compile(r"^log_(.+)\.archive$")
+# Directories that belong to one account and move as a whole.
+DIRECTORY_PATTERNS = [SEGMENTS_PATTERN, LOG_ARCHIVE_PATTERN]
+PER_ACCOUNT_FILES = [
+    ("accounts", re.compile(r"^account_(.+)\.(?:txt|lock)$")),
+    ("accounts", re.compile(r"^(?:journal|index)_(.+)\.txt$")),
+    ("accounts", SEGMENTS_PATTERN),
+    ("logs", re.compile(r"^log_(.+)\.txt$")),
+    ("logs", LOG_ARCHIVE_PATTERN),
+]
+INDEX_FILE = "account_index.txt"
+SHARED_FILES = [
+    "admin_log.txt",
+    "admin_log.archive",
+    "frozen_accounts.txt",
+    "pending_transfers",
+    "pending_compactions",
+    "wal",
+    "changefeed",
+    "analytics",
+]
+
+
+class PathResolver:
+    def __init__(self, root=".", levels=2):
+        self.configure(root, levels)
+
+    def configure(self, root=".", levels=2):
+        self.root = root
+        self.levels = levels
+        self._created = set()
+        self._shard.cache_clear()
+
+    @functools.lru_cache(maxsize=65536)
+    def _shard(self, account_number):
+        digest = hashlib.md5(str(account_number).encode()).hexdigest()
+        return [digest[2 * i : 2 * i + 2] for i in range(self.levels)]
+
+    def _directory(self, kind, account_number):
+        directory = os.path.join(self.root, kind, *self._shard(account_number))
+        if directory not in self._created:
+            os.makedirs(directory, exist_ok=True)
+            self._created.add(directory)
+        return directory
+
+    def path(self, name):
+        return os.path.join(self.root, name)
+
+    def account_file(self, account_number):
+        return os.path.join(
+            self._directory("accounts", account_number),
+            f"account_{account_number}.txt",
+        )
+
+    def journal_file(self, account_number):
+        return os.path.join(
+            self._directory("accounts", account_number),
+            f"journal_{account_number}.txt",
+        )
+
+    def lock_file(self, account_number):
+        return os.path.join(
+            self._directory("accounts", account_number),
+            f"account_{account_number}.lock",
+        )
+
+    def index_file(self, account_number):
+        return os.path.join(
+            self._directory("accounts", account_number),
+            f"index_{account_number}.txt",
+        )
+
+    def log_file(self, account_number):
+        return os.path.join(
+            self._directory("logs", account_number), f"log_{account_number}.txt"
+        )
+
+    def admin_log_file(self):
+        return self.path("admin_log.txt")
+
+    def frozen_accounts_file(self):
+        return self.path("frozen_accounts.txt")
+
+    def pending_transfers_dir(self):
+        return self.path("pending_transfers")
+
+    def pending_compactions_dir(self):
+        return self.path("pending_compactions")
+
+    def wal_dir(self):
+        return self.path("wal")
+
+    def change_feed_dir(self):
+        return self.path("changefeed")
+
+    def analytics_dir(self):
+        return self.path("analytics")
+
+    def iter_account_numbers(self):
+        """Yield the number of every stored account, walking the shard tree."""
+        base = os.path.join(self.root, "accounts")
+        if not os.path.isdir(base):
+            return
+        for directory, _, filenames in os.walk(base):
+            for filename in filenames:
+                match = ACCOUNT_FILE_PATTERN.match(filename)
+                if match:
+                    yield match.group(1)
+
+    def migrate(self, source="."):
+        """
+        Move per-account files found anywhere under ``source`` (the old flat
+        layout, or a tree sharded with a different level count) into place.
+        """
+        moved = 0
+        found = []
+        for directory, dirnames, filenames in os.walk(source):
+            found.extend(os.path.join(directory, name) for name in filenames)
+            # Segment and log archive directories move as a whole.
+            for name in [
+                d for d in dirnames if any(p.match(d) for p in DIRECTORY_PATTERNS)
+            ]:
+                found.append(os.path.join(directory, name))
+                dirnames.remove(name)
+        for path in found:
+            name = os.path.basename(path)
+            for kind, pattern in PER_ACCOUNT_FILES:
+                match = pattern.match(name)
+                if match:
+                    target = os.path.join(self._directory(kind, match.group(1)), name)
+                    if os.path.abspath(path) != os.path.abspath(target):
+                        shutil.move(path, target)
+                        moved += 1
+                    break
+        for name in SHARED_FILES:
+            source_path = os.path.join(source, name)
+            if os.path.exists(source_path) and os.path.abspath(
+                source_path
+            ) != os.path.abspath(self.path(name)):
+                os.makedirs(self.root, exist_ok=True)
+                shutil.move(source_path, self.path(name))
+                moved += 1
+        if moved:
+            # Its locations are stale now; it is rebuilt on next use.
+            for index in {os.path.join(source, INDEX_FILE), self.path(INDEX_FILE)}:
+                if os.path.exists(index):
+                    os.remove(index)
+        return moved
+
+
+resolver = PathResolver(
+    os.environ.get("BANK_DATA_ROOT", "."),
+    int(os.environ.get("BANK_SHARD_LEVELS", "2")),
+)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] != "migrate":
+        print("Usage: python paths.py migrate [source directory]")
+        sys.exit(1)
+    source = sys.argv[2] if len(sys.argv) > 2 else "."
+    print(f"Moved {resolver.migrate(source)} file(s) into {resolver.root}.")
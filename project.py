@@ -1,6 +1,31 @@
-import datetime
+import collections
+import contextlib
+import csv
+import itertools
 import os
 
+from account_cache import AccountRepository
+from audit_log import audit_logger
+from changefeed import admin_event, change_feed
+from fraud import detectors
+from history import TransactionHistory
+from limits import Velocity
+from metrics import error_kind, instrument, metrics
+from paths import resolver
+from statements import filter_transactions, format_statement_line
+from storage import get_storage
+from transaction import Transaction, to_cents, validate_amount
+from transfers import TransferEngine
+
+# Bulk admin operations lock and save accounts this many at a time.
+BULK_CHUNK_SIZE = 500
+BULK_REPORT_FIELDS = ["account_number", "status", "message"]
+# Passed as a daily or hourly limit to leave it as it is; None removes it.
+UNCHANGED = object()
+# Header fields UserActions.refresh() derives from the stored snapshot plus
+# the unsaved changes, rather than taking this copy's value when it differs.
+REBASED_FIELDS = {"balance", "velocity", "transaction_count", "last_transaction"}
+
 
 class UserActions:
     def __init__(self):
@@ -11,7 +36,29 @@ class UserActions:
         self.account_number = None
         self.pin = None
         self.balance = 0
-        self.transaction_history = []
+        self.transaction_limit = None
+        self.daily_limit = None
+        self.hourly_limit = None
+        # Rolling totals of outgoing amounts, checked against the limits.
+        self.velocity = Velocity()
+        # Snapshot summary of the stored history, kept without loading it.
+        self.transaction_count = 0
+        self.last_transaction = None
+        # Last period month_end.py posted interest and fees for.
+        self.last_month_end = None
+        self._transaction_history = []
+        # With autosave off, changes stay in memory until flush() is called.
+        self.autosave = True
+        self.dirty = False
+        self.unsaved_transactions = []
+        # (amount, time) of outgoing amounts recorded since the last save.
+        self.unsaved_outgoing = []
+        # The stored snapshot this copy is based on; see refresh().
+        self._base = None
+        # Set while locked() holds the lock over a fresh snapshot.
+        self._fresh = False
+        # The write-back AccountRepository caching this copy, if any.
+        self.repository = None
 
     def prompt_user_info(self, candidate_name):
         self.owner_id = input("Enter your owner ID: ")
@@ -20,197 +67,276 @@ class UserActions:
         self.salary = float(input("Enter your salary: "))
         self.account_number = input("Enter your account number: ")
         self.pin = input("Enter your PIN: ")[::-1]  # reversing pin for encryption
-        self.save_to_file()
+        self.save_to_file(rewrite_journal=True)
 
     def is_account_frozen(self):
-        if not os.path.exists("frozen_accounts.txt"):
-            return False
-        with open("frozen_accounts.txt", "r") as f:
-            frozen_accounts = f.read().splitlines()
-        return self.account_number in frozen_accounts
+        return get_storage().is_frozen(self.account_number)
 
     def add_transaction(self, transaction_type, amount, recipient_account=None):
         if self.is_account_frozen():
-            self.log_action("Add Transaction", f"Failed - Account is frozen")
+            self.log_action(
+                "Add Transaction", f"Failed - Account is frozen", error="frozen"
+            )
             print(
                 "Sorry, your account is frozen. Contact admin to unfreeze the account."
             )
-            return
-        transaction = {
-            "date": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            "type": transaction_type,
-            "amount": amount,
-            "recipient": recipient_account,
-        }
-        self.transaction_history.append(transaction)
-        self.save_to_file()
+            return False
+        transaction = self.new_transaction(transaction_type, amount, recipient_account)
+        self.record_transaction(transaction)
+        self.persist()
+        return True
+
+    def new_transaction(
+        self, transaction_type, amount, recipient_account=None, **extra
+    ):
+        return Transaction.create(transaction_type, amount, recipient_account, **extra)
+
+    @property
+    def balance(self):
+        return self.balance_cents / 100
+
+    @balance.setter
+    def balance(self, amount):
+        # Held in whole cents so repeated arithmetic never drifts.
+        self.balance_cents = to_cents(amount)
+
+    @property
+    def transaction_history(self):
+        # Loaded accounts only read their snapshot; the stored history is a
+        # view whose records are decoded as they are read.
+        if self._transaction_history is None:
+            self._transaction_history = TransactionHistory(
+                get_storage().history(self.account_number), self.unsaved_transactions
+            )
+        return self._transaction_history
+
+    @transaction_history.setter
+    def transaction_history(self, transactions):
+        self._transaction_history = transactions
+
+    def record_transaction(self, transaction):
+        if self._transaction_history is not None:
+            self._transaction_history.append(transaction)
+        self.unsaved_transactions.append(transaction)
+        self.transaction_count += 1
+        self.last_transaction = transaction["date"]
         self.log_action(
             "Add Transaction",
-            f"Type: {transaction_type},"
-            f" Amount: {amount}, "
-            f"Recipient: {recipient_account}",
+            f"Type: {transaction['type']},"
+            f" Amount: {transaction['amount']}, "
+            f"Recipient: {transaction['recipient']}",
         )
+        detectors.observe(self.account_number, transaction)
+
+    def record_outgoing(self, amount):
+        self.unsaved_outgoing.append((amount, self.velocity.record(amount)))
+
+    def discard_transaction(self, transaction):
+        """Undo record_transaction() for a change that was not committed."""
+        if self._transaction_history is not None:
+            self._transaction_history.remove(transaction)
+        self.unsaved_transactions.remove(transaction)
+        self.transaction_count -= 1
 
     def deposit_amount(self, amount):
         if self.is_account_frozen():
-            self.log_action("Deposit", f"Failed - Account is frozen")
+            self.log_action("Deposit", f"Failed - Account is frozen", error="frozen")
             print(
                 "Sorry, your account is frozen. Contact admin to unfreeze the account."
             )
-            return
+            return False
         try:
-            if amount <= 0:
-                raise ValueError(
-                    "Invalid deposit amount. Amount must be greater than zero."
-                )
-            self.balance += amount
-            self.add_transaction("Deposit", amount)
+            validate_amount(amount, "deposit")
+            with self.locked():
+                self.balance += amount
+                self.add_transaction("Deposit", amount)
             print(
                 f"Successful deposit of ${amount:.2f}. Current balance is: ${self.balance:.2f}"
             )
             self.log_action("Deposit", f"Amount: {amount}, New Balance: {self.balance}")
+            return True
         except ValueError as e:
-            self.log_action("Deposit", f"Failed - {e}")
+            self.log_action("Deposit", f"Failed - {e}", error="validation")
             print(e)
         except Exception as e:
-            self.log_action("Deposit", f"Failed - {str(e)}")
+            self.log_action("Deposit", f"Failed - {str(e)}", error=error_kind(e))
             print("OOPS! An unexpected error occurred:", str(e))
+        return False
 
     def check_amount(self):
         if self.is_account_frozen():
-            self.log_action("Check Balance", f"Failed - Account is frozen")
+            self.log_action(
+                "Check Balance", f"Failed - Account is frozen", error="frozen"
+            )
             print(
                 "Sorry, your account is frozen. Contact admin to unfreeze the account."
             )
-            return
+            return False
         print(f"Your current balance is: ${self.balance:.2f}")
         self.log_action("Check Balance", f"Current Balance: {self.balance}")
+        return True
+
+    def statement(self, start=None, end=None, types=None, page=1, page_size=None):
+        """
+        Iterate over this account's transactions, optionally limited to a
+        date range, a set of transaction types and one page of results.
+        """
+        if self.unsaved_transactions:
+            if self._transaction_history is not None:
+                transactions = self._transaction_history
+            else:
+                transactions = itertools.chain(
+                    get_storage().iter_transactions(self.account_number),
+                    self.unsaved_transactions,
+                )
+            return filter_transactions(transactions, start, end, types, page, page_size)
+        return get_storage().iter_transactions(
+            self.account_number, start, end, types, page, page_size
+        )
 
-    def print_statement(self):
+    def print_statement(self, start=None, end=None, types=None, page=1, page_size=None):
         if self.is_account_frozen():
-            self.log_action("Print Statement", f"Failed - Account is frozen")
+            self.log_action(
+                "Print Statement", f"Failed - Account is frozen", error="frozen"
+            )
             print(
                 "Sorry, your account is frozen. Contact admin to unfreeze the account."
             )
-            return
+            return False
         try:
             print(f"Statement for Account Number {self.account_number}:")
-            if not self.transaction_history:
+            found = False
+            for transaction in self.statement(start, end, types, page, page_size):
+                found = True
+                print(format_statement_line(transaction))
+            if not found:
                 print("No transactions found for corresponding account number.")
-            else:
-                for transaction in self.transaction_history:
-                    print(
-                        f"{transaction['date']}: {transaction['type']}, ${transaction['amount']:.2f}"
-                    )
             self.log_action("Print Statement", "Success")
+            return True
         except Exception as e:
-            self.log_action("Print Statement", f"Failed - {e}")
+            self.log_action("Print Statement", f"Failed - {e}", error=error_kind(e))
             print(f"Error: {e}")
+        return False
 
     def transfer_amount(self, recipient, amount):
         if self.is_account_frozen():
-            self.log_action("Transfer", f"Failed - Account is frozen")
+            self.log_action("Transfer", f"Failed - Account is frozen", error="frozen")
             print(
                 "Sorry, your account is frozen. Contact admin to unfreeze the account."
             )
-            return
+            return False
         try:
-            if amount <= 0:
-                raise ValueError(
-                    "INVALID transfer amount. Amount must be greater than zero."
-                )
-            if self.balance >= amount:
-                self.balance -= amount
-                recipient.balance += amount
-                self.add_transaction("Transfer", amount, recipient.account_number)
-                print(
-                    f"Transfer of ${amount:.2f} to {recipient.account_number} is successful."
-                )
-                self.log_action(
-                    "Transfer",
-                    f"Amount: {amount}, Recipient: {recipient.account_number}",
-                )
-            else:
-                raise ValueError("Insufficient balance for transfer.")
+            validate_amount(amount, "transfer")
+            transfer_engine.transfer(self, recipient, amount)
+            print(
+                f"Transfer of ${amount:.2f} to {recipient.account_number} is successful."
+            )
+            self.log_action(
+                "Transfer",
+                f"Amount: {amount}, Recipient: {recipient.account_number}",
+            )
+            return True
         except ValueError as e:
-            self.log_action("Transfer", f"Failed - {e}")
+            self.log_action("Transfer", f"Failed - {e}", error="validation")
             print(f"Error: {e}")
+        return False
 
     def withdraw(self, amount):
         if self.is_account_frozen():
-            self.log_action("Withdraw", f"Failed - Account is frozen")
+            self.log_action("Withdraw", f"Failed - Account is frozen", error="frozen")
             print(
                 "Sorry, your account is frozen. Contact admin to unfreeze the account."
             )
-            return
+            return False
         try:
-            if amount <= 0:
-                raise ValueError(
-                    "Invalid withdrawal amount. Amount must be greater than zero."
-                )
-            if self.balance >= amount:
+            validate_amount(amount, "withdrawal")
+            with self.locked():
+                self.check_limits(amount)
+                if self.balance < amount:
+                    raise ValueError("Insufficient balance.")
                 self.balance -= amount
+                self.record_outgoing(amount)
                 self.add_transaction("Withdrawal", amount)
-                print(
-                    f"Withdrawal of ${amount:.2f} is successful. Now, the Current balance is: ${self.balance:.2f}"
-                )
-                self.log_action(
-                    "Withdraw", f"Amount: {amount}, New Balance: {self.balance}"
-                )
-            else:
-                raise ValueError("Insufficient balance.")
+            print(
+                f"Withdrawal of ${amount:.2f} is successful. Now, the Current balance is: ${self.balance:.2f}"
+            )
+            self.log_action(
+                "Withdraw", f"Amount: {amount}, New Balance: {self.balance}"
+            )
+            return True
         except ValueError as e:
-            self.log_action("Withdraw", f"Failed - {e}")
+            self.log_action("Withdraw", f"Failed - {e}", error="validation")
             print(f"Error: {e}")
+        return False
 
-    def change_pin(self):
+    def change_pin(self, current_pin=None, new_pin=None):
         if self.is_account_frozen():
-            self.log_action("Change PIN", f"Failed - Account is frozen")
+            self.log_action("Change PIN", f"Failed - Account is frozen", error="frozen")
             print(
                 "Sorry, your account is frozen. Contact admin to unfreeze the account."
             )
-            return
+            return False
         try:
-            current_pin = input("Enter your current PIN: ")
+            if current_pin is None:
+                current_pin = input("Enter your current PIN: ")
             if self.pin != current_pin[::-1]:
                 raise ValueError("Current PIN is incorrect.")
-            new_pin = input("Please enter your new PIN: ")
+            if new_pin is None:
+                new_pin = input("Please enter your new PIN: ")
             if len(new_pin) != 4:
                 raise ValueError("PIN must be exactly 4 digits!")
-            self.pin = new_pin[::-1]
+            with self.locked():
+                self.pin = new_pin[::-1]
+                self.persist()
             print("PIN changed successfully.")
-            self.save_to_file()
             self.log_action("Change PIN", "Success")
+            return True
         except ValueError as e:
-            self.log_action("Change PIN", f"Failed - {e}")
+            self.log_action("Change PIN", f"Failed - {e}", error="validation")
             print(f"Error: {e}")
         except Exception as e:
-            self.log_action("Change PIN", f"Failed - {str(e)}")
+            self.log_action("Change PIN", f"Failed - {str(e)}", error=error_kind(e))
             print("An unexpected error occurred:", str(e))
+        return False
 
-    def show_transaction_history(self):
+    def show_transaction_history(
+        self, start=None, end=None, types=None, page=1, page_size=None
+    ):
         if self.is_account_frozen():
-            self.log_action("Show Transaction History", f"Failed - Account is frozen")
+            self.log_action(
+                "Show Transaction History",
+                f"Failed - Account is frozen",
+                error="frozen",
+            )
             print(
                 "Sorry, your account is frozen. Contact admin to unfreeze the account."
             )
-            return
+            return False
         try:
             print(f"Transaction History for Account Number: {self.account_number}:")
-            if not self.transaction_history:
+            found = False
+            for transaction in self.statement(start, end, types, page, page_size):
+                found = True
+                print(format_statement_line(transaction))
+            if not found:
                 print("No transactions found:(")
-            else:
-                for transaction in self.transaction_history:
-                    print(
-                        f"{transaction['date']}: {transaction['type']}, ${transaction['amount']:.2f}"
-                    )
             self.log_action("Show Transaction History", "Success")
+            return True
         except Exception as e:
-            self.log_action("Show Transaction History", f"Failed - {e}")
+            self.log_action(
+                "Show Transaction History", f"Failed - {e}", error=error_kind(e)
+            )
             print(f"Error: {e}")
+        return False
 
-    def save_to_file(self):
-        account_details = {
+    def check_limits(self, amount):
+        """Raise ValueError when an outgoing ``amount`` breaks a limit."""
+        self.velocity.check(
+            amount, self.transaction_limit, self.hourly_limit, self.daily_limit
+        )
+
+    def header_details(self):
+        return {
             "owner_id": self.owner_id,
             "name": self.name,
             "age": self.age,
@@ -218,45 +344,148 @@ class UserActions:
             "account_number": self.account_number,
             "pin": self.pin,
             "balance": self.balance,
-            "transaction_history": self.transaction_history,
+            "transaction_limit": self.transaction_limit,
+            "daily_limit": self.daily_limit,
+            "hourly_limit": self.hourly_limit,
+            "velocity": self.velocity.dumps(),
+            "transaction_count": self.transaction_count,
+            "last_transaction": self.last_transaction,
+            "last_month_end": self.last_month_end,
         }
-        filename = f"account_{self.account_number}.txt"
-        with open(filename, "w") as f:
-            for k, val in account_details.items():
-                f.write(f"{k}: {val}\n")
-
-    def log_action(self, action, details):
-        filename = f"log_{self.account_number}.txt"
-        with open(filename, "a") as f:
-            f.write(
-                f"{datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')} - {action}: {details}\n"
+
+    def save_to_file(self, rewrite_journal=False):
+        """
+        Save the profile and, when requested, replace the stored transaction
+        history with this account's in-memory history.
+        """
+        if rewrite_journal:
+            self.transaction_count = len(self.transaction_history)
+            get_storage().replace_account(
+                self.header_details(), self.transaction_history
+            )
+        else:
+            get_storage().save_account(self.header_details())
+        self._base = self.header_details()
+
+    def flush(self):
+        # Written under the lock, on top of what other processes stored since
+        # this copy's snapshot was read.
+        with transfer_engine.locked(self.account_number):
+            if not self._fresh:
+                self.refresh()
+            get_storage().save_account(
+                self.header_details(), self.unsaved_transactions, publish=True
+            )
+        self.mark_saved()
+
+    @staticmethod
+    def flush_many(accounts):
+        with transfer_engine.locked(*[a.account_number for a in accounts]):
+            for account in accounts:
+                if not account._fresh:
+                    account.refresh()
+            get_storage().save_accounts(
+                [(a.header_details(), a.unsaved_transactions) for a in accounts],
+                publish=True,
             )
+        for account in accounts:
+            account.mark_saved()
+
+    def mark_saved(self):
+        """Record that the stored snapshot now matches this copy."""
+        self.unsaved_transactions = []
+        self.unsaved_outgoing = []
+        self.dirty = False
+        self._base = self.header_details()
+
+    def persist(self):
+        if self.autosave:
+            self.flush()
+        else:
+            self.dirty = True
+
+    def log_action(self, action, details, error=None):
+        if error is not None:
+            metrics.note_error(error)
+        audit_logger.log(resolver.log_file(self.account_number), action, details)
+
+    @classmethod
+    def load(cls, account_number):
+        account = cls()
+        account._apply_snapshot(get_storage().load_account(account_number))
+        return account
+
+    def _apply_snapshot(self, account_data):
+        self.owner_id = account_data["owner_id"]
+        self.name = account_data["name"]
+        self.age = account_data["age"]
+        self.salary = account_data["salary"]
+        self.account_number = account_data["account_number"]
+        self.pin = account_data["pin"]
+        self.balance = account_data["balance"]
+        self.transaction_limit = account_data.get("transaction_limit")
+        self.daily_limit = account_data.get("daily_limit")
+        self.hourly_limit = account_data.get("hourly_limit")
+        self.velocity = Velocity.loads(account_data.get("velocity"))
+        self.last_transaction = account_data.get("last_transaction")
+        self.last_month_end = account_data.get("last_month_end")
+        self.transaction_history = None
+        if account_data.get("transaction_count") is None:
+            # Saved before snapshots carried a summary.
+            self.transaction_count = len(get_storage().history(self.account_number))
+        else:
+            self.transaction_count = account_data["transaction_count"]
+        self._base = account_data
+
+    def refresh(self):
+        """
+        Re-read the stored snapshot, which other processes may have changed
+        since this copy was loaded (or cached), and re-apply this copy's own
+        changes on top of it: its balance change, its unsaved transactions
+        and outgoing amounts, and the fields it changed.
+        """
+        try:
+            account_data = get_storage().load_account(self.account_number)
+        except FileNotFoundError:
+            return
+        base = self._base
+        if base is None:
+            # Never stored or loaded: there is nothing to rebase onto.
+            return
+        changed = {
+            key: value
+            for key, value in self.header_details().items()
+            if key not in REBASED_FIELDS and value != base.get(key)
+        }
+        cents = self.balance_cents - to_cents(base["balance"] or 0)
+        self._apply_snapshot(account_data)
+        for key, value in changed.items():
+            setattr(self, key, value)
+        self.balance_cents += cents
+        self.transaction_count += len(self.unsaved_transactions)
+        for amount, now in self.unsaved_outgoing:
+            self.velocity.record(amount, now)
+        if self.unsaved_transactions:
+            self.last_transaction = self.unsaved_transactions[-1]["date"]
+
+    @contextlib.contextmanager
+    def locked(self):
+        """Hold the account lock, with a fresh snapshot, while changing it."""
+        # A write-back repository keeps the lock until it flushes the change.
+        held = self.repository is not None and self.repository.hold(self)
+        with transfer_engine.locked(self.account_number):
+            if not held:
+                self.refresh()
+            self._fresh = True
+            try:
+                yield
+            finally:
+                self._fresh = False
 
     @classmethod
     def read_from_file(cls, account_number):
-        filename = f"account_{account_number}.txt"
         try:
-            with open(filename, "r") as f:
-                account_data = {}
-                for line in f:
-                    key, value = line.strip().split(": ", 1)
-                    if key == "transaction_history":
-                        account_data[key] = eval(value)
-                    elif key in ["age", "balance"]:
-                        account_data[key] = float(value) if "." in value else int(value)
-                    else:
-                        account_data[key] = value
-
-                account = cls()
-                account.owner_id = account_data["owner_id"]
-                account.name = account_data["name"]
-                account.age = account_data["age"]
-                account.salary = account_data["salary"]
-                account.account_number = account_data["account_number"]
-                account.pin = account_data["pin"]
-                account.balance = account_data["balance"]
-                account.transaction_history = account_data["transaction_history"]
-                return account
+            return account_repository.get(account_number)
         except FileNotFoundError:
             print(f"Account with number {account_number} does not exist.")
             return None
@@ -270,19 +499,36 @@ class AdminActions:
         self.accounts = {}
         self.transaction_limits = {}
 
-    def create_account(self):
+    def create_account(
+        self,
+        owner_id=None,
+        name=None,
+        age=None,
+        salary=None,
+        account_number=None,
+        pin=None,
+    ):
         try:
-            owner_id = input("Enter the owner's ID: ")
-            if owner_id in self.accounts:
+            if owner_id is None:
+                owner_id = input("Enter the owner's ID: ")
+            if owner_id in self.accounts or get_storage().find_accounts_by_owner(
+                owner_id
+            ):
                 print("An account already exists for this owner.")
-                return
-            name = input("Enter name: ")
+                return False
+            if name is None:
+                name = input("Enter name: ")
             if not name.isalpha():
                 raise ValueError("Name must be in string.")
-            age = int(input("Enter age: "))
-            salary = float(input("Enter salary: "))
-            account_number = input("Enter account number: ")
-            pin = input("Enter the PIN: ")
+            age = int(input("Enter age: ") if age is None else age)
+            salary = float(input("Enter salary: ") if salary is None else salary)
+            if account_number is None:
+                account_number = input("Enter account number: ")
+            if get_storage().account_exists(account_number):
+                print(f"Account '{account_number}' already exists.")
+                return False
+            if pin is None:
+                pin = input("Enter the PIN: ")
 
             new_account = UserActions()
             new_account.owner_id = owner_id
@@ -292,293 +538,604 @@ class AdminActions:
             new_account.account_number = account_number
             new_account.pin = pin[::-1]
             self.accounts[owner_id] = new_account
-            new_account.save_to_file()
+            new_account.save_to_file(rewrite_journal=True)
+            account_repository.put(new_account)
+            change_feed.publish(
+                [
+                    admin_event(
+                        "create_account", account_number, owner_id=owner_id, name=name
+                    )
+                ]
+            )
             print(f"Account '{account_number}' created successfully.")
             self.log_action(
                 "Create Account",
                 f"Owner ID: {owner_id}, Account Number: {account_number}",
             )
+            return True
         except ValueError as e:
-            self.log_action("Create Account", f"Failed - {e}")
+            self.log_action("Create Account", f"Failed - {e}", error="validation")
             print(f"Invalid input: {e}")
         except Exception as e:
-            self.log_action("Create Account", f"Failed - {str(e)}")
+            self.log_action("Create Account", f"Failed - {str(e)}", error=error_kind(e))
             print(f"An error occurred: {e}")
+        return False
 
-    def show_account_details(self):
+    def show_account_details(self, account_number=None):
         try:
-            account_number = input("Enter the account number to display details: ")
-            filename = f"account_{account_number}.txt"
+            if account_number is None:
+                account_number = input("Enter the account number to display details: ")
 
             try:
-                with open(filename, "r") as f:
-                    account_data = {}
-                    for line in f:
-                        key, value = line.strip().split(": ", 1)
-                        if key == "transaction_history":
-                            account_data[key] = eval(value)
-                        elif key in ["age", "balance", "salary"]:
-                            account_data[key] = (
-                                float(value) if "." in value else int(value)
-                            )
-                        else:
-                            account_data[key] = value
-
-                    print("Account details: ")
-                    print(
-                        f"Owner ID: {account_data.get('owner_id', '')}, "
-                        f"Name: {account_data.get('name', '')}, "
-                        f"Age: {account_data.get('age', '')}, "
-                        f"Salary: {float(account_data.get('salary', 0)):.2f}, "
-                        f"Account Number: {account_data.get('account_number', '')}"
-                    )
-                    self.log_action(
-                        "Show Account Details", f"Account Number: {account_number}"
-                    )
+                account = account_repository.get(account_number)
+                print("Account details: ")
+                print(
+                    f"Owner ID: {account.owner_id}, "
+                    f"Name: {account.name}, "
+                    f"Age: {account.age}, "
+                    f"Salary: {float(account.salary or 0):.2f}, "
+                    f"Account Number: {account.account_number}"
+                )
+                self.log_action(
+                    "Show Account Details", f"Account Number: {account_number}"
+                )
+                return True
 
             except FileNotFoundError:
                 print(" NO account found. Please create account first.")
                 self.log_action(
                     "Show Account Details",
                     f"Failed - Account {account_number} not found",
+                    error="not_found",
                 )
 
         except Exception as e:
-            self.log_action("Show Account Details", f"Failed - {e}")
+            self.log_action(
+                "Show Account Details", f"Failed - {e}", error=error_kind(e)
+            )
             print(f"An error occurred while displaying account details: {e}")
+        return False
 
-    def show_transactions(self):
+    def find_accounts(self, owner_id=None, name_prefix=None, limit=50):
         try:
-            account_number = input("Enter the account number to fetch transactions: ")
-            filename = f"account_{account_number}.txt"
+            if owner_id is None and name_prefix is None:
+                query = input("Enter an owner ID, or a name prefix to search: ")
+                owner_id = query
+                name_prefix = query
+            account_numbers = []
+            if owner_id:
+                account_numbers += get_storage().find_accounts_by_owner(owner_id)
+            if name_prefix:
+                account_numbers += [
+                    n
+                    for n in get_storage().find_accounts_by_name(name_prefix, limit)
+                    if n not in account_numbers
+                ]
+            if not account_numbers:
+                print("No matching accounts found.")
+                self.log_action(
+                    "Find Accounts",
+                    f"Failed - No match for {owner_id or name_prefix}",
+                    error="not_found",
+                )
+                return []
+            for account_number in account_numbers:
+                print(f"Account Number: {account_number}")
+            self.log_action(
+                "Find Accounts",
+                f"Owner ID: {owner_id}, Name Prefix: {name_prefix}, "
+                f"Matches: {len(account_numbers)}",
+            )
+            return account_numbers
+        except Exception as e:
+            self.log_action("Find Accounts", f"Failed - {e}", error=error_kind(e))
+            print(f"An error occurred while searching accounts: {e}")
+        return []
+
+    def show_transactions(
+        self,
+        account_number=None,
+        start=None,
+        end=None,
+        types=None,
+        page=1,
+        page_size=None,
+    ):
+        try:
+            if account_number is None:
+                account_number = input(
+                    "Enter the account number to fetch transactions: "
+                )
+            filename = resolver.account_file(account_number)
 
             try:
-                with open(filename, "r") as f:
-                    account_data = {}
-                    for line in f:
-                        key, value = line.strip().split(": ", 1)
-                        if key == "transaction_history":
-                            account_data[key] = eval(value)
-                            break
-                        elif key == "account_number":
-                            account_number_from_file = value.strip()
-                            if account_number != account_number_from_file:
-                                print(
-                                    f"Account number '{account_number}' does not match the file content."
-                                )
-                                self.log_action(
-                                    "Show Transactions",
-                                    f"Failed - Account number mismatch",
-                                )
-                                return
-
-                    if "transaction_history" in account_data:
-                        print(
-                            f"Transaction History for Account Number: {account_number}:"
-                        )
-                        for transaction in account_data["transaction_history"]:
-                            print(
-                                f"{transaction['date']}: {transaction['type']}, ${transaction['amount']:.2f}"
-                            )
-                        self.log_action(
-                            "Show Transactions", f"Account Number: {account_number}"
-                        )
-                    else:
-                        print("No transaction history found.")
-                        self.log_action(
-                            "Show Transactions", f"Failed - No transactions found"
-                        )
+                account = account_repository.get(account_number)
+                if account.account_number != account_number:
+                    print(
+                        f"Account number '{account_number}' does not match the file content."
+                    )
+                    self.log_action(
+                        "Show Transactions",
+                        f"Failed - Account number mismatch",
+                        error="validation",
+                    )
+                    return False
+
+                transactions = account.statement(start, end, types, page, page_size)
+                first = next(transactions, None)
+                if first is not None:
+                    print(f"Transaction History for Account Number: {account_number}:")
+                    print(format_statement_line(first))
+                    for transaction in transactions:
+                        print(format_statement_line(transaction))
+                    self.log_action(
+                        "Show Transactions", f"Account Number: {account_number}"
+                    )
+                else:
+                    print("No transaction history found.")
+                    self.log_action(
+                        "Show Transactions", f"Failed - No transactions found"
+                    )
+                return True
 
             except FileNotFoundError:
                 print(f"File '{filename}' does not exist.")
                 self.log_action(
-                    "Show Transactions", f"Failed - File {filename} not found"
+                    "Show Transactions",
+                    f"Failed - File {filename} not found",
+                    error="not_found",
                 )
 
         except Exception as e:
-            self.log_action("Show Transactions", f"Failed - {e}")
+            self.log_action("Show Transactions", f"Failed - {e}", error=error_kind(e))
             print(f"An error occurred while fetching transactions: {e}")
+        return False
 
-    def set_transaction_limit(self, account_number, limit):
+    def set_transaction_limit(
+        self, account_number, limit, daily_limit=UNCHANGED, hourly_limit=UNCHANGED
+    ):
         try:
-            filename = f"account_{account_number}.txt"
-
             try:
-                with open(filename, "r") as f:
-                    account_data = {}
-                    for line in f:
-                        key, value = line.strip().split(": ", 1)
-                        account_data[key] = value.strip()
-
-                    if account_data.get("account_number") == account_number:
-                        self.transaction_limits[account_number] = limit
-                        print(
-                            f"Transaction limit for account {account_number} is set to ${limit:.2f}."
-                        )
-                        self.log_action(
-                            "Set Transaction Limit",
-                            f"Account Number: {account_number}, Limit: {limit}",
-                        )
-                    else:
-                        print(
-                            f"Account number '{account_number}' does not match the file content."
-                        )
-                        self.log_action(
-                            "Set Transaction Limit", f"Failed - Account number mismatch"
-                        )
+                account = account_repository.get(account_number)
+                if account.account_number == account_number:
+                    # Only the limits change; the rest of the header is
+                    # re-read under the lock so a stale copy is not written.
+                    with account.locked():
+                        account.transaction_limit = limit
+                        if daily_limit is not UNCHANGED:
+                            account.daily_limit = daily_limit
+                        if hourly_limit is not UNCHANGED:
+                            account.hourly_limit = hourly_limit
+                        account.persist()
+                    daily_limit = account.daily_limit
+                    hourly_limit = account.hourly_limit
+                    self.transaction_limits[account_number] = limit
+                    change_feed.publish(
+                        [
+                            admin_event(
+                                "set_limit",
+                                account_number,
+                                limit=limit,
+                                daily_limit=daily_limit,
+                                hourly_limit=hourly_limit,
+                            )
+                        ]
+                    )
+                    print(
+                        f"Transaction limit for account {account_number} is set to ${limit:.2f}."
+                    )
+                    if daily_limit is not None:
+                        print(f"Daily limit is set to ${daily_limit:.2f}.")
+                    if hourly_limit is not None:
+                        print(f"Hourly limit is set to ${hourly_limit:.2f}.")
+                    self.log_action(
+                        "Set Transaction Limit",
+                        f"Account Number: {account_number}, Limit: {limit}, "
+                        f"Daily Limit: {daily_limit}, Hourly Limit: {hourly_limit}",
+                    )
+                    return True
+                else:
+                    print(
+                        f"Account number '{account_number}' does not match the file content."
+                    )
+                    self.log_action(
+                        "Set Transaction Limit",
+                        f"Failed - Account number mismatch",
+                        error="validation",
+                    )
 
             except FileNotFoundError:
                 print("Account not found. Please create an account first.")
                 self.log_action(
                     "Set Transaction Limit",
                     f"Failed - Account {account_number} not found",
+                    error="not_found",
                 )
 
         except Exception as e:
-            self.log_action("Set Transaction Limit", f"Failed - {e}")
+            self.log_action(
+                "Set Transaction Limit", f"Failed - {e}", error=error_kind(e)
+            )
             print(f"An error occurred while setting the transaction limit: {e}")
+        return False
 
     def freeze_account(self, account_number):
         try:
-            filename = f"account_{account_number}.txt"
-
             try:
-                with open(filename, "r") as f:
-                    account_data = {}
-                    for line in f:
-                        key, value = line.strip().split(": ", 1)
-                        account_data[key] = value.strip()
-
-                    if account_data.get("account_number") == account_number:
-                        with open("frozen_accounts.txt", "a") as frozen_file:
-                            frozen_file.write(f"{account_number}\n")
+                account = account_repository.get(account_number)
+                if account.account_number == account_number:
+                    if get_storage().freeze(account_number):
+                        change_feed.publish([admin_event("freeze", account_number)])
                         print(f"Account {account_number} has been frozen.")
                         self.log_action(
                             "Freeze Account", f"Account Number: {account_number}"
                         )
+                        return True
                     else:
-                        print(
-                            f"Account number '{account_number}' does not match the file content."
-                        )
+                        print("Account is already frozen.")
                         self.log_action(
-                            "Freeze Account", f"Failed - Account number mismatch"
+                            "Freeze Account",
+                            f"Failed - Account already frozen",
+                            error="validation",
                         )
+                else:
+                    print(
+                        f"Account number '{account_number}' does not match the file content."
+                    )
+                    self.log_action(
+                        "Freeze Account",
+                        f"Failed - Account number mismatch",
+                        error="validation",
+                    )
 
             except FileNotFoundError:
                 print("Account not found. Please create an account first.")
                 self.log_action(
-                    "Freeze Account", f"Failed - Account {account_number} not found"
+                    "Freeze Account",
+                    f"Failed - Account {account_number} not found",
+                    error="not_found",
                 )
 
         except Exception as e:
-            self.log_action("Freeze Account", f"Failed - {e}")
+            self.log_action("Freeze Account", f"Failed - {e}", error=error_kind(e))
             print(f"An error occurred while freezing the account: {e}")
+        return False
 
     def unfreeze_account(self, account_number):
         try:
-            filename = f"account_{account_number}.txt"
-
             try:
-                with open(filename, "r") as f:
-                    account_data = {}
-                    for line in f:
-                        key, value = line.strip().split(": ", 1)
-                        account_data[key] = value.strip()
-
-                    if account_data.get("account_number") == account_number:
-                        if os.path.exists("frozen_accounts.txt"):
-                            with open("frozen_accounts.txt", "r") as frozen_file:
-                                frozen_accounts = frozen_file.read().splitlines()
-                            if account_number in frozen_accounts:
-                                frozen_accounts.remove(account_number)
-                                with open("frozen_accounts.txt", "w") as frozen_file:
-                                    for acc in frozen_accounts:
-                                        frozen_file.write(f"{acc}\n")
-                                print(f"Account {account_number} has been unfrozen.")
-                                self.log_action(
-                                    "Unfreeze Account",
-                                    f"Account Number: {account_number}",
-                                )
-                            else:
-                                print("Account is not frozen.")
-                                self.log_action(
-                                    "Unfreeze Account", f"Failed - Account not frozen"
-                                )
+                account = account_repository.get(account_number)
+                if account.account_number == account_number:
+                    if get_storage().has_frozen_accounts():
+                        if get_storage().unfreeze(account_number):
+                            change_feed.publish(
+                                [admin_event("unfreeze", account_number)]
+                            )
+                            print(f"Account {account_number} has been unfrozen.")
+                            self.log_action(
+                                "Unfreeze Account",
+                                f"Account Number: {account_number}",
+                            )
+                            return True
                         else:
-                            print("No frozen accounts found.")
+                            print("Account is not frozen.")
                             self.log_action(
-                                "Unfreeze Account", f"Failed - No frozen accounts"
+                                "Unfreeze Account",
+                                f"Failed - Account not frozen",
+                                error="validation",
                             )
-
                     else:
-                        print(
-                            f"Account number '{account_number}' does not match the file content."
-                        )
+                        print("No frozen accounts found.")
                         self.log_action(
-                            "Unfreeze Account", f"Failed - Account number mismatch"
+                            "Unfreeze Account",
+                            f"Failed - No frozen accounts",
+                            error="validation",
                         )
 
+                else:
+                    print(
+                        f"Account number '{account_number}' does not match the file content."
+                    )
+                    self.log_action(
+                        "Unfreeze Account",
+                        f"Failed - Account number mismatch",
+                        error="validation",
+                    )
+
             except FileNotFoundError:
                 print("Account not found. Please create an account first.")
                 self.log_action(
-                    "Unfreeze Account", f"Failed - Account {account_number} not found"
+                    "Unfreeze Account",
+                    f"Failed - Account {account_number} not found",
+                    error="not_found",
                 )
 
         except Exception as e:
-            self.log_action("Unfreeze Account", f"Failed - {e}")
+            self.log_action("Unfreeze Account", f"Failed - {e}", error=error_kind(e))
             print(f"An error occurred while unfreezing the account: {e}")
+        return False
 
     def delete_account(self, account_number):
         try:
-            filename = f"account_{account_number}.txt"
-
             try:
-                with open(filename, "r") as f:
-                    account_data = {}
-                    for line in f:
-                        key, value = line.strip().split(": ", 1)
-                        account_data[key] = value.strip()
-
-                    if account_data.get("account_number") == account_number:
-                        if account_number in self.accounts:
-                            del self.accounts[account_number]
-                            print(f"Account {account_number} has been deleted.")
-                            self.log_action(
-                                "Delete Account", f"Account Number: {account_number}"
-                            )
-                        else:
-                            print("Account not found.")
-                            self.log_action(
-                                "Delete Account",
-                                f"Failed - Account {account_number} not found",
-                            )
-                    else:
-                        print(
-                            f"Account number '{account_number}' does not match the file content."
-                        )
-                        self.log_action(
-                            "Delete Account", f"Failed - Account number mismatch"
+                account = account_repository.get(account_number)
+                if account.account_number == account_number:
+                    with transfer_engine.locked(account_number):
+                        get_storage().delete_account(account_number)
+                        account_repository.discard(account_number)
+                        change_feed.publish(
+                            [admin_event("delete_account", account_number)]
                         )
+                    self.accounts.pop(account.owner_id, None)
+                    print(f"Account {account_number} has been deleted.")
+                    self.log_action(
+                        "Delete Account", f"Account Number: {account_number}"
+                    )
+                    return True
+                else:
+                    print(
+                        f"Account number '{account_number}' does not match the file content."
+                    )
+                    self.log_action(
+                        "Delete Account",
+                        f"Failed - Account number mismatch",
+                        error="validation",
+                    )
 
             except FileNotFoundError:
                 print("Account not found. Please create an account first.")
                 self.log_action(
-                    "Delete Account", f"Failed - Account {account_number} not found"
+                    "Delete Account",
+                    f"Failed - Account {account_number} not found",
+                    error="not_found",
                 )
 
         except Exception as e:
-            self.log_action("Delete Account", f"Failed - {e}")
+            self.log_action("Delete Account", f"Failed - {e}", error=error_kind(e))
             print(f"An error occurred while deleting the account: {e}")
+        return False
+
+    @staticmethod
+    def read_account_numbers(source):
+        """
+        Account numbers from a list, or from a file with one per line (commas
+        also separate; blank lines and lines starting with # are skipped).
+        """
+        if isinstance(source, str):
+            with open(source, "r") as f:
+                source = [
+                    part
+                    for line in f
+                    if not line.lstrip().startswith("#")
+                    for part in line.split(",")
+                ]
+        return list(dict.fromkeys(str(n).strip() for n in source if str(n).strip()))
+
+    def _bulk_targets(self, source):
+        """
+        Check every account number against storage in one pass. Returns all
+        the numbers, the existing ones and a result for each missing one.
+        """
+        account_numbers = self.read_account_numbers(source)
+        existing = get_storage().existing_accounts(account_numbers)
+        results = {
+            n: ("failed", "Account not found.")
+            for n in account_numbers
+            if n not in existing
+        }
+        return account_numbers, [n for n in account_numbers if n in existing], results
+
+    def _bulk_report(self, action, account_numbers, results, report_file=None):
+        report = [
+            {"account_number": n, "status": results[n][0], "message": results[n][1]}
+            for n in account_numbers
+        ]
+        counts = collections.Counter(row["status"] for row in report)
+        changed = [row["account_number"] for row in report if row["status"] == "ok"]
+        print(
+            f"{action}: {counts['ok']} succeeded, {counts['skipped']} skipped, "
+            f"{counts['failed']} failed."
+        )
+        if report_file:
+            with open(report_file, "w", newline="") as f:
+                writer = csv.DictWriter(f, fieldnames=BULK_REPORT_FIELDS)
+                writer.writeheader()
+                writer.writerows(report)
+            print(f"Report written to {report_file}.")
+        # One audit entry for the whole run.
+        self.log_action(
+            action,
+            f"Requested: {len(report)}, Succeeded: {counts['ok']}, "
+            f"Skipped: {counts['skipped']}, Failed: {counts['failed']}, "
+            f"Accounts: {','.join(changed)}",
+        )
+        return report
+
+    def bulk_freeze(self, source, report_file=None):
+        account_numbers, targets, results = self._bulk_targets(source)
+        frozen = get_storage().freeze_many(targets)
+        change_feed.publish([admin_event("freeze", n) for n in frozen])
+        frozen = set(frozen)
+        for n in targets:
+            results[n] = (
+                ("ok", "Frozen.") if n in frozen else ("skipped", "Already frozen.")
+            )
+        return self._bulk_report(
+            "Bulk Freeze Account", account_numbers, results, report_file
+        )
 
-    def log_action(self, action, details):
-        filename = "admin_log.txt"
-        with open(filename, "a") as f:
-            f.write(
-                f"{datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')} - {action}: {details}\n"
+    def bulk_unfreeze(self, source, report_file=None):
+        account_numbers, targets, results = self._bulk_targets(source)
+        unfrozen = get_storage().unfreeze_many(targets)
+        change_feed.publish([admin_event("unfreeze", n) for n in unfrozen])
+        unfrozen = set(unfrozen)
+        for n in targets:
+            results[n] = (
+                ("ok", "Unfrozen.") if n in unfrozen else ("skipped", "Not frozen.")
             )
+        return self._bulk_report(
+            "Bulk Unfreeze Account", account_numbers, results, report_file
+        )
+
+    def bulk_delete(self, source, report_file=None):
+        account_numbers, targets, results = self._bulk_targets(source)
+        for i in range(0, len(targets), BULK_CHUNK_SIZE):
+            chunk = targets[i : i + BULK_CHUNK_SIZE]
+            try:
+                with transfer_engine.locked(*chunk):
+                    get_storage().delete_accounts(chunk)
+                    for n in chunk:
+                        account_repository.discard(n)
+                        results[n] = ("ok", "Deleted.")
+                    change_feed.publish(
+                        [admin_event("delete_account", n) for n in chunk]
+                    )
+            except (OSError, ValueError) as e:
+                for n in chunk:
+                    results.setdefault(n, ("failed", str(e)))
+        deleted = {n for n in targets if results[n][0] == "ok"}
+        for owner_id, account in list(self.accounts.items()):
+            if account.account_number in deleted:
+                del self.accounts[owner_id]
+        return self._bulk_report(
+            "Bulk Delete Account", account_numbers, results, report_file
+        )
+
+    def bulk_set_transaction_limit(
+        self,
+        source,
+        limit,
+        daily_limit=UNCHANGED,
+        hourly_limit=UNCHANGED,
+        report_file=None,
+    ):
+        account_numbers, targets, results = self._bulk_targets(source)
+        for i in range(0, len(targets), BULK_CHUNK_SIZE):
+            chunk = targets[i : i + BULK_CHUNK_SIZE]
+            accounts = []
+            try:
+                with transfer_engine.locked(*chunk):
+                    for n in chunk:
+                        try:
+                            account = account_repository.get(n)
+                        except (OSError, ValueError) as e:
+                            results[n] = ("failed", str(e))
+                            continue
+                        # flush_many() rebases the change onto a fresh snapshot.
+                        account.transaction_limit = limit
+                        if daily_limit is not UNCHANGED:
+                            account.daily_limit = daily_limit
+                        if hourly_limit is not UNCHANGED:
+                            account.hourly_limit = hourly_limit
+                        accounts.append(account)
+                    saved = self._save_chunk(accounts, results)
+                    for account in saved:
+                        self.transaction_limits[account.account_number] = limit
+                        results[account.account_number] = (
+                            "ok",
+                            f"Limit set to {limit:.2f}.",
+                        )
+                    change_feed.publish(
+                        [
+                            admin_event(
+                                "set_limit",
+                                account.account_number,
+                                limit=limit,
+                                daily_limit=account.daily_limit,
+                                hourly_limit=account.hourly_limit,
+                            )
+                            for account in saved
+                        ]
+                    )
+            except (OSError, ValueError) as e:
+                for account in accounts:
+                    if account.account_number not in results:
+                        account_repository.discard(account.account_number)
+                        results[account.account_number] = ("failed", str(e))
+        return self._bulk_report(
+            "Bulk Set Transaction Limit", account_numbers, results, report_file
+        )
+
+    def _save_chunk(self, accounts, results):
+        """
+        Save the accounts together (a single transaction with SQLite) and
+        return the ones saved. If that fails, part of the chunk may already
+        be written, so each account is saved again on its own: only the ones
+        that still fail are reported failed and evicted.
+        """
+        try:
+            UserActions.flush_many(accounts)
+            return accounts
+        except (OSError, ValueError):
+            pass
+        saved = []
+        for account in accounts:
+            try:
+                account.flush()
+            except (OSError, ValueError) as e:
+                account_repository.discard(account.account_number)
+                results[account.account_number] = ("failed", str(e))
+            else:
+                saved.append(account)
+        return saved
+
+    def log_action(self, action, details, error=None):
+        if error is not None:
+            metrics.note_error(error)
+        audit_logger.log(resolver.admin_log_file(), action, details)
+
+
+instrument(
+    UserActions,
+    [
+        "deposit_amount",
+        "check_amount",
+        "print_statement",
+        "transfer_amount",
+        "withdraw",
+        "change_pin",
+        "show_transaction_history",
+    ],
+    ["save_to_file", "read_from_file", "is_account_frozen", "log_action"],
+)
+instrument(
+    AdminActions,
+    [
+        "create_account",
+        "show_account_details",
+        "show_transactions",
+        "set_transaction_limit",
+        "freeze_account",
+        "unfreeze_account",
+        "delete_account",
+        "find_accounts",
+        "bulk_freeze",
+        "bulk_unfreeze",
+        "bulk_delete",
+        "bulk_set_transaction_limit",
+    ],
+    ["log_action"],
+)
+
+
+account_repository = AccountRepository(
+    UserActions.load, flush_many=UserActions.flush_many
+)
+transfer_engine = TransferEngine(account_repository)
+
+
+def input_limit(period):
+    value = input(f"Enter {period} limit (blank to keep, 'none' to remove): ")
+    value = value.strip()
+    if not value:
+        return UNCHANGED
+    if value.lower() == "none":
+        return None
+    return float(value)
 
 
 def main():
+    transfer_engine.recover()
     print("*****************Welcome to the Banking System***********************")
     candidate_name = input("HELLO! Please enter your name First: ")
     user_type = input("Are you a user or an admin? (User/Admin): ")
@@ -605,6 +1162,8 @@ def main():
             print("6. Unfreeze Account")
             print("7. Delete Account")
             print("8. Exit")
+            print("9. Find Accounts")
+            print("10. Bulk Operation")
 
             choice = input("Enter your choice: ")
 
@@ -617,7 +1176,12 @@ def main():
             elif choice == "4":
                 account_number = input("Enter account number: ")
                 limit = float(input("Enter transaction limit: "))
-                admin.set_transaction_limit(account_number, limit)
+                admin.set_transaction_limit(
+                    account_number,
+                    limit,
+                    input_limit("daily"),
+                    input_limit("hourly"),
+                )
             elif choice == "5":
                 account_number = input("Enter account number: ")
                 admin.freeze_account(account_number)
@@ -629,6 +1193,32 @@ def main():
                 admin.delete_account(account_number)
             elif choice == "8":
                 break
+            elif choice == "9":
+                admin.find_accounts()
+            elif choice == "10":
+                operation = input("Operation (freeze/unfreeze/delete/limit): ")
+                source = input("File of account numbers: ")
+                if not os.path.exists(source):
+                    print(f"File '{source}' does not exist.")
+                    continue
+                report_file = input("Report file (blank for none): ") or None
+                if operation == "freeze":
+                    admin.bulk_freeze(source, report_file)
+                elif operation == "unfreeze":
+                    admin.bulk_unfreeze(source, report_file)
+                elif operation == "delete":
+                    admin.bulk_delete(source, report_file)
+                elif operation == "limit":
+                    limit = float(input("Enter transaction limit: "))
+                    admin.bulk_set_transaction_limit(
+                        source,
+                        limit,
+                        input_limit("daily"),
+                        input_limit("hourly"),
+                        report_file,
+                    )
+                else:
+                    print("Invalid operation.")
             else:
                 print("Invalid choice. Please try again.")
     else:
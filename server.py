@@ -0,0 +1,434 @@
+"""
+Asyncio TCP front end for the banking system.
+
+Clients send one JSON object per line and get one JSON object per line back::
+
+    {"id": 1, "op": "deposit", "account_number": "1001", "pin": "1234", "amount": 50}
+    {"id": 1, "ok": true, "output": ["Successful deposit of $50.00. ..."]}
+
+User operations (deposit, withdraw, transfer, balance, statement, change_pin)
+need the account's PIN. Admin operations (create_account, account_details,
+transactions, set_limit, freeze, unfreeze, delete_account, find_accounts and
+the bulk_freeze, bulk_unfreeze, bulk_delete and bulk_set_limit variants, which
+take ``account_numbers`` and return a per-account ``report``) need ``token``
+to match ``BANK_ADMIN_TOKEN``; without that variable they are disabled.
+
+The operations run the normal UserActions/AdminActions methods on a thread
+pool so disk work never blocks the event loop; what they print is returned as
+``output``. Concurrency is bounded: at most ``max_connections`` sessions, and
+at most ``max_inflight`` requests running at once. A session waits for a slot
+before reading its next request, so a saturated server pushes back on clients
+through TCP instead of queueing without limit; a request that cannot get a
+slot within ``timeout`` seconds, or runs longer than that, gets an error
+reply (a timed-out operation still completes in the background, and keeps
+its slot until it does).
+
+With ``--metrics-port`` the per-operation metrics (see metrics.py) are served
+in the Prometheus text format at ``http://HOST:PORT/metrics``.
+
+Usage: python server.py [--host HOST] [--port PORT] [--workers N]
+       [--max-inflight N] [--max-connections N] [--timeout SECONDS]
+       [--metrics-port PORT]
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import signal
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import project
+from audit_log import audit_logger
+from metrics import start_http_server
+
+MAX_LINE = 64 * 1024
+MAX_PAGE_SIZE = 1000
+USER_OPERATIONS = [
+    "deposit",
+    "withdraw",
+    "transfer",
+    "balance",
+    "statement",
+    "change_pin",
+]
+ADMIN_OPERATIONS = [
+    "create_account",
+    "account_details",
+    "transactions",
+    "set_limit",
+    "freeze",
+    "unfreeze",
+    "delete_account",
+    "find_accounts",
+    "bulk_freeze",
+    "bulk_unfreeze",
+    "bulk_delete",
+    "bulk_set_limit",
+]
+
+
+class RequestError(Exception):
+    pass
+
+
+class ThreadOutput(io.TextIOBase):
+    """
+    sys.stdout replacement that sends what a worker thread prints to that
+    thread's capture buffer, and everything else to the real stream.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self._local = threading.local()
+
+    def write(self, text):
+        buffer = getattr(self._local, "buffer", None)
+        return (buffer if buffer is not None else self.stream).write(text)
+
+    def flush(self):
+        self.stream.flush()
+
+    @contextlib.contextmanager
+    def capture(self):
+        self._local.buffer = io.StringIO()
+        try:
+            yield self._local.buffer
+        finally:
+            self._local.buffer = None
+
+
+def _required(request, key):
+    if request.get(key) is None:
+        raise RequestError(f"Missing field '{key}'.")
+    return request[key]
+
+
+def _amount(request, key="amount"):
+    try:
+        return float(_required(request, key))
+    except (TypeError, ValueError):
+        raise RequestError(f"Field '{key}' must be a number.")
+
+
+def _positive_int(request, key, default):
+    value = request.get(key)
+    if value is None:
+        return default
+    if isinstance(value, bool) or not isinstance(value, int) or value < 1:
+        raise RequestError(f"Field '{key}' must be a positive integer.")
+    return value
+
+
+def _page_size(request, key="page_size"):
+    return min(_positive_int(request, key, 100), MAX_PAGE_SIZE)
+
+
+def _types(request):
+    types = request.get("types")
+    if types is not None and not (
+        isinstance(types, list) and all(isinstance(t, str) for t in types)
+    ):
+        raise RequestError("Field 'types' must be a list of strings.")
+    return types
+
+
+def _limit(request, key):
+    # An absent limit is left as it is; null removes it.
+    if key not in request:
+        return project.UNCHANGED
+    if request[key] is None:
+        return None
+    return _amount(request, key)
+
+
+class BankServer:
+    def __init__(
+        self,
+        host="127.0.0.1",
+        port=8765,
+        workers=32,
+        max_inflight=256,
+        max_connections=10000,
+        timeout=10.0,
+        admin_token=None,
+    ):
+        self.host = host
+        self.port = port
+        self.max_connections = max_connections
+        self.max_inflight = max_inflight
+        self.timeout = timeout
+        self.admin_token = admin_token
+        self.connections = 0
+        self.admin = project.AdminActions()
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.output = ThreadOutput(sys.stdout)
+        self._server = None
+        self._slots = None
+
+    async def start(self):
+        self._slots = asyncio.Semaphore(self.max_inflight)
+        sys.stdout = self.output
+        await asyncio.get_running_loop().run_in_executor(
+            self.executor, project.transfer_engine.recover
+        )
+        self._server = await asyncio.start_server(
+            self.handle_session, self.host, self.port, limit=MAX_LINE, backlog=4096
+        )
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        self.executor.shutdown(wait=True)
+        sys.stdout = self.output.stream
+        audit_logger.flush()
+
+    async def handle_session(self, reader, writer):
+        if self.connections >= self.max_connections:
+            await self._reply(writer, {"ok": False, "error": "Server is busy."})
+            writer.close()
+            return
+        self.connections += 1
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except ValueError:
+                    await self._reply(
+                        writer, {"ok": False, "error": "Request too long."}
+                    )
+                    break
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                await self._reply(writer, await self.handle_line(line))
+        except ConnectionError:
+            pass
+        finally:
+            self.connections -= 1
+            writer.close()
+
+    async def _reply(self, writer, response):
+        writer.write(json.dumps(response).encode() + b"\n")
+        await writer.drain()
+
+    async def handle_line(self, line):
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ValueError
+        except ValueError:
+            return {"ok": False, "error": "Malformed request."}
+        response = await self.handle(request)
+        if "id" in request:
+            response["id"] = request["id"]
+        return response
+
+    async def handle(self, request):
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.timeout)
+        except asyncio.TimeoutError:
+            return {"ok": False, "error": "Server is busy."}
+        future = asyncio.get_running_loop().run_in_executor(
+            self.executor, self.execute, request
+        )
+        # The slot is held until the worker is done, even after a timed-out
+        # request has been answered.
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), self.timeout)
+        except asyncio.TimeoutError:
+            return {"ok": False, "error": "Request timed out."}
+
+    def execute(self, request):
+        """Run one request on a worker thread and build its response."""
+        with self.output.capture() as buffer:
+            try:
+                op = request.get("op")
+                if op in USER_OPERATIONS:
+                    response = self.user_operation(op, request)
+                elif op in ADMIN_OPERATIONS:
+                    if not self.admin_token or request.get("token") != self.admin_token:
+                        raise RequestError("Not authorized.")
+                    response = self.admin_operation(op, request)
+                else:
+                    raise RequestError(f"Unknown operation '{op}'.")
+            except RequestError as e:
+                response = {"ok": False, "error": str(e)}
+            except Exception as e:
+                response = {"ok": False, "error": f"Internal error: {e}"}
+        output = buffer.getvalue().splitlines()
+        if output:
+            response["output"] = output
+        return response
+
+    def _account(self, account_number):
+        try:
+            return project.account_repository.get(str(account_number))
+        except FileNotFoundError:
+            raise RequestError(f"Account {account_number} does not exist.")
+
+    def _login(self, request):
+        account = self._account(_required(request, "account_number"))
+        pin = str(_required(request, "pin"))
+        if account.pin != pin[::-1]:
+            raise RequestError("Incorrect PIN.")
+        return account
+
+    def user_operation(self, op, request):
+        account = self._login(request)
+        if op == "transfer":
+            # The transfer engine locks both accounts in a fixed order itself.
+            recipient = self._account(_required(request, "recipient"))
+            return {"ok": account.transfer_amount(recipient, _amount(request))}
+        with project.transfer_engine.locked(account.account_number):
+            # The cached copy may be older than what another process wrote.
+            account.refresh()
+            if op == "deposit":
+                ok = account.deposit_amount(_amount(request))
+            elif op == "withdraw":
+                ok = account.withdraw(_amount(request))
+            elif op == "balance":
+                ok = account.check_amount()
+                if ok:
+                    return {"ok": True, "balance": account.balance}
+            elif op == "change_pin":
+                ok = account.change_pin(
+                    str(request.get("pin")), str(_required(request, "new_pin"))
+                )
+            else:
+                return self.statement(account, request)
+        return {"ok": ok}
+
+    def statement(self, account, request):
+        if account.is_account_frozen():
+            raise RequestError("Account is frozen.")
+        transactions = account.statement(
+            request.get("start"),
+            request.get("end"),
+            _types(request),
+            _positive_int(request, "page", 1),
+            _page_size(request),
+        )
+        return {"ok": True, "transactions": [dict(t) for t in transactions]}
+
+    def admin_operation(self, op, request):
+        admin = self.admin
+        if op == "create_account":
+            ok = admin.create_account(
+                str(_required(request, "owner_id")),
+                str(_required(request, "name")),
+                _required(request, "age"),
+                _required(request, "salary"),
+                str(_required(request, "account_number")),
+                str(_required(request, "pin")),
+            )
+            return {"ok": ok}
+        if op == "find_accounts":
+            if not (request.get("owner_id") or request.get("name_prefix")):
+                raise RequestError("Give 'owner_id' or 'name_prefix'.")
+            return {
+                "ok": True,
+                "accounts": admin.find_accounts(
+                    request.get("owner_id") or "",
+                    request.get("name_prefix") or "",
+                    _page_size(request, "limit"),
+                ),
+            }
+        if op.startswith("bulk_"):
+            return self.bulk_operation(op, request)
+        account_number = str(_required(request, "account_number"))
+        if op == "account_details":
+            ok = admin.show_account_details(account_number)
+        elif op == "transactions":
+            ok = admin.show_transactions(
+                account_number,
+                request.get("start"),
+                request.get("end"),
+                _types(request),
+                _positive_int(request, "page", 1),
+                _page_size(request),
+            )
+        elif op == "set_limit":
+            ok = admin.set_transaction_limit(
+                account_number,
+                _amount(request, "limit"),
+                _limit(request, "daily_limit"),
+                _limit(request, "hourly_limit"),
+            )
+        elif op == "freeze":
+            ok = admin.freeze_account(account_number)
+        elif op == "unfreeze":
+            ok = admin.unfreeze_account(account_number)
+        else:
+            ok = admin.delete_account(account_number)
+        return {"ok": ok}
+
+    def bulk_operation(self, op, request):
+        account_numbers = _required(request, "account_numbers")
+        if not isinstance(account_numbers, list):
+            raise RequestError("Field 'account_numbers' must be a list.")
+        if op == "bulk_freeze":
+            report = self.admin.bulk_freeze(account_numbers)
+        elif op == "bulk_unfreeze":
+            report = self.admin.bulk_unfreeze(account_numbers)
+        elif op == "bulk_delete":
+            report = self.admin.bulk_delete(account_numbers)
+        else:
+            report = self.admin.bulk_set_transaction_limit(
+                account_numbers,
+                _amount(request, "limit"),
+                _limit(request, "daily_limit"),
+                _limit(request, "hourly_limit"),
+            )
+        # Accounts skipped as already in the requested state do not fail it.
+        ok = all(row["status"] != "failed" for row in report)
+        return {"ok": ok, "report": report}
+
+
+async def serve(args):
+    server = await BankServer(
+        args.host,
+        args.port,
+        args.workers,
+        args.max_inflight,
+        args.max_connections,
+        args.timeout,
+        os.environ.get("BANK_ADMIN_TOKEN"),
+    ).start()
+    print(f"Listening on {server.host}:{server.port}", flush=True)
+    if args.metrics_port is not None:
+        metrics_server = start_http_server(args.metrics_port, args.host)
+        print(
+            f"Metrics on http://{args.host}:{metrics_server.server_port}/metrics",
+            flush=True,
+        )
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        with contextlib.suppress(NotImplementedError):
+            loop.add_signal_handler(signum, stop.set)
+    try:
+        await stop.wait()
+    finally:
+        await server.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve the banking system over TCP.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--workers", type=int, default=32)
+    parser.add_argument("--max-inflight", type=int, default=256)
+    parser.add_argument("--max-connections", type=int, default=10000)
+    parser.add_argument("--timeout", type=float, default=10.0)
+    parser.add_argument("--metrics-port", type=int)
+    asyncio.run(serve(parser.parse_args()))
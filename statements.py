@@ -0,0 +1,199 @@
+"""
+Date-indexed, paginated access to an account's transaction journal.
+
+Each account gets a sparse index (``index_<number>.txt`` next to its journal)
+holding the date and byte offset of every INDEX_INTERVAL-th journal record.
+The index is brought up to date lazily when a statement is requested, by
+scanning only the journal records appended since its last entry, so writes
+never pay for it. A date-range query bisects the index, seeks straight to the
+right block and streams rows from there. Records archived by compaction.py
+are read from their segments first.
+
+Usage: python statements.py ACCOUNT [--from DATE] [--to DATE] [--type TYPE]
+       [--page N] [--page-size N] [--csv FILE]
+"""
+
+import argparse
+import bisect
+import csv
+import datetime
+import itertools
+import json
+import os
+
+from account_format import journal_filename, load_account
+from compaction import iter_segments
+from paths import resolver
+
+INDEX_INTERVAL = 128
+CSV_FIELDS = ["date", "type", "amount", "recipient"]
+
+
+def format_statement_line(transaction):
+    return f"{transaction['date']}: {transaction['type']}, ${transaction['amount']:.2f}"
+
+
+def _bound(value, end_of_day):
+    if value is None or value == "":
+        return None
+    if isinstance(value, datetime.datetime):
+        return value.strftime("%Y-%m-%d %H:%M:%S")
+    if isinstance(value, datetime.date):
+        value = value.strftime("%Y-%m-%d")
+    if len(value) == 10:
+        return f"{value} 23:59:59" if end_of_day else f"{value} 00:00:00"
+    return value
+
+
+def _read_index(account_number):
+    entries = []
+    try:
+        with open(resolver.index_file(account_number), "r") as f:
+            for line in f:
+                date, offset = line.rstrip("\n").split("\t")
+                entries.append((date, int(offset)))
+    except FileNotFoundError:
+        pass
+    return entries
+
+
+def _index_is_valid(journal, entries):
+    # A rewritten or compacted journal no longer matches the stored offsets.
+    date, offset = entries[-1]
+    if offset >= os.path.getsize(journal):
+        return False
+    with open(journal, "rb") as f:
+        f.seek(offset)
+        line = f.readline()
+    try:
+        return json.loads(line)["date"] == date
+    except (ValueError, KeyError):
+        return False
+
+
+def update_index(account_number):
+    """Index journal records appended since the last run; returns all entries."""
+    journal = journal_filename(account_number)
+    index_file = resolver.index_file(account_number)
+    entries = _read_index(account_number)
+    if entries and not _index_is_valid(journal, entries):
+        entries = []
+        os.remove(index_file)
+    position = entries[-1][1] if entries else 0
+    new_entries = []
+    with open(journal, "rb") as f:
+        f.seek(position)
+        count = 0
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            if count % INDEX_INTERVAL == 0 and not (
+                entries and position == entries[-1][1]
+            ):
+                new_entries.append((json.loads(line)["date"], position))
+            count += 1
+            position += len(line)
+    if new_entries:
+        with open(index_file, "a") as f:
+            f.write("".join(f"{date}\t{offset}\n" for date, offset in new_entries))
+    return entries + new_entries
+
+
+def filter_transactions(
+    transactions, start=None, end=None, types=None, page=1, page_size=None
+):
+    """
+    Yield the transactions between ``start`` and ``end`` (datetimes, dates or
+    "YYYY-MM-DD[ HH:MM:SS]" strings, both inclusive) whose type is in
+    ``types``, limited to one page when ``page_size`` is given.
+    """
+    start = _bound(start, end_of_day=False)
+    end = _bound(end, end_of_day=True)
+    types = {t.lower() for t in types} if types else None
+    skip = (page - 1) * page_size if page_size else 0
+    remaining = page_size
+    for transaction in transactions:
+        if start is not None and transaction["date"] < start:
+            continue
+        if end is not None and transaction["date"] > end:
+            break
+        if types is not None and transaction["type"].lower() not in types:
+            continue
+        if skip:
+            skip -= 1
+            continue
+        yield transaction
+        if remaining is not None:
+            remaining -= 1
+            if remaining == 0:
+                return
+
+
+def _stream_journal(account_number, start):
+    journal = journal_filename(account_number)
+    offset = 0
+    entries = update_index(account_number)
+    if start is not None and entries:
+        dates = [date for date, _ in entries]
+        block = bisect.bisect_left(dates, start) - 1
+        if block >= 0:
+            offset = entries[block][1]
+    with open(journal, "rb") as f:
+        f.seek(offset)
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            yield json.loads(line)
+
+
+def iter_statement(
+    account_number, start=None, end=None, types=None, page=1, page_size=None
+):
+    """
+    Stream an account's transactions from disk: archived segments (only those
+    that reach ``start``), then the journal. Raises FileNotFoundError when the
+    account does not exist.
+    """
+    if not os.path.exists(journal_filename(account_number)):
+        transactions = load_account(account_number)["transaction_history"]
+    else:
+        bound = _bound(start, False)
+        transactions = itertools.chain(
+            iter_segments(account_number, bound),
+            _stream_journal(account_number, bound),
+        )
+    return filter_transactions(transactions, start, end, types, page, page_size)
+
+
+def export_csv(transactions, filename):
+    """Stream transactions into a CSV file; returns the number of rows."""
+    rows = 0
+    with open(filename, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=CSV_FIELDS, extrasaction="ignore")
+        writer.writeheader()
+        for transaction in transactions:
+            writer.writerow(transaction)
+            rows += 1
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Print or export a statement.")
+    parser.add_argument("account_number")
+    parser.add_argument("--from", dest="start", help="YYYY-MM-DD[ HH:MM:SS]")
+    parser.add_argument("--to", dest="end", help="YYYY-MM-DD[ HH:MM:SS]")
+    parser.add_argument("--type", dest="types", action="append")
+    parser.add_argument("--page", type=int, default=1)
+    parser.add_argument("--page-size", type=int)
+    parser.add_argument("--csv", help="write the rows to this CSV file")
+    args = parser.parse_args()
+    from storage import get_storage
+
+    rows = get_storage().iter_transactions(
+        args.account_number, args.start, args.end, args.types, args.page, args.page_size
+    )
+    if args.csv:
+        print(f"Exported {export_csv(rows, args.csv)} transaction(s) to {args.csv}.")
+    else:
+        for transaction in rows:
+            print(format_statement_line(transaction))
@@ -0,0 +1,1493 @@
+"""
+Storage backends for accounts, transactions and frozen accounts.
+
+Every persistence call in UserActions, AdminActions and the transfer engine
+goes through the StorageBackend returned by get_storage(). Two backends exist:
+
+- FileStorage: the sharded text files (account header, JSON-lines journal,
+  frozen_accounts.txt) plus account_index.txt for owner, location and name
+  lookups.
+- SQLiteStorage: a local SQLite database in WAL mode with indexed account and
+  transaction tables and a small thread-safe connection pool, so batch
+  workloads get real transactional commits and indexed lookups. Balances and
+  amounts are stored as INTEGER cents; an older database with REAL columns
+  is migrated when it is opened.
+
+The backend is chosen with ``BANK_STORAGE`` (``file`` or ``sqlite``; default
+``file``); the SQLite database lives at ``BANK_SQLITE_PATH`` (default
+``<data root>/bank.db``). ``python storage.py copy file sqlite`` copies every
+account from one backend to the other.
+
+Saves and commits made with ``publish`` also append their transactions to the
+change feed. Each backend records that the events are due in the same durable
+step as the transactions, and recover() publishes any that a crash kept out of
+the feed.
+"""
+
+import bisect
+import contextlib
+import json
+import os
+import queue
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not on POSIX
+    fcntl = None
+
+import account_format
+import compaction
+import wal
+from changefeed import change_feed, transaction_event
+from history import JournalView
+from paths import INDEX_FILE, resolver
+from statements import _bound, filter_transactions, iter_statement
+from transaction import to_cents
+
+CORE_TRANSACTION_FIELDS = ["date", "type", "amount", "recipient"]
+
+
+def feed_events(changes):
+    """Change feed events for the transactions of (details, transactions) pairs."""
+    return [
+        transaction_event(details["account_number"], transaction)
+        for details, transactions in changes
+        for transaction in transactions
+    ]
+
+
+def _publish(events):
+    # The commit already records the events as due; a failure here is left
+    # to recover().
+    try:
+        change_feed.publish(events)
+    except OSError as e:
+        print(f"Change feed events will be published on recovery: {e}")
+        return False
+    return True
+
+
+@contextlib.contextmanager
+def _file_lock(filename):
+    """Exclusive flock on ``<filename>.lock``, which outlives compactions."""
+    with open(f"{filename}.lock", "a") as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        yield
+
+
+class AccountNotFoundError(FileNotFoundError):
+    def __init__(self, account_number):
+        super().__init__(f"Account {account_number} does not exist.")
+        self.account_number = account_number
+        self.filename = account_number
+
+
+class StorageBackend:
+    """
+    Interface shared by the storage backends. ``details`` is the dict built
+    by UserActions.header_details(); transactions are plain dicts.
+    """
+
+    name = None
+
+    def load_account(self, account_number):
+        """
+        Return the account's snapshot: its header fields, with the balance
+        and summary already covering every stored transaction.
+        """
+        raise NotImplementedError
+
+    def load_transactions(self, account_number):
+        """Return the account's full transaction history, oldest first."""
+        raise NotImplementedError
+
+    def history(self, account_number):
+        """
+        The stored history as a sequence of records, oldest first; backends
+        that can decode records on access return a lazy view.
+        """
+        return self.load_transactions(account_number)
+
+    def read_header(self, account_number):
+        raise NotImplementedError
+
+    def save_account(self, details, new_transactions=(), publish=False):
+        """
+        Write the header and append ``new_transactions`` to the history;
+        with ``publish``, also to the change feed.
+        """
+        raise NotImplementedError
+
+    def save_accounts(self, changes, publish=False):
+        """Save several (details, new_transactions) pairs."""
+        for details, new_transactions in changes:
+            self.save_account(details, new_transactions, publish)
+
+    def replace_account(self, details, transactions):
+        """Write the header and replace the whole stored history."""
+        raise NotImplementedError
+
+    def commit(self, changes, txid, publish=False):
+        """
+        Atomically apply several (details, new_transactions) pairs; every
+        transaction in ``changes`` carries ``txid``.
+        """
+        raise NotImplementedError
+
+    def recover(self, locked=None):
+        """
+        Finish commits interrupted by a crash and publish the change feed
+        events they were due. Returns one list of account numbers per
+        recovered commit.
+        """
+        return []
+
+    def iter_transactions(
+        self, account_number, start=None, end=None, types=None, page=1, page_size=None
+    ):
+        raise NotImplementedError
+
+    def delete_account(self, account_number):
+        raise NotImplementedError
+
+    def list_account_numbers(self):
+        raise NotImplementedError
+
+    def find_accounts_by_owner(self, owner_id):
+        raise NotImplementedError
+
+    def find_accounts_by_name(self, prefix, limit=None):
+        """Account numbers whose name starts with ``prefix``, ignoring case."""
+        raise NotImplementedError
+
+    def account_exists(self, account_number):
+        raise NotImplementedError
+
+    def existing_accounts(self, account_numbers):
+        """The subset of ``account_numbers`` that exist, checked in one pass."""
+        raise NotImplementedError
+
+    def account_location(self, account_number):
+        """Where the account is stored, or None when it does not exist."""
+        raise NotImplementedError
+
+    def reindex(self):
+        """Rebuild the secondary indexes; returns the number of accounts."""
+        raise NotImplementedError
+
+    def is_frozen(self, account_number):
+        raise NotImplementedError
+
+    def freeze(self, account_number):
+        """Returns False when the account was already frozen."""
+        raise NotImplementedError
+
+    def unfreeze(self, account_number):
+        """Returns False when the account was not frozen."""
+        raise NotImplementedError
+
+    def freeze_many(self, account_numbers):
+        """Freeze several accounts at once; returns the ones newly frozen."""
+        raise NotImplementedError
+
+    def unfreeze_many(self, account_numbers):
+        """Unfreeze several accounts at once; returns the ones unfrozen."""
+        raise NotImplementedError
+
+    def delete_accounts(self, account_numbers):
+        for account_number in account_numbers:
+            self.delete_account(account_number)
+
+    def has_frozen_accounts(self):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class FrozenAccountRegistry:
+    """
+    Shared in-memory view of frozen_accounts.txt.
+
+    The file is an append-only log: a line holding an account number freezes
+    it and a line holding "-<account number>" unfreezes it. The set is only
+    reloaded when the file's mtime or size changes, so membership checks do
+    not re-read the file. Changes are made under a lock shared with other
+    processes, after catching up with what they wrote.
+    """
+
+    def __init__(self, filename=None):
+        self._filename = filename
+        self._accounts = set()
+        self._entries = 0
+        self._stamp = None
+        self._lock = threading.RLock()
+
+    @property
+    def filename(self):
+        return self._filename or resolver.frozen_accounts_file()
+
+    def _file_stamp(self):
+        try:
+            stat = os.stat(self.filename)
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    @contextlib.contextmanager
+    def _changing(self):
+        with self._lock, _file_lock(self.filename):
+            self._refresh()
+            yield
+
+    def _refresh(self):
+        stamp = self._file_stamp()
+        if stamp == self._stamp:
+            return
+        accounts = set()
+        entries = 0
+        if stamp is not None:
+            with open(self.filename, "r") as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    entries += 1
+                    if line.startswith("-"):
+                        accounts.discard(line[1:])
+                    else:
+                        accounts.add(line)
+        self._accounts = accounts
+        self._entries = entries
+        self._stamp = stamp
+
+    def _append(self, *entries):
+        with open(self.filename, "a") as f:
+            f.write("".join(f"{entry}\n" for entry in entries))
+        self._entries += len(entries)
+        self._stamp = self._file_stamp()
+
+    def _compact(self):
+        temp_filename = f"{self.filename}.tmp"
+        with open(temp_filename, "w") as f:
+            for account_number in sorted(self._accounts):
+                f.write(f"{account_number}\n")
+        os.replace(temp_filename, self.filename)
+        self._entries = len(self._accounts)
+        self._stamp = self._file_stamp()
+
+    def exists(self):
+        return os.path.exists(self.filename)
+
+    def is_frozen(self, account_number):
+        with self._lock:
+            self._refresh()
+            return account_number in self._accounts
+
+    def freeze(self, account_number):
+        with self._changing():
+            if account_number in self._accounts:
+                return False
+            self._append(account_number)
+            self._accounts.add(account_number)
+            return True
+
+    def unfreeze(self, account_number):
+        with self._changing():
+            if account_number not in self._accounts:
+                return False
+            self._append(f"-{account_number}")
+            self._accounts.discard(account_number)
+            # Rewrite only once unfreeze entries dominate the file.
+            if self._entries > 2 * len(self._accounts) + 64:
+                self._compact()
+            return True
+
+    def freeze_many(self, account_numbers):
+        """Freeze several accounts with one write; returns the newly frozen."""
+        with self._changing():
+            frozen = [
+                n for n in dict.fromkeys(account_numbers) if n not in self._accounts
+            ]
+            if frozen:
+                self._append(*frozen)
+                self._accounts.update(frozen)
+            return frozen
+
+    def unfreeze_many(self, account_numbers):
+        """Unfreeze several accounts with one write; returns the unfrozen."""
+        with self._changing():
+            unfrozen = [
+                n for n in dict.fromkeys(account_numbers) if n in self._accounts
+            ]
+            if not unfrozen:
+                return []
+            self._accounts.difference_update(unfrozen)
+            if self._entries + len(unfrozen) > 2 * len(self._accounts) + 64:
+                self._compact()
+            else:
+                self._append(*[f"-{n}" for n in unfrozen])
+            return unfrozen
+
+
+class AccountIndex:
+    """
+    Persistent secondary indexes for the file layout, in account_index.txt:
+    owner ID -> account numbers, account number -> header location, and
+    names sorted for prefix searches.
+
+    Like frozen_accounts.txt the file is an append-only log shared by every
+    process: a ``["+", number, owner_id, name, location]`` line adds or
+    updates an account and ``["-", number]`` removes it. The in-memory view
+    only reads what was appended since it last looked; the file is rewritten
+    once stale entries dominate it. Appends and rewrites hold a lock shared
+    with other processes and first read what they appended. A missing file is rebuilt by scanning the
+    account headers once, and ``python storage.py reindex`` does the same on
+    demand.
+    """
+
+    def __init__(self, filename=None):
+        self._filename = filename
+        self._lock = threading.RLock()
+        # Whether the file lock is held (by the thread holding self._lock).
+        self._file_locked = False
+        self._reset()
+
+    def _reset(self):
+        self._accounts = {}
+        self._owners = {}
+        # Sorted (casefolded name, account number) pairs.
+        self._names = []
+        self._entries = 0
+        self._offset = 0
+        self._inode = None
+
+    @property
+    def filename(self):
+        return self._filename or resolver.path(INDEX_FILE)
+
+    @contextlib.contextmanager
+    def _writing(self):
+        # Re-entrant: a change that finds the file missing rebuilds it.
+        with self._lock:
+            if self._file_locked:
+                yield
+                return
+            with _file_lock(self.filename):
+                self._file_locked = True
+                try:
+                    yield
+                finally:
+                    self._file_locked = False
+
+    @contextlib.contextmanager
+    def _changing(self):
+        with self._writing():
+            self._refresh()
+            yield
+
+    def _insert(self, account_number, owner_id, name, location, sort=True):
+        self._delete(account_number, sort)
+        self._accounts[account_number] = (owner_id, name, location)
+        self._owners.setdefault(owner_id, []).append(account_number)
+        if sort:
+            bisect.insort(self._names, ((name or "").casefold(), account_number))
+
+    def _delete(self, account_number, sort=True):
+        entry = self._accounts.pop(account_number, None)
+        if entry is None:
+            return
+        owner_id, name, _ = entry
+        owned = self._owners[owner_id]
+        owned.remove(account_number)
+        if not owned:
+            del self._owners[owner_id]
+        if sort:
+            key = ((name or "").casefold(), account_number)
+            del self._names[bisect.bisect_left(self._names, key)]
+
+    def _apply(self, line, sort=True):
+        entry = json.loads(line)
+        if entry[0] == "+":
+            self._insert(*entry[1:], sort=sort)
+        else:
+            self._delete(entry[1], sort)
+        self._entries += 1
+
+    def _sort_names(self):
+        self._names = sorted(
+            ((entry[1] or "").casefold(), account_number)
+            for account_number, entry in self._accounts.items()
+        )
+
+    def _refresh(self):
+        try:
+            stat = os.stat(self.filename)
+        except FileNotFoundError:
+            self.rebuild()
+            return
+        if stat.st_ino != self._inode or stat.st_size < self._offset:
+            # Rewritten since it was read: start over.
+            self._reset()
+            self._inode = stat.st_ino
+        if stat.st_size == self._offset:
+            return
+        with open(self.filename, "rb") as f:
+            f.seek(self._offset)
+            data = f.read()
+        # A line another process is still writing is picked up next time.
+        complete = data[: data.rfind(b"\n") + 1]
+        lines = complete.splitlines()
+        # Large reads (a first load) sort the names once at the end.
+        sort = len(lines) < 1024
+        for line in lines:
+            self._apply(line, sort)
+        if not sort:
+            self._sort_names()
+        self._offset += len(complete)
+
+    def _append(self, *entries):
+        with open(self.filename, "a") as f:
+            f.write("".join(json.dumps(entry) + "\n" for entry in entries))
+        self._refresh()
+
+    def _compact(self):
+        temp_filename = f"{self.filename}.tmp"
+        with open(temp_filename, "w") as f:
+            for account_number, entry in self._accounts.items():
+                f.write(json.dumps(["+", account_number, *entry]) + "\n")
+        os.replace(temp_filename, self.filename)
+        stat = os.stat(self.filename)
+        self._entries = len(self._accounts)
+        self._offset = stat.st_size
+        self._inode = stat.st_ino
+        return self._entries
+
+    def rebuild(self):
+        """Re-create the index from the account headers; returns the count."""
+        with self._writing():
+            self._reset()
+            for account_number in resolver.iter_account_numbers():
+                try:
+                    header = account_format.read_header(account_number)
+                except (OSError, ValueError):
+                    continue
+                self._insert(
+                    account_number,
+                    header.get("owner_id"),
+                    header.get("name"),
+                    self._location(account_number),
+                    sort=False,
+                )
+            self._sort_names()
+            return self._compact()
+
+    @staticmethod
+    def _location(account_number):
+        return os.path.relpath(resolver.account_file(account_number), resolver.root)
+
+    def update(self, details):
+        """Index an account whose header was just written, if it changed."""
+        account_number = details["account_number"]
+        key = (details.get("owner_id"), details.get("name"))
+        with self._lock:
+            self._refresh()
+            entry = self._accounts.get(account_number)
+            if entry is not None and entry[:2] == key:
+                # Most saves: nothing to index, so no need for the file lock.
+                return
+            with self._changing():
+                entry = self._accounts.get(account_number)
+                if entry is None or entry[:2] != key:
+                    location = self._location(account_number)
+                    self._append(["+", account_number, *key, location])
+
+    def remove(self, *account_numbers):
+        with self._changing():
+            removed = [n for n in account_numbers if n in self._accounts]
+            if removed:
+                self._append(*[["-", n] for n in removed])
+                if self._entries > 2 * len(self._accounts) + 1024:
+                    self._compact()
+
+    def contains(self, account_number):
+        with self._lock:
+            self._refresh()
+            return account_number in self._accounts
+
+    def contains_many(self, account_numbers):
+        """The indexed subset of ``account_numbers``."""
+        with self._lock:
+            self._refresh()
+            return {n for n in account_numbers if n in self._accounts}
+
+    def location(self, account_number):
+        with self._lock:
+            self._refresh()
+            entry = self._accounts.get(account_number)
+        return os.path.join(resolver.root, entry[2]) if entry else None
+
+    def by_owner(self, owner_id):
+        with self._lock:
+            self._refresh()
+            return list(self._owners.get(owner_id, []))
+
+    def by_name_prefix(self, prefix, limit=None):
+        prefix = prefix.casefold()
+        matches = []
+        with self._lock:
+            self._refresh()
+            position = bisect.bisect_left(self._names, (prefix, ""))
+            while position < len(self._names) and len(matches) != limit:
+                name, account_number = self._names[position]
+                if not name.startswith(prefix):
+                    break
+                matches.append(account_number)
+                position += 1
+        return matches
+
+
+class FileStorage(StorageBackend):
+    name = "file"
+
+    def __init__(self):
+        self.frozen = FrozenAccountRegistry()
+        self.index = AccountIndex()
+        # Write-ahead log for BANK_DURABILITY=sync|interval; None when off.
+        self.wal = wal.from_env()
+        self._stamp_lock = threading.Lock()
+        self._last_stamp = 0
+
+    def load_account(self, account_number):
+        """
+        Read the header snapshot and replay only the journal records written
+        after its ``journal_offset`` (left behind if a crash hit between the
+        journal append and the header write).
+        """
+        account_data = self.read_header(account_number)
+        if account_data.pop("format_version") < account_format.FORMAT_VERSION:
+            # Older files keep their history inline; give them a journal now.
+            account_format.migrate_account(account_number)
+            account_data.pop("transaction_history", None)
+        account_data.pop("wal_lsn", None)
+        offset = account_data.pop("journal_offset", None)
+        if offset is not None:
+            for transaction in account_format.read_journal_tail(account_number, offset):
+                effect = account_format.BALANCE_EFFECTS.get(transaction["type"], 0)
+                account_data["balance"] += effect * transaction["amount"]
+                if account_data.get("transaction_count") is not None:
+                    account_data["transaction_count"] += 1
+                account_data["last_transaction"] = transaction["date"]
+                if "period" in transaction:
+                    # Month-end postings carry their period; see month_end.py.
+                    account_data["last_month_end"] = transaction["period"]
+        return account_data
+
+    def load_transactions(self, account_number):
+        return compaction.load_transactions(account_number)
+
+    def history(self, account_number):
+        return JournalView(account_number)
+
+    def read_header(self, account_number):
+        try:
+            return account_format.read_header(account_number)
+        except FileNotFoundError:
+            raise AccountNotFoundError(account_number)
+
+    def _append(self, account_number, transactions):
+        """Append to the journal; returns the journal size afterwards."""
+        with open(account_format.journal_filename(account_number), "a") as f:
+            if transactions:
+                f.write("".join(account_format.format_record(t) for t in transactions))
+            return f.tell()
+
+    def _stamp(self):
+        """
+        A change number for a header (``wal_lsn``), newer than the ones this
+        process used before; replay compares them with logged changes.
+        """
+        if self.wal is not None:
+            return self.wal.stamp()
+        with self._stamp_lock:
+            self._last_stamp = max(self._last_stamp + 1, time.time_ns())
+            return self._last_stamp
+
+    def _write_header(self, details, journal_offset, wal_lsn):
+        header = dict(details, journal_offset=journal_offset, wal_lsn=wal_lsn)
+        account_format.write_header(details["account_number"], header)
+
+    def _save(self, details, new_transactions, wal_lsn=None):
+        offset = self._append(details["account_number"], new_transactions)
+        if wal_lsn is None:
+            wal_lsn = self._stamp()
+        self._write_header(details, offset, wal_lsn)
+        self.index.update(details)
+
+    def save_account(self, details, new_transactions=(), publish=False):
+        self.save_accounts([(details, new_transactions)], publish)
+
+    def save_accounts(self, changes, publish=False):
+        changes = [(details, list(transactions)) for details, transactions in changes]
+        publish = (
+            publish
+            and change_feed.enabled
+            and any(transactions for _, transactions in changes)
+        )
+        if self.wal is not None:
+            self._logged_save(changes, publish)
+        elif publish:
+            # The intent records that the events are due; see recover().
+            self._intent_save(changes, uuid.uuid4().hex, publish, sync=False)
+        else:
+            for details, transactions in changes:
+                self._save(details, transactions)
+
+    def _logged(self, changes):
+        logged = []
+        for details, transactions in changes:
+            flags = {}
+            header = account_format.header_filename(details["account_number"])
+            if not os.path.exists(header):
+                # Replay recreates a missing account only from its first save.
+                flags["created"] = True
+            logged.append((details, transactions, flags))
+        return logged
+
+    def _logged_save(self, changes, publish=False):
+        """
+        Log the changes as one record (waiting for its fsync in sync mode),
+        then write the account files; see wal.py. The record stays until the
+        transactions are published too.
+        """
+        feed = {"after": change_feed.position()} if publish else None
+        ticket = self.wal.log(self._logged(changes), feed)
+        paths = []
+        done = True
+        try:
+            for details, transactions in changes:
+                self._save(details, transactions, ticket[1])
+                paths += self._account_paths(details["account_number"])
+            if publish:
+                done = _publish(feed_events(changes))
+        finally:
+            if done:
+                self.wal.done(ticket, paths)
+
+    def _intent_save(self, changes, name, publish, sync):
+        """
+        Write an intent holding every change (a record in the log's format),
+        apply each account, publish the transactions, then drop the intent.
+        Once the intent is on disk recover() can finish the rest.
+        """
+        intent = {
+            "lsn": self._stamp(),
+            "changes": [
+                {"header": details, "transactions": transactions, **flags}
+                for details, transactions, flags in self._logged(changes)
+            ],
+        }
+        if publish:
+            intent["feed"] = {"after": change_feed.position()}
+        pending_dir = resolver.pending_transfers_dir()
+        os.makedirs(pending_dir, exist_ok=True)
+        path = os.path.join(pending_dir, f"{name}.json")
+        with open(f"{path}.tmp", "w") as f:
+            json.dump(intent, f, default=account_format.encode_transaction)
+            if sync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(f"{path}.tmp", path)
+        try:
+            for details, transactions in changes:
+                self._save(details, transactions, intent["lsn"])
+        except OSError as e:
+            print(f"Commit {name} will be completed on recovery: {e}")
+            return
+        if not publish or _publish(feed_events(changes)):
+            os.remove(path)
+
+    @staticmethod
+    def _account_paths(account_number):
+        return [
+            account_format.header_filename(account_number),
+            account_format.journal_filename(account_number),
+        ]
+
+    def _replay(self, record):
+        """
+        Re-apply a logged record (or an intent) to every account whose header
+        is older, then publish what the feed is missing of its transactions.
+        """
+        paths = []
+        changed = False
+        for change in record["changes"]:
+            details = change["header"]
+            account_number = details["account_number"]
+            paths += self._account_paths(account_number)
+            try:
+                header = account_format.read_header(account_number)
+            except FileNotFoundError:
+                # Deleted since, unless the crash came before its first save.
+                if not change.get("created"):
+                    continue
+                header = {"journal_offset": 0}
+            if header.get("wal_lsn", 0) >= record["lsn"]:
+                continue
+            journal = account_format.journal_filename(account_number)
+            offset = header.get("journal_offset")
+            if offset is not None and os.path.exists(journal):
+                # Drop anything appended after the header this change follows.
+                os.truncate(journal, min(offset, os.path.getsize(journal)))
+            self._save(details, change["transactions"], record["lsn"])
+            changed = True
+        if record.get("feed") is not None:
+            change_feed.publish_missing(
+                feed_events(
+                    (change["header"], change["transactions"])
+                    for change in record["changes"]
+                ),
+                record["feed"]["after"],
+            )
+        return paths, changed
+
+    def replace_account(self, details, transactions):
+        account_number = details["account_number"]
+        journal = account_format.journal_filename(account_number)
+        # Written first: ``transactions`` may be a lazy view of the segments.
+        with open(f"{journal}.tmp", "w") as f:
+            for transaction in transactions:
+                f.write(account_format.format_record(transaction))
+            offset = f.tell()
+        index_file = resolver.index_file(account_number)
+        if os.path.exists(index_file):
+            os.remove(index_file)
+        compaction.remove_segments(account_number)
+        os.replace(f"{journal}.tmp", journal)
+        # Not logged: newer than anything logged, and made durable here if
+        # the log is on.
+        self._write_header(details, offset, self._stamp())
+        if self.wal is not None:
+            wal.fsync_paths(self._account_paths(account_number))
+        self.index.update(details)
+
+    def commit(self, changes, txid, publish=False):
+        """
+        Write an fsynced intent holding every change, apply each account, then
+        drop the intent. Once the intent is on disk the commit is durable: a
+        failure while applying is left to recover(). With the write-ahead log
+        on, its record plays the intent's part.
+        """
+        if len(changes) == 1 or self.wal is not None:
+            # A logged record already holds every side.
+            self.save_accounts(changes, publish)
+            return
+        changes = [(details, list(transactions)) for details, transactions in changes]
+        self._intent_save(changes, txid, publish and change_feed.enabled, sync=True)
+
+    def recover(self, locked=None):
+        touched = [[n] for n in compaction.recover_all(locked)]
+        touched += wal.replay(self._replay, locked)
+        pending_dir = resolver.pending_transfers_dir()
+        if not os.path.isdir(pending_dir):
+            return touched
+        for filename in sorted(os.listdir(pending_dir)):
+            if not filename.endswith(".json"):
+                continue
+            path = os.path.join(pending_dir, filename)
+            try:
+                with open(path, "r") as f:
+                    intent = json.load(f)
+            except FileNotFoundError:
+                continue
+            if "lsn" in intent:
+                sides = intent["changes"]
+            else:
+                # Written before intents took the log's record format.
+                sides = intent["sides"]
+            account_numbers = [s["header"]["account_number"] for s in sides]
+            with locked(*account_numbers) if locked else contextlib.nullcontext():
+                if not os.path.exists(path):
+                    # Its process, still running, finished it meanwhile.
+                    continue
+                if "lsn" in intent:
+                    self._replay(intent)
+                else:
+                    for side in sides:
+                        self._recover_side(intent["txid"], side)
+                os.remove(path)
+            touched.append(account_numbers)
+        return touched
+
+    def _recover_side(self, txid, side):
+        account_number = side["header"]["account_number"]
+        transactions = account_format.read_journal(account_number) or []
+        position = None
+        for index in range(len(transactions) - 1, -1, -1):
+            if transactions[index].get("txid") == txid:
+                position = index
+                break
+        if position is None:
+            # Intents written before the storage layer held one transaction.
+            self._append(
+                account_number, side.get("transactions") or [side["transaction"]]
+            )
+        elif position != len(transactions) - 1:
+            # Later transactions were already applied on top of this one.
+            return
+        self._write_header(
+            side["header"],
+            os.path.getsize(account_format.journal_filename(account_number)),
+            self._stamp(),
+        )
+
+    def iter_transactions(
+        self, account_number, start=None, end=None, types=None, page=1, page_size=None
+    ):
+        try:
+            return iter_statement(account_number, start, end, types, page, page_size)
+        except FileNotFoundError:
+            raise AccountNotFoundError(account_number)
+
+    def _remove_files(self, account_number):
+        for filename in [
+            account_format.header_filename(account_number),
+            account_format.journal_filename(account_number),
+            resolver.index_file(account_number),
+        ]:
+            if os.path.exists(filename):
+                os.remove(filename)
+        compaction.remove_segments(account_number)
+
+    def delete_account(self, account_number):
+        self._remove_files(account_number)
+        self.index.remove(account_number)
+        self.frozen.unfreeze(account_number)
+
+    def delete_accounts(self, account_numbers):
+        for account_number in account_numbers:
+            self._remove_files(account_number)
+        self.index.remove(*account_numbers)
+        self.frozen.unfreeze_many(account_numbers)
+
+    def list_account_numbers(self):
+        return resolver.iter_account_numbers()
+
+    def find_accounts_by_owner(self, owner_id):
+        return self.index.by_owner(owner_id)
+
+    def find_accounts_by_name(self, prefix, limit=None):
+        return self.index.by_name_prefix(prefix, limit)
+
+    def account_exists(self, account_number):
+        # The header is checked too, in case a crash kept it out of the index.
+        return self.index.contains(account_number) or os.path.exists(
+            account_format.header_filename(account_number)
+        )
+
+    def existing_accounts(self, account_numbers):
+        existing = self.index.contains_many(account_numbers)
+        return existing | {
+            n
+            for n in account_numbers
+            if n not in existing and os.path.exists(account_format.header_filename(n))
+        }
+
+    def account_location(self, account_number):
+        location = self.index.location(account_number)
+        if location is None and self.account_exists(account_number):
+            location = account_format.header_filename(account_number)
+        return location
+
+    def reindex(self):
+        return self.index.rebuild()
+
+    def is_frozen(self, account_number):
+        return self.frozen.is_frozen(account_number)
+
+    def freeze(self, account_number):
+        return self.frozen.freeze(account_number)
+
+    def freeze_many(self, account_numbers):
+        return self.frozen.freeze_many(account_numbers)
+
+    def unfreeze_many(self, account_numbers):
+        return self.frozen.unfreeze_many(account_numbers)
+
+    def unfreeze(self, account_number):
+        return self.frozen.unfreeze(account_number)
+
+    def has_frozen_accounts(self):
+        return self.frozen.exists()
+
+    def close(self):
+        if self.wal is not None:
+            self.wal.close()
+
+
+class ConnectionPool:
+    """A small pool of SQLite connections shared by threads of one process."""
+
+    def __init__(self, path, size=8):
+        self.path = path
+        self.size = size
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        # Connections must not be shared with a forked child.
+        self._pid = os.getpid()
+        self._idle = queue.LifoQueue()
+        self._created = 0
+
+    def _connect(self):
+        conn = sqlite3.connect(
+            self.path,
+            timeout=30,
+            isolation_level=None,
+            check_same_thread=False,
+            cached_statements=256,
+        )
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        # BANK_DURABILITY=sync makes every commit fsync, like the file WAL.
+        synchronous = "NORMAL"
+        if os.environ.get("BANK_DURABILITY") == "sync":
+            synchronous = "FULL"
+        conn.execute(f"PRAGMA synchronous={synchronous}")
+        return conn
+
+    @contextlib.contextmanager
+    def connection(self):
+        if self._pid != os.getpid():
+            self._reset()
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            conn = None
+            with self._lock:
+                if self._created < self.size:
+                    self._created += 1
+                    conn = self._connect()
+            if conn is None:
+                conn = self._idle.get()
+        try:
+            yield conn
+        finally:
+            self._idle.put(conn)
+
+    @contextlib.contextmanager
+    def transaction(self):
+        with self.connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+        self._created = 0
+
+
+class SQLiteStorage(StorageBackend):
+    name = "sqlite"
+    ACCOUNT_COLUMNS = [
+        "owner_id",
+        "name",
+        "age",
+        "salary",
+        "pin",
+        "balance",
+        "transaction_limit",
+    ]
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS accounts (
+            account_number TEXT PRIMARY KEY,
+            owner_id TEXT,
+            name TEXT,
+            age INTEGER,
+            salary REAL,
+            pin TEXT,
+            balance INTEGER NOT NULL DEFAULT 0,
+            transaction_limit REAL,
+            extra TEXT
+        );
+        CREATE INDEX IF NOT EXISTS accounts_owner ON accounts(owner_id);
+        CREATE INDEX IF NOT EXISTS accounts_name ON accounts(name);
+        CREATE INDEX IF NOT EXISTS accounts_name_nocase
+            ON accounts(name COLLATE NOCASE);
+        CREATE TABLE IF NOT EXISTS transactions (
+            id INTEGER PRIMARY KEY,
+            account_number TEXT NOT NULL,
+            date TEXT NOT NULL,
+            type TEXT NOT NULL,
+            amount INTEGER NOT NULL,
+            recipient TEXT,
+            extra TEXT
+        );
+        CREATE INDEX IF NOT EXISTS transactions_account_date
+            ON transactions(account_number, date, id);
+        CREATE TABLE IF NOT EXISTS frozen_accounts (
+            account_number TEXT PRIMARY KEY
+        );
+        CREATE TABLE IF NOT EXISTS feed_outbox (
+            id INTEGER PRIMARY KEY,
+            feed_after INTEGER NOT NULL,
+            events TEXT NOT NULL
+        );
+    """
+    UPSERT_ACCOUNT = """
+        INSERT INTO accounts
+            (account_number, owner_id, name, age, salary, pin, balance,
+             transaction_limit, extra)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(account_number) DO UPDATE SET
+            owner_id = excluded.owner_id, name = excluded.name,
+            age = excluded.age, salary = excluded.salary, pin = excluded.pin,
+            balance = excluded.balance,
+            transaction_limit = excluded.transaction_limit,
+            extra = excluded.extra
+    """
+    INSERT_TRANSACTION = """
+        INSERT INTO transactions (account_number, date, type, amount, recipient, extra)
+        VALUES (?, ?, ?, ?, ?, ?)
+    """
+    CHUNK_SIZE = 1000
+    # PRAGMA user_version of the schema above. 1: balance and amount are
+    # INTEGER cents (version 0 stored them as REAL dollars).
+    SCHEMA_VERSION = 1
+
+    def __init__(self, path=None, pool_size=8):
+        self.path = os.path.abspath(path or resolver.path("bank.db"))
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.pool = ConnectionPool(self.path, pool_size)
+        self._create_schema()
+        # feed_outbox rows whose events are published; the next save deletes
+        # them.
+        self._outbox_lock = threading.Lock()
+        self._published = []
+
+    def _create_schema(self):
+        # One IMMEDIATE transaction, so processes opening an old database
+        # together migrate it once.
+        with self.pool.transaction() as conn:
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            migrate = (
+                version < 1
+                and conn.execute(
+                    "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'accounts'"
+                ).fetchone()
+            )
+            if migrate:
+                # Move the REAL tables aside (their indexes keep their names,
+                # so drop them) and copy them into the new ones as cents.
+                for table in ["accounts", "transactions"]:
+                    conn.execute(f"ALTER TABLE {table} RENAME TO old_{table}")
+                for row in conn.execute(
+                    "SELECT name FROM sqlite_master WHERE type = 'index' "
+                    "AND tbl_name LIKE 'old_%' AND sql IS NOT NULL"
+                ).fetchall():
+                    conn.execute(f"DROP INDEX {row['name']}")
+            for statement in self.SCHEMA.split(";"):
+                if statement.strip():
+                    conn.execute(statement)
+            if migrate:
+                conn.execute(
+                    "INSERT INTO accounts SELECT account_number, owner_id, name, "
+                    "age, salary, pin, CAST(ROUND(balance * 100) AS INTEGER), "
+                    "transaction_limit, extra FROM old_accounts"
+                )
+                conn.execute(
+                    "INSERT INTO transactions SELECT id, account_number, date, "
+                    "type, CAST(ROUND(amount * 100) AS INTEGER), recipient, extra "
+                    "FROM old_transactions"
+                )
+                conn.execute("DROP TABLE old_accounts")
+                conn.execute("DROP TABLE old_transactions")
+            if version < self.SCHEMA_VERSION:
+                conn.execute(f"PRAGMA user_version = {self.SCHEMA_VERSION}")
+
+    def _account_row(self, details):
+        extra = {
+            k: v
+            for k, v in details.items()
+            if k != "account_number" and k not in self.ACCOUNT_COLUMNS
+        }
+        row = {column: details.get(column) for column in self.ACCOUNT_COLUMNS}
+        row["balance"] = to_cents(row["balance"] or 0)
+        return (
+            details["account_number"],
+            *row.values(),
+            json.dumps(extra) if extra else None,
+        )
+
+    def _transaction_rows(self, account_number, transactions):
+        for transaction in transactions:
+            extra = {
+                k: v for k, v in transaction.items() if k not in CORE_TRANSACTION_FIELDS
+            }
+            yield (
+                account_number,
+                transaction["date"],
+                transaction["type"],
+                to_cents(transaction["amount"]),
+                transaction.get("recipient"),
+                json.dumps(extra) if extra else None,
+            )
+
+    @staticmethod
+    def _transaction(row):
+        transaction = {
+            "date": row["date"],
+            "type": row["type"],
+            "amount": row["amount"] / 100,
+            "recipient": row["recipient"],
+        }
+        if row["extra"]:
+            transaction.update(json.loads(row["extra"]))
+        return transaction
+
+    def _write(self, conn, details, transactions):
+        conn.execute(self.UPSERT_ACCOUNT, self._account_row(details))
+        if transactions:
+            conn.executemany(
+                self.INSERT_TRANSACTION,
+                self._transaction_rows(details["account_number"], transactions),
+            )
+
+    def read_header(self, account_number):
+        with self.pool.connection() as conn:
+            row = conn.execute(
+                "SELECT * FROM accounts WHERE account_number = ?", (account_number,)
+            ).fetchone()
+        if row is None:
+            raise AccountNotFoundError(account_number)
+        account_data = {k: row[k] for k in ["account_number", *self.ACCOUNT_COLUMNS]}
+        account_data["balance"] = row["balance"] / 100
+        if row["extra"]:
+            account_data.update(json.loads(row["extra"]))
+        return account_data
+
+    def load_account(self, account_number):
+        # Commits are atomic, so the stored row is always a complete snapshot.
+        return self.read_header(account_number)
+
+    def load_transactions(self, account_number):
+        with self.pool.connection() as conn:
+            rows = conn.execute(
+                "SELECT date, type, amount, recipient, extra FROM transactions "
+                "WHERE account_number = ? ORDER BY id",
+                (account_number,),
+            ).fetchall()
+        return [self._transaction(row) for row in rows]
+
+    def save_account(self, details, new_transactions=(), publish=False):
+        self.save_accounts([(details, new_transactions)], publish)
+
+    def replace_account(self, details, transactions):
+        with self.pool.transaction() as conn:
+            conn.execute(
+                "DELETE FROM transactions WHERE account_number = ?",
+                (details["account_number"],),
+            )
+            self._write(conn, details, transactions)
+
+    def save_accounts(self, changes, publish=False):
+        changes = list(changes)
+        events = feed_events(changes) if publish and change_feed.enabled else []
+        with self.pool.transaction() as conn:
+            for details, transactions in changes:
+                self._write(conn, details, transactions)
+            outbox_id = self._add_outbox(conn, events)
+        if events and _publish(events):
+            with self._outbox_lock:
+                self._published.append(outbox_id)
+
+    def commit(self, changes, txid, publish=False):
+        self.save_accounts(changes, publish)
+
+    def _add_outbox(self, conn, events):
+        """Record in the transaction that ``events`` are due in the feed."""
+        with self._outbox_lock:
+            published, self._published = self._published, []
+        if published:
+            conn.executemany(
+                "DELETE FROM feed_outbox WHERE id = ?", [(i,) for i in published]
+            )
+        if not events:
+            return None
+        return conn.execute(
+            "INSERT INTO feed_outbox (feed_after, events) VALUES (?, ?)",
+            (
+                change_feed.position(),
+                json.dumps(events, default=account_format.encode_transaction),
+            ),
+        ).lastrowid
+
+    def recover(self, locked=None):
+        """Publish the events of outbox rows the feed may be missing."""
+        with self.pool.connection() as conn:
+            rows = conn.execute(
+                "SELECT id, feed_after, events FROM feed_outbox ORDER BY id"
+            ).fetchall()
+        for row in rows:
+            events = json.loads(row["events"])
+            account_numbers = sorted({event["account_number"] for event in events})
+            # A running process publishes its rows under these locks.
+            with locked(*account_numbers) if locked else contextlib.nullcontext():
+                with self.pool.connection() as conn:
+                    if not conn.execute(
+                        "SELECT 1 FROM feed_outbox WHERE id = ?", (row["id"],)
+                    ).fetchone():
+                        continue
+                change_feed.publish_missing(events, row["feed_after"])
+                with self.pool.transaction() as conn:
+                    conn.execute("DELETE FROM feed_outbox WHERE id = ?", (row["id"],))
+        return []
+
+    def _iter_rows(self, account_number, start, end):
+        # Keyset pagination: the connection is only held while fetching a chunk.
+        last_date = start or ""
+        last_id = -1
+        while True:
+            query = (
+                "SELECT id, date, type, amount, recipient, extra FROM transactions "
+                "WHERE account_number = ? AND (date > ? OR (date = ? AND id > ?))"
+            )
+            params = [account_number, last_date, last_date, last_id]
+            if end is not None:
+                query += " AND date <= ?"
+                params.append(end)
+            query += " ORDER BY date, id LIMIT ?"
+            params.append(self.CHUNK_SIZE)
+            with self.pool.connection() as conn:
+                rows = conn.execute(query, params).fetchall()
+            for row in rows:
+                yield self._transaction(row)
+            if len(rows) < self.CHUNK_SIZE:
+                return
+            last_date, last_id = rows[-1]["date"], rows[-1]["id"]
+
+    def iter_transactions(
+        self, account_number, start=None, end=None, types=None, page=1, page_size=None
+    ):
+        self.read_header(account_number)
+        rows = self._iter_rows(
+            account_number,
+            _bound(start, end_of_day=False),
+            _bound(end, end_of_day=True),
+        )
+        return filter_transactions(rows, start, end, types, page, page_size)
+
+    def delete_account(self, account_number):
+        self.delete_accounts([account_number])
+
+    def delete_accounts(self, account_numbers):
+        with self.pool.transaction() as conn:
+            for table in ["transactions", "accounts", "frozen_accounts"]:
+                conn.executemany(
+                    f"DELETE FROM {table} WHERE account_number = ?",
+                    [(n,) for n in account_numbers],
+                )
+
+    def list_account_numbers(self):
+        last = ""
+        while True:
+            with self.pool.connection() as conn:
+                rows = conn.execute(
+                    "SELECT account_number FROM accounts WHERE account_number > ? "
+                    "ORDER BY account_number LIMIT ?",
+                    (last, self.CHUNK_SIZE),
+                ).fetchall()
+            for row in rows:
+                yield row["account_number"]
+            if len(rows) < self.CHUNK_SIZE:
+                return
+            last = rows[-1]["account_number"]
+
+    def find_accounts_by_owner(self, owner_id):
+        with self.pool.connection() as conn:
+            rows = conn.execute(
+                "SELECT account_number FROM accounts WHERE owner_id = ?", (owner_id,)
+            ).fetchall()
+        return [row["account_number"] for row in rows]
+
+    def find_accounts_by_name(self, prefix, limit=None):
+        # A range on the NOCASE index rather than LIKE, which would scan.
+        with self.pool.connection() as conn:
+            rows = conn.execute(
+                "SELECT account_number FROM accounts "
+                "WHERE name >= ? COLLATE NOCASE AND name < ? COLLATE NOCASE "
+                "ORDER BY name COLLATE NOCASE, account_number LIMIT ?",
+                (prefix, prefix + "\U0010ffff", -1 if limit is None else limit),
+            ).fetchall()
+        return [row["account_number"] for row in rows]
+
+    def account_exists(self, account_number):
+        return self.account_location(account_number) is not None
+
+    def existing_accounts(self, account_numbers):
+        account_numbers = list(account_numbers)
+        existing = set()
+        with self.pool.connection() as conn:
+            for i in range(0, len(account_numbers), self.CHUNK_SIZE):
+                chunk = account_numbers[i : i + self.CHUNK_SIZE]
+                rows = conn.execute(
+                    "SELECT account_number FROM accounts WHERE account_number IN "
+                    f"({','.join('?' * len(chunk))})",
+                    chunk,
+                ).fetchall()
+                existing.update(row["account_number"] for row in rows)
+        return existing
+
+    def account_location(self, account_number):
+        with self.pool.connection() as conn:
+            row = conn.execute(
+                "SELECT 1 FROM accounts WHERE account_number = ?", (account_number,)
+            ).fetchone()
+        return self.path if row is not None else None
+
+    def reindex(self):
+        with self.pool.transaction() as conn:
+            conn.execute("REINDEX accounts")
+            return conn.execute("SELECT COUNT(*) FROM accounts").fetchone()[0]
+
+    def is_frozen(self, account_number):
+        with self.pool.connection() as conn:
+            row = conn.execute(
+                "SELECT 1 FROM frozen_accounts WHERE account_number = ?",
+                (account_number,),
+            ).fetchone()
+        return row is not None
+
+    def freeze(self, account_number):
+        with self.pool.transaction() as conn:
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO frozen_accounts (account_number) VALUES (?)",
+                (account_number,),
+            )
+        return cursor.rowcount == 1
+
+    def unfreeze(self, account_number):
+        with self.pool.transaction() as conn:
+            cursor = conn.execute(
+                "DELETE FROM frozen_accounts WHERE account_number = ?",
+                (account_number,),
+            )
+        return cursor.rowcount == 1
+
+    def freeze_many(self, account_numbers):
+        frozen = []
+        with self.pool.transaction() as conn:
+            for account_number in dict.fromkeys(account_numbers):
+                cursor = conn.execute(
+                    "INSERT OR IGNORE INTO frozen_accounts (account_number) "
+                    "VALUES (?)",
+                    (account_number,),
+                )
+                if cursor.rowcount == 1:
+                    frozen.append(account_number)
+        return frozen
+
+    def unfreeze_many(self, account_numbers):
+        unfrozen = []
+        with self.pool.transaction() as conn:
+            for account_number in dict.fromkeys(account_numbers):
+                cursor = conn.execute(
+                    "DELETE FROM frozen_accounts WHERE account_number = ?",
+                    (account_number,),
+                )
+                if cursor.rowcount == 1:
+                    unfrozen.append(account_number)
+        return unfrozen
+
+    def has_frozen_accounts(self):
+        with self.pool.connection() as conn:
+            row = conn.execute("SELECT 1 FROM frozen_accounts LIMIT 1").fetchone()
+        return row is not None
+
+    def close(self):
+        with self._outbox_lock:
+            published, self._published = self._published, []
+        if published:
+            with self.pool.transaction() as conn:
+                conn.executemany(
+                    "DELETE FROM feed_outbox WHERE id = ?", [(i,) for i in published]
+                )
+        self.pool.close()
+
+
+BACKENDS = {"file": FileStorage, "sqlite": SQLiteStorage}
+_storage = None
+_storage_lock = threading.Lock()
+
+
+def create_storage(name=None):
+    name = name or os.environ.get("BANK_STORAGE", "file")
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown storage backend '{name}'.")
+    if name == "sqlite":
+        return SQLiteStorage(os.environ.get("BANK_SQLITE_PATH"))
+    return BACKENDS[name]()
+
+
+def get_storage():
+    global _storage
+    if _storage is None:
+        with _storage_lock:
+            if _storage is None:
+                _storage = create_storage()
+    return _storage
+
+
+def set_storage(backend):
+    """Replace the active backend (a StorageBackend or a backend name)."""
+    global _storage
+    if isinstance(backend, str):
+        backend = create_storage(backend)
+    with _storage_lock:
+        previous, _storage = _storage, backend
+    if previous is not None and previous is not backend:
+        previous.close()
+    return backend
+
+
+def copy_accounts(source, target):
+    """Copy every account and the frozen set from one backend to another."""
+    copied = 0
+    for account_number in source.list_account_numbers():
+        target.replace_account(
+            source.load_account(account_number),
+            source.load_transactions(account_number),
+        )
+        if source.is_frozen(account_number):
+            target.freeze(account_number)
+        copied += 1
+    return copied
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 2 and sys.argv[1] == "reindex":
+        print(f"Indexed {get_storage().reindex()} account(s).")
+        sys.exit(0)
+    if len(sys.argv) != 4 or sys.argv[1] != "copy":
+        print("Usage: python storage.py copy {file|sqlite} {file|sqlite}")
+        print("       python storage.py reindex")
+        sys.exit(1)
+    copied = copy_accounts(create_storage(sys.argv[2]), create_storage(sys.argv[3]))
+    print(f"Copied {copied} account(s) from {sys.argv[2]} to {sys.argv[3]}.")
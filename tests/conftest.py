@@ -0,0 +1,39 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from audit_log import audit_logger
+from paths import resolver
+from storage import set_storage
+
+
+@pytest.fixture
+def bank(tmp_path, monkeypatch):
+    """An empty data root (the file backend) in the current directory."""
+    monkeypatch.chdir(tmp_path)
+    resolver.configure(".", resolver.levels)
+    set_storage("file")
+    yield tmp_path
+    # Written before the directory goes away.
+    audit_logger.flush()
+
+
+def run_python(code, cwd, *args, **env):
+    """
+    Run ``code`` in a new interpreter in ``cwd``, with the repository on its
+    path and ``env`` added to the environment (storage, durability and feed
+    settings are read once, at import).
+    """
+    return subprocess.run(
+        [sys.executable, "-c", code, *args],
+        cwd=cwd,
+        env={**os.environ, "PYTHONPATH": ROOT, **env},
+        capture_output=True,
+        text=True,
+        timeout=120,
+    )
@@ -0,0 +1,226 @@
+import json
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+
+from conftest import ROOT, run_python
+
+import transfers
+from account_cache import AccountRepository
+from batch import BatchProcessor
+from project import UserActions
+from storage import get_storage
+
+OPEN_ACCOUNTS = """
+from project import UserActions
+for number in "12":
+    account = UserActions()
+    account.owner_id = number
+    account.name = "test"
+    account.age = 30
+    account.salary = 0.0
+    account.account_number = number
+    account.pin = "0000"
+    account.balance = 100
+    account.save_to_file(rewrite_journal=True)
+"""
+
+# Recovers, then prints the balances, journals and transaction events.
+RECOVER = """
+import json
+from changefeed import FeedReader
+from project import UserActions, transfer_engine
+from storage import get_storage
+
+transfer_engine.recover()
+print(json.dumps({
+    "balances": {n: UserActions.load(n).balance for n in "12"},
+    "journals": {
+        n: [[t["type"], t["amount"]] for t in get_storage().load_transactions(n)]
+        for n in "12"
+    },
+    "feed": [
+        [e["account_number"], e["transaction"]["type"], e["transaction"]["amount"]]
+        for e in FeedReader().read(0, 1000)
+        if e["kind"] == "transaction"
+    ],
+}))
+"""
+
+# Dies (exit status 3) while saving the recipient's side of a transfer.
+CRASH_IN_COMMIT = """
+import os
+import storage
+from project import UserActions
+
+save = storage.FileStorage._save
+calls = []
+
+
+def crash(self, *args):
+    calls.append(args)
+    if len(calls) == 2:
+        os._exit(3)
+    return save(self, *args)
+
+
+storage.FileStorage._save = crash
+UserActions.load("1").transfer_amount(UserActions.load("2"), 40)
+"""
+
+# Dies (exit status 3) just before or just after publishing a deposit.
+CRASH_AROUND_PUBLISH = """
+import os
+import sys
+import changefeed
+from project import UserActions
+
+publish = changefeed.ChangeFeed.publish
+
+
+def crash(self, events):
+    if sys.argv[1] == "after":
+        publish(self, events)
+    os._exit(3)
+
+
+changefeed.ChangeFeed.publish = crash
+UserActions.load("1").deposit_amount(25)
+"""
+
+
+def open_account(number, balance):
+    account = UserActions()
+    account.owner_id = number
+    account.name = "test"
+    account.age = 30
+    account.salary = 0.0
+    account.account_number = number
+    account.pin = "0000"
+    account.balance = balance
+    account.save_to_file(rewrite_journal=True)
+    return account
+
+
+def crash_and_recover(directory, crash, *args, **env):
+    assert run_python(OPEN_ACCOUNTS, directory, **env).returncode == 0
+    assert run_python(crash, directory, *args, **env).returncode == 3
+    first = run_python(RECOVER, directory, **env)
+    assert first.returncode == 0, first.stderr
+    # A second recovery finds nothing left to do.
+    second = run_python(RECOVER, directory, **env)
+    assert json.loads(second.stdout) == json.loads(first.stdout)
+    return json.loads(first.stdout)
+
+
+def test_transfers_conserve_money_across_processes(bank):
+    assert transfers.stress(accounts=8, transfers=300, workers=8, processes=3)
+
+
+@pytest.mark.parametrize("durability", ["off", "sync"])
+def test_interrupted_transfer_is_completed_on_recovery(tmp_path, durability):
+    # With the log off the intent file is replayed; in sync mode the log.
+    state = crash_and_recover(tmp_path, CRASH_IN_COMMIT, BANK_DURABILITY=durability)
+    assert state["balances"] == {"1": 60, "2": 140}
+    assert state["journals"] == {
+        "1": [["Transfer", 40]],
+        "2": [["Transfer Received", 40]],
+    }
+    assert state["feed"] == [["1", "Transfer", 40], ["2", "Transfer Received", 40]]
+
+
+@pytest.mark.parametrize("where", ["before", "after"])
+@pytest.mark.parametrize(
+    "backend, durability", [("file", "off"), ("file", "sync"), ("sqlite", "off")]
+)
+def test_feed_gets_each_committed_transaction_once(
+    tmp_path, backend, durability, where
+):
+    state = crash_and_recover(
+        tmp_path,
+        CRASH_AROUND_PUBLISH,
+        where,
+        BANK_STORAGE=backend,
+        BANK_DURABILITY=durability,
+    )
+    assert state["balances"]["1"] == 125
+    assert state["feed"] == [["1", "Deposit", 25]]
+
+
+def test_write_back_flush_keeps_changes_made_meanwhile(bank):
+    open_account("1", 0)
+    repository = AccountRepository(
+        UserActions.load, write_back=True, flush_many=UserActions.flush_many
+    )
+    repository.get("1").deposit_amount(100)
+    UserActions.load("1").deposit_amount(500)
+    repository.get("1").withdraw(30)
+    repository.flush()
+
+    stored = get_storage().load_account("1")
+    assert stored["balance"] == 570
+    assert stored["transaction_count"] == 3
+    amounts = [t["amount"] for t in get_storage().load_transactions("1")]
+    assert sorted(amounts) == [30, 100, 500]
+
+
+def test_write_back_transfer_is_committed_before_the_flush(bank):
+    open_account("1", 100)
+    open_account("2", 100)
+    processor = BatchProcessor()
+    try:
+        processor.apply_row(
+            {"account_number": "1", "operation": "deposit", "amount": "50"}
+        )
+        processor.apply_row(
+            {
+                "account_number": "1",
+                "operation": "transfer",
+                "amount": "30",
+                "recipient": "2",
+            }
+        )
+        # The pending deposit is written first, then both sides together.
+        assert get_storage().load_account("1")["balance"] == 120
+        assert get_storage().load_account("2")["balance"] == 130
+        assert [t["type"] for t in get_storage().load_transactions("1")] == [
+            "Deposit",
+            "Transfer",
+        ]
+    finally:
+        processor.flush()
+
+
+def test_batch_keeps_accounts_locked_until_flush(bank):
+    open_account("1", 0)
+    processor = BatchProcessor()
+    processor.apply_row(
+        {"account_number": "1", "operation": "deposit", "amount": "100"}
+    )
+    other = subprocess.Popen(
+        [
+            sys.executable,
+            "-c",
+            "from project import UserActions\n"
+            "UserActions.load('1').deposit_amount(500)",
+        ],
+        env={**os.environ, "PYTHONPATH": ROOT},
+        stdout=subprocess.DEVNULL,
+    )
+    try:
+        time.sleep(1.5)
+        # The other process waits for the batch instead of overwriting it.
+        assert other.poll() is None
+        processor.apply_row(
+            {"account_number": "1", "operation": "withdraw", "amount": "30"}
+        )
+    finally:
+        processor.flush()
+    assert other.wait(60) == 0
+
+    stored = get_storage().load_account("1")
+    assert stored["balance"] == 570
+    assert stored["transaction_count"] == 3
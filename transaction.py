@@ -0,0 +1,127 @@
+"""
+Compact in-memory transaction records.
+
+Journals, segments and the SQLite backend keep storing transactions as
+JSON-style dicts (``{"date": "YYYY-MM-DD HH:MM:SS", "type": ..., "amount": ...,
+"recipient": ...}`` plus any extra keys). In memory an account's history holds
+Transaction objects instead: they have ``__slots__``, keep the amount in
+integer cents and the date as an integer timestamp, and share their type and
+recipient strings. They still read like the dicts they replace
+(``transaction["amount"]``, ``.get()``, ``dict(transaction)``), so statement
+formatting and the storage backends accept either kind.
+
+Dates stay naive local wall-clock times, as they always were; the timestamp
+counts that wall-clock time in seconds from 1970-01-01 00:00:00, so every date
+string round-trips exactly.
+"""
+
+import datetime
+import math
+import sys
+import time
+
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+CORE_FIELDS = ("date", "type", "amount", "recipient")
+_EPOCH = datetime.datetime(1970, 1, 1)
+_SECOND = datetime.timedelta(seconds=1)
+
+
+def to_cents(amount):
+    return round(amount * 100)
+
+
+def validate_amount(amount, kind):
+    """Raise ValueError unless ``amount`` is finite and at least a cent."""
+    if not math.isfinite(amount):
+        raise ValueError(f"Invalid {kind} amount. Amount must be a finite number.")
+    if to_cents(amount) <= 0:
+        raise ValueError(f"Invalid {kind} amount. Amount must be greater than zero.")
+
+
+def to_timestamp(date):
+    return (datetime.datetime.fromisoformat(date) - _EPOCH) // _SECOND
+
+
+def format_date(timestamp):
+    return time.strftime(DATE_FORMAT, time.gmtime(timestamp))
+
+
+def now_timestamp():
+    return (datetime.datetime.now().replace(microsecond=0) - _EPOCH) // _SECOND
+
+
+class Transaction:
+    __slots__ = ("timestamp", "type", "cents", "recipient", "extra")
+
+    def __init__(self, timestamp, type, cents, recipient=None, extra=None):
+        self.timestamp = timestamp
+        self.type = sys.intern(type)
+        self.cents = cents
+        self.recipient = sys.intern(recipient) if recipient is not None else None
+        # Keys beyond the core four (txid, sender, period); None when empty.
+        self.extra = extra or None
+
+    @classmethod
+    def create(cls, transaction_type, amount, recipient=None, **extra):
+        return cls(
+            now_timestamp(), transaction_type, to_cents(amount), recipient, extra
+        )
+
+    @classmethod
+    def from_dict(cls, record):
+        # A record without a recipient can still carry extra keys.
+        extra = {k: v for k, v in record.items() if k not in CORE_FIELDS}
+        return cls(
+            to_timestamp(record["date"]),
+            record["type"],
+            to_cents(record["amount"]),
+            record.get("recipient"),
+            extra,
+        )
+
+    @property
+    def date(self):
+        return format_date(self.timestamp)
+
+    @property
+    def amount(self):
+        return self.cents / 100
+
+    def keys(self):
+        if self.extra:
+            return [*CORE_FIELDS, *self.extra]
+        return list(CORE_FIELDS)
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __getitem__(self, key):
+        if key == "date":
+            return self.date
+        if key == "type":
+            return self.type
+        if key == "amount":
+            return self.amount
+        if key == "recipient":
+            return self.recipient
+        if self.extra and key in self.extra:
+            return self.extra[key]
+        raise KeyError(key)
+
+    def __contains__(self, key):
+        return key in CORE_FIELDS or bool(self.extra and key in self.extra)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def items(self):
+        return [(key, self[key]) for key in self.keys()]
+
+    def to_dict(self):
+        return dict(self.items())
+
+    def __repr__(self):
+        return f"Transaction({self.to_dict()!r})"
@@ -0,0 +1,324 @@
+"""
+Transfer engine: atomic, concurrency-safe transfers between two accounts.
+
+Both accounts are locked in sorted account-number order, first with an
+in-process lock and then with an advisory file lock, so concurrent transfers
+in any direction cannot deadlock and other processes cannot interleave. With
+the locks held the balances are re-read from storage, both sides are applied
+and both are committed together through StorageBackend.commit(): the file
+backend writes an fsynced intent (both headers and both journal records,
+sharing one txid) before touching either account, SQLite uses a single
+transaction. recover() finishes any commit left behind by a crash.
+
+Accounts held by a write-back AccountRepository (autosave off) are committed
+the same way: their pending changes are flushed first, and the repository
+keeps both locked until its next flush.
+
+Run ``python transfers.py stress`` to check that the total money in the system
+is conserved under contention.
+"""
+
+import argparse
+import contextlib
+import os
+import random
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from paths import resolver
+from storage import get_storage
+from transaction import validate_amount
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not available on Windows
+    fcntl = None
+
+# Accounts whose file lock the current thread holds, through any AccountLocks.
+_owned = threading.local()
+
+
+class AccountLocks:
+    def __init__(self):
+        self._locks = {}
+        self._guard = threading.Lock()
+        # Lock files of the accounts taken with hold(), until release().
+        self._held = {}
+
+    def _lock_for(self, account_number):
+        with self._guard:
+            lock = self._locks.get(account_number)
+            if lock is None:
+                lock = self._locks[account_number] = threading.RLock()
+            return lock
+
+    @staticmethod
+    def _owned_accounts():
+        owned = getattr(_owned, "accounts", None)
+        if owned is None:
+            owned = _owned.accounts = set()
+        return owned
+
+    @contextlib.contextmanager
+    def locked(self, *account_numbers):
+        owned = self._owned_accounts()
+        held = []
+        entered = []
+        try:
+            for account_number in sorted(set(account_numbers)):
+                lock = self._lock_for(account_number)
+                lock.acquire()
+                if account_number in owned:
+                    # Nested: the outer block holds the file lock already, and
+                    # a second flock on a new descriptor would wait for it.
+                    held.append((lock, None))
+                    continue
+                held.append((lock, self._lock_file(account_number)))
+                owned.add(account_number)
+                entered.append(account_number)
+            yield
+        finally:
+            for lock, lock_file in reversed(held):
+                if lock_file is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+                    lock_file.close()
+                lock.release()
+            owned.difference_update(entered)
+
+    def hold(self, account_number, blocking=True):
+        """
+        Lock an account outside a with block, until the same thread calls
+        release(); locked() blocks inside count as nested. Without
+        ``blocking``, returns False instead of waiting for another thread or
+        process.
+        """
+        owned = self._owned_accounts()
+        if account_number in owned:
+            raise RuntimeError(f"Account {account_number} is already locked.")
+        lock = self._lock_for(account_number)
+        if not lock.acquire(blocking):
+            return False
+        try:
+            lock_file = self._lock_file(account_number, blocking)
+        except BlockingIOError:
+            lock.release()
+            return False
+        except BaseException:
+            lock.release()
+            raise
+        self._held[account_number] = lock_file
+        owned.add(account_number)
+        return True
+
+    def release(self, account_number):
+        lock_file = self._held.pop(account_number)
+        if lock_file is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+            lock_file.close()
+        self._owned_accounts().discard(account_number)
+        self._lock_for(account_number).release()
+
+    def _lock_file(self, account_number, blocking=True):
+        if fcntl is None:
+            return None
+        lock_file = open(resolver.lock_file(account_number), "a")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        except BaseException:
+            lock_file.close()
+            raise
+        return lock_file
+
+
+class TransferEngine:
+    def __init__(self, repository=None, max_workers=8):
+        self.repository = repository
+        self.max_workers = max_workers
+        self.locks = AccountLocks()
+
+    def locked(self, *account_numbers):
+        return self.locks.locked(*account_numbers)
+
+    def transfer(self, sender, recipient, amount):
+        """
+        Move ``amount`` from sender to recipient. Raises ValueError when the
+        sender's balance is insufficient or a sender limit would be exceeded;
+        nothing is changed in that case.
+        """
+        repository = sender.repository or recipient.repository
+        held = repository is not None and repository.hold(sender, recipient)
+        with self.locked(sender.account_number, recipient.account_number):
+            if not held:
+                self._refresh(sender)
+                self._refresh(recipient)
+            pending = [a for a in (sender, recipient) if a.dirty]
+            if pending:
+                # Written first, so the commit below holds only the transfer.
+                sender.flush_many(pending)
+            sender.check_limits(amount)
+            if sender.balance < amount:
+                raise ValueError("Insufficient balance for transfer.")
+
+            txid = uuid.uuid4().hex
+            debit = sender.new_transaction(
+                "Transfer", amount, recipient.account_number, txid=txid
+            )
+            credit = recipient.new_transaction(
+                "Transfer Received", amount, sender=sender.account_number, txid=txid
+            )
+            sender.balance -= amount
+            recipient.balance += amount
+            sender.record_outgoing(amount)
+            sender.record_transaction(debit)
+            recipient.record_transaction(credit)
+            self._commit(txid, [(sender, debit), (recipient, credit)])
+            return txid
+
+    def run(self, transfers):
+        """
+        Execute (sender_number, recipient_number, amount) tuples on a thread
+        pool; transfers between disjoint account pairs run in parallel.
+        Returns one (ok, message) tuple per transfer, in input order.
+        """
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            return list(pool.map(lambda t: self._run_one(*t), transfers))
+
+    def _run_one(self, sender_number, recipient_number, amount):
+        try:
+            sender = self.repository.get(sender_number)
+            recipient = self.repository.get(recipient_number)
+            validate_amount(amount, "transfer")
+            if sender.is_account_frozen():
+                raise ValueError("Account is frozen.")
+            return True, self.transfer(sender, recipient, amount)
+        except FileNotFoundError as e:
+            return False, f"Account not found: {e.filename}"
+        except (OSError, ValueError) as e:
+            return False, str(e)
+
+    def recover(self):
+        """Complete transfers whose commit was interrupted by a crash."""
+        recovered = get_storage().recover(self.locked)
+        if self.repository is not None:
+            for account_numbers in recovered:
+                for account_number in account_numbers:
+                    self.repository.discard(account_number)
+        return len(recovered)
+
+    def _refresh(self, account):
+        # Another process may have moved money since this copy was loaded.
+        account.refresh()
+
+    def _commit(self, txid, sides):
+        try:
+            get_storage().commit(
+                [(account.header_details(), [t]) for account, t in sides],
+                txid,
+                publish=True,
+            )
+        except Exception:
+            self._rollback(sides)
+            raise
+        for account, _ in sides:
+            account.mark_saved()
+
+    def _rollback(self, sides):
+        (sender, debit), (recipient, credit) = sides
+        sender.balance += debit["amount"]
+        recipient.balance -= credit["amount"]
+        sender.record_outgoing(-debit["amount"])
+        for account, transaction in sides:
+            account.discard_transaction(transaction)
+
+
+def _stress_worker(args):
+    directory, account_numbers, transfers, workers, seed = args
+    os.chdir(directory)
+    from project import UserActions
+    from account_cache import AccountRepository
+
+    engine = TransferEngine(AccountRepository(UserActions.load), max_workers=workers)
+    rng = random.Random(seed)
+    plan = []
+    for _ in range(transfers):
+        sender, recipient = rng.sample(account_numbers, 2)
+        plan.append((sender, recipient, rng.choice([1, 5, 10, 50, 250])))
+    results = engine.run(plan)
+    return sum(1 for ok, _ in results if ok)
+
+
+def stress(accounts=20, transfers=2000, workers=16, processes=2, balance=1000):
+    """
+    Run random transfers between a small set of accounts from several
+    processes and threads at once, then check that the total balance on disk
+    is unchanged. Returns True when money was conserved.
+    """
+    from multiprocessing import Pool
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        try:
+            from project import UserActions
+
+            account_numbers = [str(1000 + i) for i in range(accounts)]
+            for account_number in account_numbers:
+                account = UserActions()
+                account.owner_id = account_number
+                account.name = "stress"
+                account.age = 30
+                account.salary = 0.0
+                account.account_number = account_number
+                account.pin = "0000"
+                account.balance = balance
+                account.save_to_file(rewrite_journal=True)
+            expected = balance * accounts
+
+            start = time.perf_counter()
+            jobs = [
+                (directory, account_numbers, transfers, workers, seed)
+                for seed in range(processes)
+            ]
+            with Pool(processes) as pool:
+                committed = sum(pool.map(_stress_worker, jobs))
+            elapsed = time.perf_counter() - start
+
+            total = sum(UserActions.load(n).balance for n in account_numbers)
+            ledger_ok = all(
+                UserActions.load(n).balance
+                == balance
+                + sum(
+                    t["amount"] if t["type"] == "Transfer Received" else -t["amount"]
+                    for t in UserActions.load(n).transaction_history
+                )
+                for n in account_numbers
+            )
+        finally:
+            os.chdir(cwd)
+
+    print(
+        f"{committed} of {transfers * processes} transfers committed in "
+        f"{elapsed:.2f}s ({committed / elapsed:.0f}/s)."
+    )
+    print(f"Expected total: {expected}, total on disk: {total}")
+    print(f"Journals match balances: {ledger_ok}")
+    return total == expected and ledger_ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Transfer engine tools.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    stress_parser = subparsers.add_parser("stress", help=stress.__doc__)
+    stress_parser.add_argument("--accounts", type=int, default=20)
+    stress_parser.add_argument("--transfers", type=int, default=2000)
+    stress_parser.add_argument("--workers", type=int, default=16)
+    stress_parser.add_argument("--processes", type=int, default=2)
+    subparsers.add_parser("recover", help="Finish interrupted transfers.")
+    args = parser.parse_args()
+    if args.command == "stress":
+        ok = stress(args.accounts, args.transfers, args.workers, args.processes)
+        raise SystemExit(0 if ok else 1)
+    print(f"Recovered {TransferEngine().recover()} pending commit(s).")
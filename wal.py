@@ -0,0 +1,353 @@
+"""
+Write-ahead log with group commit for the file backend.
+
+Account headers and journals are written without fsync, so on their own a
+power failure can lose or roll back recent operations. With the log enabled
+FileStorage first appends every change (the new header plus the transactions
+it adds, for every account of the operation) to the log, then writes the
+account files as before. A header remembers the log sequence number
+(``wal_lsn``) of the last change written to it; replay() re-applies every
+logged change that is newer than its account's header.
+
+``BANK_DURABILITY`` picks the trade-off between latency and durability:
+
+- ``off`` (default): no log; account files are written as before.
+- ``sync``: an operation returns once its change is fsynced. Operations that
+  arrive while an fsync is running wait for it and then share the next one
+  (group commit), so throughput grows with concurrency. ``BANK_WAL_GROUP_MS``
+  makes the thread doing an fsync wait that long first, for bigger groups.
+- ``interval``: operations return once their change is in the log buffer; a
+  background thread writes and fsyncs the buffer every ``BANK_WAL_INTERVAL_MS``
+  (default 10), so a crash loses at most that window.
+
+Each process writes its own segments (``<data root>/wal/<pid>-<start>-<n>.log``)
+and keeps them locked. A full segment (``BANK_WAL_SEGMENT_BYTES``, default
+64 MiB) is retired once every change in it has been written to the account
+files and its transactions published to the change feed: those files are
+fsynced and the segment is deleted. Segments nobody
+holds a lock on were left by a process that died; replay() applies them at
+startup.
+
+Each line is ``<crc32 in hex> <json>``; a torn or corrupt line ends a segment.
+"""
+
+import atexit
+import json
+import os
+import threading
+import time
+import zlib
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not on POSIX
+    fcntl = None
+
+from account_format import encode_transaction
+from paths import resolver
+
+MODES = ["off", "sync", "interval"]
+
+
+def fsync_path(path):
+    """fsync a file or directory by name; missing paths are ignored."""
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except FileNotFoundError:
+        return
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def fsync_paths(paths):
+    """fsync files, then the directories holding them (for renames)."""
+    directories = set()
+    for path in paths:
+        fsync_path(path)
+        directories.add(os.path.dirname(path) or ".")
+    for directory in directories:
+        fsync_path(directory)
+
+
+def encode_record(lsn, changes, feed=None):
+    record = {
+        "lsn": lsn,
+        "changes": [
+            {"header": details, "transactions": transactions, **flags}
+            for details, transactions, flags in changes
+        ],
+    }
+    if feed is not None:
+        record["feed"] = feed
+    body = json.dumps(
+        record, separators=(",", ":"), default=encode_transaction
+    ).encode()
+    return b"%08x %s\n" % (zlib.crc32(body), body)
+
+
+def read_records(path):
+    """Yield the records of one segment, up to the first torn or corrupt line."""
+    with open(path, "rb") as f:
+        for line in f:
+            if not line.endswith(b"\n"):
+                return
+            checksum, _, body = line[:-1].partition(b" ")
+            try:
+                if int(checksum, 16) != zlib.crc32(body):
+                    return
+            except ValueError:
+                return
+            yield json.loads(body)
+
+
+def _try_lock(fd):
+    if fcntl is None:
+        return True
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        return False
+    return True
+
+
+class _Segment:
+    def __init__(self, path):
+        self.path = path
+        self.fd = os.open(
+            path, os.O_WRONLY | os.O_CREAT | os.O_EXCL | os.O_APPEND, 0o644
+        )
+        _try_lock(self.fd)
+        self.size = 0
+        # Changes logged but not yet written to the account files.
+        self.pending = 0
+        self.last_lsn = 0
+        self.touched = set()
+        self.sealed = False
+
+
+class WriteAheadLog:
+    def __init__(
+        self,
+        mode="sync",
+        interval=0.01,
+        group_delay=0.0,
+        segment_bytes=64 * 2**20,
+        directory=None,
+    ):
+        if mode not in ("sync", "interval"):
+            raise ValueError(f"Unknown durability mode '{mode}'.")
+        self.mode = mode
+        self.interval = interval
+        self.group_delay = group_delay
+        self.segment_bytes = segment_bytes
+        self._directory = directory
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._pid = None
+        # fsyncs of log segments so far, for comparing against operations.
+        self.fsyncs = 0
+        atexit.register(self.close)
+
+    @property
+    def directory(self):
+        return self._directory or resolver.wal_dir()
+
+    def _reset(self):
+        # A forked child writes its own segments; the parent's stay its own.
+        self._pid = os.getpid()
+        self._started = time.time_ns()
+        self._segment = None
+        self._sealed = []
+        self._buffer = []
+        self._sequence = 0
+        self._last_lsn = 0
+        self._durable_lsn = 0
+        self._stop = threading.Event()
+        if self.mode == "interval":
+            threading.Thread(
+                target=self._run, args=(self._stop,), name="wal-flush", daemon=True
+            ).start()
+
+    def _run(self, stop):
+        while not stop.wait(self.interval):
+            with self._flush_lock:
+                self._flush()
+
+    def _next_lsn(self):
+        # Time-based, so changes from different processes to the same account
+        # (serialized by its lock) keep increasing.
+        self._last_lsn = max(self._last_lsn + 1, time.time_ns())
+        return self._last_lsn
+
+    def stamp(self):
+        """A sequence number newer than every change logged so far."""
+        with self._lock:
+            if self._pid != os.getpid():
+                self._reset()
+            return self._next_lsn()
+
+    def log(self, changes, feed=None):
+        """
+        Log (details, transactions, flags) triples as one record, with the
+        change feed position its transactions are due after (see
+        FileStorage). Returns a ticket for done(); in sync mode the record is
+        on disk by then.
+        """
+        with self._lock:
+            if self._pid != os.getpid():
+                self._reset()
+            segment = self._segment
+            if segment is None or segment.size >= self.segment_bytes:
+                if segment is not None:
+                    segment.sealed = True
+                    self._sealed.append(segment)
+                os.makedirs(self.directory, exist_ok=True)
+                self._sequence += 1
+                segment = self._segment = _Segment(
+                    os.path.join(
+                        self.directory,
+                        f"{self._pid}-{self._started}-{self._sequence:06d}.log",
+                    )
+                )
+            lsn = self._next_lsn()
+            data = encode_record(lsn, changes, feed)
+            segment.size += len(data)
+            segment.pending += 1
+            segment.last_lsn = lsn
+            self._buffer.append((segment, data))
+        if self.mode == "sync":
+            self.sync(lsn)
+        return segment, lsn
+
+    def sync(self, lsn):
+        """Wait until ``lsn`` is on disk, fsyncing with whoever else is waiting."""
+        while self._durable_lsn < lsn:
+            with self._flush_lock:
+                if self._durable_lsn >= lsn:
+                    break
+                if self.group_delay:
+                    time.sleep(self.group_delay)
+                self._flush()
+
+    def _flush(self):
+        # Called with _flush_lock held.
+        with self._lock:
+            buffer, self._buffer = self._buffer, []
+            lsn = self._last_lsn
+        segments = []
+        for segment, data in buffer:
+            if not segments or segments[-1][0] is not segment:
+                segments.append((segment, []))
+            segments[-1][1].append(data)
+        for segment, chunks in segments:
+            os.write(segment.fd, b"".join(chunks))
+            os.fsync(segment.fd)
+            self.fsyncs += 1
+        with self._lock:
+            self._durable_lsn = max(self._durable_lsn, lsn)
+            retired = self._take_retired()
+        self._retire(retired)
+
+    def _take_retired(self):
+        # Called with _lock held.
+        retired = [
+            s
+            for s in self._sealed
+            if s.pending == 0 and s.last_lsn <= self._durable_lsn
+        ]
+        for segment in retired:
+            self._sealed.remove(segment)
+        return retired
+
+    def _retire(self, segments):
+        for segment in segments:
+            fsync_paths(segment.touched)
+            os.remove(segment.path)
+            os.close(segment.fd)
+
+    def done(self, ticket, paths):
+        """The change is in the account files at ``paths`` (not yet fsynced)."""
+        segment, _ = ticket
+        with self._lock:
+            segment.touched.update(paths)
+            segment.pending -= 1
+            retired = self._take_retired() if segment.sealed else []
+        self._retire(retired)
+
+    def close(self):
+        """Flush, then retire every segment whose changes are all applied."""
+        if self._pid != os.getpid():
+            return
+        self._stop.set()
+        with self._flush_lock:
+            with self._lock:
+                if self._segment is not None:
+                    self._segment.sealed = True
+                    self._sealed.append(self._segment)
+                    self._segment = None
+            self._flush()
+            with self._lock:
+                if not self._sealed:
+                    # Start over (and restart the flush thread) if used again.
+                    self._pid = None
+
+
+def from_env():
+    """The log configured by BANK_DURABILITY and friends, or None when off."""
+    mode = os.environ.get("BANK_DURABILITY", "off")
+    if mode not in MODES:
+        raise ValueError(f"Unknown durability mode '{mode}'.")
+    if mode == "off":
+        return None
+    return WriteAheadLog(
+        mode,
+        interval=int(os.environ.get("BANK_WAL_INTERVAL_MS", 10)) / 1000,
+        group_delay=int(os.environ.get("BANK_WAL_GROUP_MS", 0)) / 1000,
+        segment_bytes=int(os.environ.get("BANK_WAL_SEGMENT_BYTES", 64 * 2**20)),
+    )
+
+
+def replay(apply, locked=None, directory=None):
+    """
+    Apply the segments of processes that died, oldest change first.
+    ``apply(record)`` re-applies the record's changes its accounts do not
+    have yet and returns (the accounts' files, whether it changed any).
+    Returns one list of account numbers per re-applied record.
+    """
+    directory = directory or resolver.wal_dir()
+    if not os.path.isdir(directory):
+        return []
+    segments = []
+    records = []
+    for name in sorted(os.listdir(directory)):
+        if not name.endswith(".log"):
+            continue
+        path = os.path.join(directory, name)
+        fd = os.open(path, os.O_RDONLY)
+        if not _try_lock(fd):
+            # Still being written by a live process.
+            os.close(fd)
+            continue
+        segments.append((path, fd))
+        records.extend(read_records(path))
+    records.sort(key=lambda record: record["lsn"])
+    touched = set()
+    recovered = []
+    for record in records:
+        account_numbers = [c["header"]["account_number"] for c in record["changes"]]
+        if locked is not None:
+            with locked(*account_numbers):
+                paths, changed = apply(record)
+        else:
+            paths, changed = apply(record)
+        # Applied or not, the files may only be in the page cache.
+        touched.update(paths)
+        if changed:
+            recovered.append(account_numbers)
+    fsync_paths(touched)
+    for path, fd in segments:
+        os.remove(path)
+        os.close(fd)
+    return recovered